@@ -0,0 +1,159 @@
+"""Local fake of the GitHub API and release assets, serving synthetic
+repositories from a background thread.
+"""
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import calendar
+import hashlib
+import json
+from SocketServer import ThreadingMixIn
+import threading
+import time
+from urlparse import parse_qs, urlparse
+
+ASSET_NAME = 'tool-linux'
+EPOCH = calendar.timegm((2015, 1, 1, 0, 0, 0))
+DAY = 24 * 3600
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_HEAD(self):
+        self.dispatch(head=True)
+
+    def dispatch(self, head=False):
+        hub = self.server.hub
+        hub.count_request()
+        if hub.latency:
+            time.sleep(hub.latency)
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        if len(parts) == 4 and parts[0] == 'repos' and \
+                parts[3] == 'releases':
+            self.serve_releases('/'.join(parts[1:3]), parse_qs(url.query),
+                                head)
+        elif len(parts) == 7 and parts[0] == 'download':
+            self.serve_asset('/'.join(parts[1:3]), parts[6], head)
+        else:
+            self.reply(404, 'text/plain', 'not found', head)
+
+    def reply(self, status, content_type, body, head, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def serve_releases(self, repository, query, head):
+        hub = self.server.hub
+        if repository not in hub.repositories:
+            return self.reply(404, 'application/json', '{}', head)
+        per_page = int(query.get('per_page', ['30'])[0])
+        page = int(query.get('page', ['1'])[0])
+        releases = hub.releases(repository)
+        body = json.dumps(releases[(page - 1) * per_page:][:per_page])
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.reply(200, 'application/json', body, head, {'ETag': etag})
+
+    def serve_asset(self, repository, name, head):
+        hub = self.server.hub
+        if repository not in hub.repositories or name != ASSET_NAME:
+            return self.reply(404, 'text/plain', 'not found', head)
+        self.reply(200, 'application/octet-stream', hub.asset_content, head)
+
+
+class FakeGitHub(object):
+    """Serve `repos` repositories of `releases` releases each, every
+    release providing one asset of `asset_size` bytes. Every request is
+    delayed by `latency` seconds.
+    """
+    def __init__(self, repos=10, releases=10, asset_size=1024, latency=0):
+        self.repositories = [
+            'bench/tool{:04d}'.format(i) for i in range(repos)
+        ]
+        self.release_count = releases
+        self.asset_size = asset_size
+        self.asset_content = (
+            '#!/bin/sh\n' + '#' * asset_size
+        )[:asset_size]
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._releases = {}
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.hub = self
+        self.thread = threading.Thread(
+            target=self.server.serve_forever,
+            kwargs=dict(poll_interval=0.05)
+        )
+        self.thread.daemon = True
+
+    @property
+    def root(self):
+        return 'http://{}:{}'.format(*self.server.server_address)
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def releases(self, repository):
+        """:return: REST representation of the releases, newest first"""
+        releases = self._releases.get(repository)
+        if releases is None:
+            repo_index = self.repositories.index(repository)
+            releases = []
+            for i in reversed(range(self.release_count)):
+                tag = '1.{}.0'.format(i)
+                published = time.gmtime(EPOCH + i * DAY)
+                releases.append({
+                    'id': repo_index * self.release_count + i + 1,
+                    'name': tag,
+                    'tag_name': tag,
+                    'prerelease': False,
+                    'draft': False,
+                    'published_at': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                                  published),
+                    'assets': [{
+                        'id': repo_index * self.release_count + i + 1,
+                        'name': ASSET_NAME,
+                        'size': self.asset_size,
+                        'content_type': 'application/octet-stream',
+                        'browser_download_url': '{}/download/{}/releases/'
+                        'download/{}/{}'.format(
+                            self.root, repository, tag, ASSET_NAME
+                        ),
+                    }],
+                })
+            self._releases[repository] = releases
+        return releases
+
+    def latest_version(self):
+        return '1.{}.0'.format(self.release_count - 1)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
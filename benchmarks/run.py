@@ -0,0 +1,334 @@
+"""Benchmarks of easy_upgrade against a local fake GitHub server.
+
+    python benchmarks/run.py -o results.json
+    python benchmarks/run.py --scale large --latency 0.05 --compare \
+        results.json
+
+Results are written in JSON, with the duration of every repetition.
+With --compare, median durations are compared to previous results and
+the exit status is non-zero if a scenario is slower than --threshold.
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import os.path as osp
+import platform
+import subprocess
+import sys
+import time
+
+import yaml
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+
+from easy_upgrade import __version__  # noqa
+from easy_upgrade.api import EasyUpgrade  # noqa
+from easy_upgrade.toolbox import find_executable, temp_dir  # noqa
+
+from fakehub import FakeGitHub  # noqa
+
+KiB = 1024
+MiB = 1024 * KiB
+
+SCALES = {
+    'small': dict(repos=5, releases=10, asset_size=64 * KiB, files=50),
+    'medium': dict(repos=50, releases=100, asset_size=MiB, files=500),
+    'large': dict(repos=100, releases=250, asset_size=4 * MiB, files=5000),
+}
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+class Benchmark(object):
+    """Scenarios of one scale, run in `workdir`"""
+    def __init__(self, hub, workdir, scale, jobs=4):
+        self.hub = hub
+        self.workdir = workdir
+        self.scale = scale
+        self.jobs = jobs
+        self.runs = 0
+
+    def path(self, *paths):
+        return osp.join(self.workdir, *paths)
+
+    def fresh_dir(self, name):
+        """:return: directory not used by previous repetitions"""
+        self.runs += 1
+        path = self.path('{}-{}'.format(name, self.runs))
+        os.makedirs(path)
+        return path
+
+    def config(self, cache_dir, target_dir, engine='native'):
+        releases = {}
+        for repository in self.hub.repositories:
+            releases[repository] = {
+                'fetch': {'asset': {
+                    'file': 'bin/' + repository.split('/')[1],
+                }},
+                'install': {'stow': {'path': target_dir, 'engine': engine}},
+            }
+        return {
+            'cache-dir': cache_dir,
+            'jobs': self.jobs,
+            'github': {
+                'api-root': self.hub.root,
+                'releases': releases,
+            },
+        }
+
+    def list_packages(self, config):
+        with EasyUpgrade(copy.deepcopy(config)) as eu:
+            outdated = list(eu.get_outdated_packages())
+        assert len(outdated) == len(self.hub.repositories)
+
+    def setup_list_cold(self):
+        return self.list_packages, (
+            self.config(self.fresh_dir('cache'), self.fresh_dir('target')),
+        )
+
+    def setup_list_warm(self):
+        config = self.config(self.path('warm-cache'), self.path('target'))
+        if not osp.isdir(self.path('warm-cache')):
+            self.list_packages(config)
+        return self.list_packages, (config,)
+
+    def install(self, config):
+        with EasyUpgrade(copy.deepcopy(config)) as eu:
+            results = eu.install()
+        failures = [str(r) for r in results if not r.installed]
+        assert not failures, failures
+
+    def setup_install(self):
+        return self.install, (
+            self.config(self.fresh_dir('cache'), self.fresh_dir('target')),
+        )
+
+    def stow_installer(self, engine):
+        target_dir = self.path('activate-' + engine)
+        config = self.config(None, target_dir, engine)
+        repository = self.hub.repositories[0]
+        config['github']['releases'] = {
+            repository: config['github']['releases'][repository]
+        }
+        installer = EasyUpgrade(config).providers['github'] \
+            .releases[repository].installer
+        if not osp.isdir(target_dir):
+            for version in ['1.0', '1.1']:
+                path = osp.join(installer.pkg_path,
+                                installer.release_dir_name(version))
+                for i in range(self.scale['files']):
+                    f = osp.join(path, 'share', 'dir{:03d}'.format(i // 50),
+                                 'file{:05d}'.format(i))
+                    if not osp.isdir(osp.dirname(f)):
+                        os.makedirs(osp.dirname(f))
+                    with open(f, 'w') as ostr:
+                        ostr.write(version)
+                installer.manifest.add_version(version, path)
+            installer.activate_version('1.0')
+        return installer
+
+    def setup_activate(self, engine='native'):
+        installer = self.stow_installer(engine)
+        version = '1.1' if installer.manifest.active == '1.0' else '1.0'
+        return installer.activate_version, (version,)
+
+    def setup_activate_stow(self):
+        return self.setup_activate('stow')
+
+    def cli(self, *args):
+        env = dict(os.environ, HOME=self.path('home'))
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(
+                [
+                    sys.executable, '-c',
+                    'import sys; from easy_upgrade.cli import run; '
+                    'run(sys.argv[1:])',
+                ] + list(args),
+                env=env,
+                stdout=devnull,
+                stderr=devnull,
+                cwd=osp.dirname(osp.dirname(osp.abspath(__file__))),
+            )
+
+    def setup_cli_startup(self):
+        return self.cli, ('--version',)
+
+    def setup_cli_list(self):
+        config_path = self.path('cli-config.yml')
+        if not osp.exists(config_path):
+            with open(config_path, 'w') as ostr:
+                yaml.safe_dump(
+                    self.config(self.path('cli-cache'), self.path('target')),
+                    ostr
+                )
+        return self.cli, ('-c', config_path, 'list')
+
+
+SCENARIOS = [
+    ('list-cold', 'setup_list_cold'),
+    ('list-warm', 'setup_list_warm'),
+    ('install', 'setup_install'),
+    ('activate-native', 'setup_activate'),
+    ('activate-stow', 'setup_activate_stow'),
+    ('cli-startup', 'setup_cli_startup'),
+    ('cli-list', 'setup_cli_list'),
+]
+
+
+def run_scenario(benchmark, name, setup, repeat):
+    times = []
+    requests = []
+    for _ in range(repeat):
+        func, args = getattr(benchmark, setup)()
+        hub_requests = benchmark.hub.requests
+        start = time.time()
+        func(*args)
+        times.append(time.time() - start)
+        requests.append(benchmark.hub.requests - hub_requests)
+    return dict(
+        name=name,
+        times=times,
+        min=min(times),
+        median=median(times),
+        requests=median(requests),
+    )
+
+
+def run(scales, scenarios, repeat=3, latency=0, jobs=4):
+    results = []
+    for scale in scales:
+        params = SCALES[scale]
+        hub = FakeGitHub(
+            repos=params['repos'],
+            releases=params['releases'],
+            asset_size=params['asset_size'],
+            latency=latency,
+        )
+        with hub, temp_dir() as workdir:
+            benchmark = Benchmark(hub, workdir, params, jobs)
+            for name, setup in SCENARIOS:
+                if scenarios and name not in scenarios:
+                    continue
+                if name == 'activate-stow':
+                    try:
+                        find_executable('stow', 'xstow')
+                    except Exception:
+                        logging.warning("%s: GNU stow not found, skipped",
+                                        name)
+                        continue
+                result = run_scenario(benchmark, name, setup, repeat)
+                result.update(scale=scale, params=params)
+                print '{:<8} {:<16} median {:8.3f}s  min {:8.3f}s  ' \
+                    '{:5.0f} request(s)'.format(
+                        scale, name, result['median'], result['min'],
+                        result['requests']
+                    )
+                results.append(result)
+    return dict(
+        version='.'.join(map(str, __version__)),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        date=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        latency=latency,
+        jobs=jobs,
+        repeat=repeat,
+        results=results,
+    )
+
+
+def compare(report, previous, threshold):
+    """Print the evolution of median durations
+
+    :return: number of scenarios slower than `threshold` ratio
+    """
+    before = dict(
+        ((r['scale'], r['name']), r) for r in previous['results']
+    )
+    regressions = 0
+    print 'compared to {} ({}):'.format(previous['version'], previous['date'])
+    for result in report['results']:
+        old = before.get((result['scale'], result['name']))
+        if old is None or old['params'] != result['params']:
+            continue
+        ratio = result['median'] / old['median'] if old['median'] else 1
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print '{:<8} {:<16} {:8.3f}s -> {:8.3f}s  x{:.2f}{}'.format(
+            result['scale'], result['name'], old['median'],
+            result['median'], ratio, flag
+        )
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark easy_upgrade against a fake GitHub server'
+    )
+    parser.add_argument(
+        '-s', '--scale',
+        action='append',
+        choices=sorted(SCALES),
+        help='Scale to run, may be repeated. Default is small and medium'
+    )
+    parser.add_argument(
+        'scenario',
+        nargs='*',
+        help='Subset of scenarios: {}'.format(
+            ', '.join(name for name, _ in SCENARIOS)
+        )
+    )
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-j', '--jobs', type=int, default=4)
+    parser.add_argument(
+        '-l', '--latency',
+        type=float,
+        default=0,
+        help='Delay of every request to the fake server, in seconds'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        metavar='<file>',
+        help='Write results in this JSON file'
+    )
+    parser.add_argument(
+        '--compare',
+        metavar='<file>',
+        help='Compare to results of a previous run'
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.1,
+        help='Slowdown ratio reported as a regression. Default is 0.1'
+    )
+    args = parser.parse_args(args)
+    logging.basicConfig(level=logging.WARNING)
+    report = run(
+        args.scale or ['small', 'medium'],
+        args.scenario,
+        repeat=args.repeat,
+        latency=args.latency,
+        jobs=args.jobs,
+    )
+    if args.output:
+        with open(args.output, 'w') as ostr:
+            json.dump(report, ostr, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as istr:
+            if compare(report, json.load(istr), args.threshold):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
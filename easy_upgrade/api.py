@@ -1,22 +1,73 @@
+import collections
 import inspect
 import logging
-import operator
+from multiprocessing.pool import ThreadPool
+import os.path as osp
+import shutil
+import tempfile
+import threading
+import time
+# imported by datetime.strptime on first call, which is not thread-safe
+# when releases are resolved by the thread pool
+import _strptime  # noqa
+
+from .config import load as load_config
+from .metrics import Metrics
+from .pipeline import Pipeline
+from .plugins import PluginRegistry
+from . import trace
+from .version import get_scheme
+
+DEFAULT_CACHE_DIR = osp.expanduser('~/.cache/easy_upgrade')
 
-import pkg_resources
 
-from .toolbox import temp_dir
+def parse_version(version):
+    return get_scheme().key(version)
 
 
-def parse_version(version):
-    if version is None:
-        return version
-    version = version.lstrip('v')
-    return pkg_resources.parse_version(version)
+def parse_release(release):
+    """:return: tuple (provider, release) of a 'provider:release' string"""
+    try:
+        provider, release = release.split(':', 1)
+    except ValueError:
+        raise Exception(
+            "Invalid syntax for release: {}".format(release) +
+            ". Expecting provider/release"
+        )
+    return provider, release
+
+
+class Settings(object):
+    """Dictionary-like access to a configuration section"""
+    __slots__ = ('config',)
+
+    def __init__(self, config):
+        self.config = dict(config)
+
+    def __getitem__(self, key):
+        return self.config[key]
 
+    def __setitem__(self, key, value):
+        self.config[key] = value
 
-class Action(dict):
+    def __contains__(self, key):
+        return key in self.config
+
+    def __iter__(self):
+        return iter(self.config)
+
+    def __len__(self):
+        return len(self.config)
+
+    def get(self, key, default=None):
+        return self.config.get(key, default)
+
+
+class Action(Settings):
+    __slots__ = ('provider', 'release')
     actions = {}
     bases = ['Fetcher', 'Installer', 'PostInstaller']
+    plugins = None
 
     def __init__(self, provider, release, config):
         super(Action, self).__init__(config)
@@ -88,8 +139,12 @@ class Action(dict):
         if isinstance(provider, ReleaseProvider):
             provider = provider.name
         base = base.__name__ if inspect.isclass(base) else base
-        actions = cls.actions.get(base, {})
-        providers, action = actions.get(name, (None, None))
+        providers, action = cls.actions.get(base, {}).get(name, (None, None))
+        if action is None and cls.plugins is not None:
+            if cls.plugins.load_action(base, name):
+                providers, action = cls.actions.get(base, {}).get(
+                    name, (None, None)
+                )
         if action is None:
             raise Exception("Unknown {} action {}".format(base, name))
         if providers is None:
@@ -119,6 +174,8 @@ class Action(dict):
 
 
 class Fetcher(Action):
+    __slots__ = ()
+
     def candidate_version(self):
         """returns the version the fetcher would like to install"""
     def fetch(self, output_directory):
@@ -126,55 +183,125 @@ class Fetcher(Action):
 
 
 class Installer(Action):
+    __slots__ = ()
+
     def installed_version(self):
         raise NotImplementedError()
 
+    def staging_dir(self):
+        """
+        :return: directory where releases are fetched before being
+        installed, `None` to use the system temporary directory.
+        """
+        return None
+
     def install(self, fetched_items_path, version):
+        """
+        :return: location of the installed items if the fetched ones
+        have been moved, `None` otherwise.
+        """
+        raise NotImplementedError
+
+    def rollback(self):
+        """Reactivate the version installed before the active one
+
+        :return: reactivated version
+        """
         raise NotImplementedError
 
 
 class PostInstaller(Action):
+    __slots__ = ()
+
     def execute(self, fetched_items_path, version):
         raise NotImplementedError
 
 
-class Release(dict):
+class Release(Settings):
+    """Release of a provider. Actions are instantiated on first access.
+
+    When `offline` is set, the candidate version is resolved from what
+    the provider knows locally, if it can, instead of querying it.
+    """
+    __slots__ = (
+        'provider', 'name', 'version_scheme', 'logger', 'offline',
+        '_fetcher', '_installer', '_post_installers',
+    )
+
     def __init__(self, provider, name, config):
         super(Release, self).__init__(config)
         self.provider = provider
         self.name = name
-        self.fetcher = self.__extract_action('fetch', Fetcher)
-        self.installer = self.__extract_action('install', Installer)
-        self.post_installers = self.__extract_action(
-            'post-install', PostInstaller, unique=False, default=[]
+        self.version_scheme = get_scheme(
+            self.get('version-scheme', 'loose'),
+            regex=self.get('version-regex'),
         )
+        self._fetcher = None
+        self._installer = None
+        self._post_installers = None
+        self.offline = False
         self.logger = logging.getLogger('{}:{}'.format(
             self.provider.name,
             self.name
         ))
 
+    @property
+    def fetcher(self):
+        if self._fetcher is None:
+            self._fetcher = self.__extract_action('fetch', Fetcher)
+        return self._fetcher
+
+    @property
+    def installer(self):
+        if self._installer is None:
+            self._installer = self.__extract_action('install', Installer)
+        return self._installer
+
+    @property
+    def post_installers(self):
+        if self._post_installers is None:
+            self._post_installers = self.__extract_action(
+                'post-install', PostInstaller, unique=False, default=[]
+            )
+        return self._post_installers
+
     def pkg_name(self):
         return self.name
 
+    def is_due(self):
+        """:return: `False` if there is no need to check for new versions"""
+        return True
+
     def get_versions(self):
-        installed = self.installer.installed_version()
-        candidate = self.fetcher.candidate_version()
+        with trace.span('get_versions', 'release', release=self.name):
+            installed = self.installed_version()
+            candidate = self.candidate_version()
         versions = dict()
         if installed:
             versions['installed'] = {
                 'human': installed,
-                'tuple': parse_version(installed),
+                'tuple': self.version_scheme.key(installed),
             }
         if candidate:
             versions['candidate'] = {
                 'human': candidate,
-                'tuple': parse_version(candidate),
+                'tuple': self.version_scheme.key(candidate),
             }
         return versions
 
+    def installed_version(self):
+        with trace.span('installed_version', 'installer',
+                        action=self.installer.name):
+            return self.installer.installed_version()
+
+    def candidate_version(self):
+        with trace.span('candidate_version', 'fetcher',
+                        action=self.fetcher.name):
+            return self.fetcher.candidate_version()
+
     def __version(self, version):
         if version:
-            version_tuple = parse_version(version)
+            version_tuple = self.version_scheme.key(version)
         else:
             version_tuple = None
         return version, version_tuple
@@ -196,24 +323,84 @@ class Release(dict):
                 return False
         return True
 
-    def install(self):
-        _, version = self.__version(self.installer.installed_version())
-        bidder_str, bidder = self.__version(self.fetcher.candidate_version())
-        if not self.__is_bidder_newer(version, bidder, bidder_str):
-            return False
+    def resolve(self):
+        """
+        :return: version to install, `None` if the installed one is
+        up to date.
+        """
+        with trace.span('resolve', 'release', release=self.name):
+            _, version = self.__version(self.installed_version())
+            bidder_str, bidder = self.__version(self.candidate_version())
+            if not self.__is_bidder_newer(version, bidder, bidder_str):
+                return None
+            trace.annotate(version=bidder_str)
+            return bidder_str
+
+    def fetch(self, version):
+        """
+        :return: temporary directory where `version` has been fetched,
+        to be given to `deploy`
+        """
         self.logger.info("starting installation of version {}".format(
-            bidder_str
+            version
         ))
-        top_config = self.provider.top_config
-        cleanup_temp_dir = top_config.get('cleanup-temp-dir', True)
-        with temp_dir(cleanup=cleanup_temp_dir) as d:
+        staging_dir = self.installer.staging_dir()
+        d = tempfile.mkdtemp(dir=staging_dir)
+        try:
             self.logger.info("fetching release")
-            self.fetcher.fetch(d)
+            with trace.span('fetch', 'fetcher', release=self.name,
+                            action=self.fetcher.name, version=version):
+                self.fetcher.fetch(d)
+        except Exception:
+            self.cleanup(d)
+            raise
+        return d
+
+    def deploy(self, fetched_items_path, version):
+        """install and activate a fetched version"""
+        d = fetched_items_path
+        try:
             self.logger.info("installing release")
-            self.installer.install(d, bidder_str)
+            with trace.span('install', 'installer', release=self.name,
+                            action=self.installer.name, version=version):
+                d = self.installer.install(d, version) or d
             for post_installer in self.post_installers:
-                post_installer.execute(d, bidder_str)
-        return True
+                with trace.span('post_install', 'post_installer',
+                                release=self.name,
+                                action=post_installer.name,
+                                version=version):
+                    post_installer.execute(d, version)
+        finally:
+            self.cleanup(fetched_items_path)
+
+    def cleanup(self, fetched_items_path):
+        top_config = self.provider.top_config
+        # directory may have been moved by the installer
+        if top_config.get('cleanup-temp-dir', True) and \
+                osp.isdir(fetched_items_path):
+            shutil.rmtree(fetched_items_path)
+
+    def install(self):
+        with trace.span('install_release', 'release', release=self.name):
+            version = self.resolve()
+            if version is None:
+                return False
+            self.deploy(self.fetch(version), version)
+            return True
+
+    def reset(self):
+        """Discard actions, and the state they hold, so that the next
+        resolution queries the provider again.
+        """
+        self._fetcher = None
+        self._installer = None
+        self._post_installers = None
+        self.offline = False
+
+    def rollback(self):
+        version = self.installer.rollback()
+        self.logger.info("rolled back to version {}".format(version))
+        return version
 
     def __get_raw_config(self, config_key, default, unique):
         raw_configs = self.get(config_key)
@@ -270,58 +457,174 @@ class Release(dict):
         return actions
 
 
+class Releases(collections.Mapping):
+    """Releases of a provider, instantiated on first access"""
+    def __init__(self, provider, configs):
+        self.provider = provider
+        self.configs = configs
+        self.releases = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self.lock:
+            release = self.releases.get(name)
+            if release is None:
+                release = self.provider.release_cls(
+                    self.provider, name, self.configs[name]
+                )
+                self.releases[name] = release
+            return release
+
+    def __iter__(self):
+        return iter(self.configs)
+
+    def __len__(self):
+        return len(self.configs)
+
+
 class ReleaseProvider(dict):
     def __init__(self, name, top_config, release_cls=Release):
         self.name = name
         self.top_config = top_config
         super(ReleaseProvider, self).__init__(top_config.get(name))
         self.release_cls = release_cls
-        self.releases = {}
-        for name, raw_config in self.get('releases', {}).items():
-            self.releases[name] = release_cls(self, name, raw_config)
+        self.releases = Releases(self, self.get('releases', {}))
+
+    def cache_path(self, *paths):
+        """
+        :return: location of data cached by this provider, `None` if
+        caching is disabled with a null `cache-dir` top-level option.
+        """
+        cache_dir = self.top_config.get('cache-dir', DEFAULT_CACHE_DIR)
+        if cache_dir is None:
+            return None
+        return osp.join(osp.expanduser(cache_dir), self.name, *paths)
+
+    def prefetch(self, releases):
+        """Hook called with the releases about to be resolved, allowing
+        providers to retrieve their metadata in batch.
+        """
+
+    def close(self):
+        """release resources held by the provider at the end of a run"""
+
+    def collect_metrics(self, metrics):
+        """Hook adding provider specific samples to `metrics`"""
 
     def install(self, *releases):
+        """
+        :return: list of `InstallResult`, one per release
+        """
         if not any(releases):
-            return reduce(
-                operator.__and__,
-                map(
-                    lambda r: r.install(),
-                    self.releases.values()
-                )
-            )
+            releases = self.releases.values()
         else:
-            return reduce(
-                operator.__and__,
-                map(
-                    lambda r: r.install(),
-                    [release for name, release in self.releases.items()
-                     if name in releases]
-                )
-            )
+            for name in releases:
+                if name not in self.releases:
+                    raise Exception("Unknown release: {}:{}".format(
+                        self.name, name
+                    ))
+            releases = [self.releases[name] for name in releases]
+        self.prefetch(releases)
+        return Pipeline.from_config(self.top_config).run(releases)
 
 
 class EasyUpgrade(object):
     @classmethod
-    def from_yaml(cls, path):
-        return EasyUpgrade(cls.load_yaml(path))
+    def from_yaml(cls, path, cache_dir=None):
+        return EasyUpgrade(cls.load_yaml(path, cache_dir=cache_dir))
 
     @classmethod
-    def load_yaml(cls, path):
-        from yaml import load
-        with open(path) as istr:
-            return load(istr)
+    def load_yaml(cls, path, cache_dir=None):
+        """
+        :param cache_dir: directory where the parsed configuration is
+        cached, `None` to always parse it.
+        """
+        return load_config(path, cache_dir=cache_dir)
+
+    @property
+    def jobs(self):
+        """maximum number of releases processed concurrently"""
+        return max(1, int(self.config.get('jobs') or 1))
 
-    def get_packages_version(self):
+    @classmethod
+    def get_package_version(cls, release):
+        return {
+            'provider': release.provider.name,
+            'release': release.name,
+            'versions': release.get_versions()
+        }
+
+    def timed_package_version(self, release):
+        start = time.time()
+        pkg = self.get_package_version(release)
+        self.metrics.observe(
+            'release_resolution_duration_seconds', time.time() - start,
+            'Duration of the resolution of installed and candidate versions',
+            provider=release.provider.name, release=release.name
+        )
+        self.metrics.record_packages([pkg])
+        return pkg
+
+    def get_packages_version(self, due_only=False):
+        """
+        :param due_only: resolve releases that do not need to be checked
+        offline
+        """
+        releases = []
         for provider in self.providers.values():
-            for release in provider.releases.values():
-                yield {
-                    'provider': provider.name,
-                    'release': release.name,
-                    'versions': release.get_versions()
-                }
+            provider_releases = provider.releases.values()
+            for release in provider_releases:
+                release.offline = due_only and not release.is_due()
+            offline = [r for r in provider_releases if r.offline]
+            if offline:
+                logging.info("%s: %d release(s) not due for a check",
+                             provider.name, len(offline))
+            provider.prefetch([r for r in provider_releases
+                               if not r.offline])
+            releases += provider_releases
+        jobs = min(self.jobs, len(releases))
+        if jobs <= 1:
+            for release in releases:
+                yield self.timed_package_version(release)
+            return
+        pool = ThreadPool(jobs)
+        try:
+            # imap yields results in submission order, whatever
+            # the order in which releases are resolved.
+            for pkg in pool.imap(self.timed_package_version, releases):
+                yield pkg
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def install(self, *releases):
+        """Install outdated releases of all providers
+
+        :param releases: subset of releases to install, given as
+        (provider, release) tuples.
+        :return: list of `InstallResult`, one per release
+        """
+        for provider, release in releases:
+            if provider not in self.providers or \
+                    release not in self.providers[provider].releases:
+                raise Exception("Unknown release: {}:{}".format(
+                    provider, release
+                ))
+        selection = []
+        for name, provider in self.providers.items():
+            if releases:
+                names = [r for p, r in releases if p == name]
+                provider_releases = [provider.releases[r] for r in names]
+            else:
+                provider_releases = provider.releases.values()
+            provider.prefetch(provider_releases)
+            selection += provider_releases
+        results = Pipeline.from_config(self.config).run(selection)
+        self.metrics.record_results(results)
+        return results
 
     def get_outdated_packages(self):
-        for pkg in self.get_packages_version():
+        for pkg in self.get_packages_version(due_only=True):
             versions = pkg['versions']
             outdated = False
             installed = versions.get('installed')
@@ -334,15 +637,46 @@ class EasyUpgrade(object):
             if outdated:
                 yield pkg
 
+    def write_metrics(self, path=None):
+        """Write metrics in Prometheus text format
+
+        :param path: destination file, defaults to the `metrics-file`
+        top-level option. Nothing is written if there is none.
+        """
+        path = path or self.config.get('metrics-file')
+        if not path:
+            return
+        for provider in self.providers.values():
+            provider.collect_metrics(self.metrics)
+        self.metrics.set(
+            'last_update_timestamp_seconds', time.time(),
+            'Time the metrics were written'
+        )
+        self.metrics.write(osp.expanduser(path))
+
+    def close(self):
+        try:
+            self.write_metrics()
+        except Exception:
+            logging.exception("could not write metrics")
+        for provider in self.providers.values():
+            provider.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def __init__(self, config):
         self.config = config
         self.providers = {}
-        _actions = 'easy_upgrade.actions'
-        _providers = 'easy_upgrade.providers'
-        for entrypoint in pkg_resources.iter_entry_points(group=_actions):
-            entrypoint.load()
-        for entrypoint in pkg_resources.iter_entry_points(group=_providers):
-            provider = entrypoint.load()
-            name = entrypoint.name
+        self.metrics = Metrics()
+        cache_dir = config.get('cache-dir', DEFAULT_CACHE_DIR)
+        if cache_dir is not None:
+            cache_dir = osp.expanduser(cache_dir)
+        Action.plugins = PluginRegistry.load(cache_dir)
+        for name in Action.plugins.providers:
             if name in config:
+                provider = Action.plugins.load_provider(name)
                 self.providers[name] = provider(name, config)
@@ -0,0 +1,253 @@
+import cPickle as pickle
+import hashlib
+import json
+import logging
+import os
+import os.path as osp
+import tempfile
+import threading
+import time
+
+from .toolbox import clone_file, file_sha256, makedirs
+
+
+def atomic_write(path, data):
+    """Write `data` in `path` so that readers never see a partial file"""
+    dir_path = osp.dirname(path)
+    makedirs(dir_path)
+    fd, temp_path = tempfile.mkstemp(dir=dir_path, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as ostr:
+            ostr.write(data)
+        os.rename(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+class HttpCache(object):
+    """Persist validators and decoded payload of JSON HTTP resources.
+
+    Entries are revalidated with conditional requests, so an unchanged
+    resource costs a `304 Not Modified` answer and is served from disk
+    without being decoded again.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def entry_path(self, url):
+        return osp.join(self.path, hashlib.sha1(url).hexdigest())
+
+    def get(self, url):
+        try:
+            with open(self.entry_path(url), 'rb') as istr:
+                return pickle.load(istr)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, url, etag, last_modified, payload):
+        atomic_write(
+            self.entry_path(url),
+            pickle.dumps(
+                {
+                    'url': url,
+                    'etag': etag,
+                    'last-modified': last_modified,
+                    'payload': payload,
+                },
+                pickle.HIGHEST_PROTOCOL
+            )
+        )
+
+    def get_json(self, session, url, **kwargs):
+        """Perform a conditional GET request of `url`
+
+        :param session: object providing a `requests` like `get` method
+        :return: decoded JSON payload
+        """
+        entry = self.get(url)
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last-modified']:
+                headers['If-Modified-Since'] = entry['last-modified']
+        response = session.get(url, headers=headers, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            with self.lock:
+                self.hits += 1
+            return entry['payload']
+        with self.lock:
+            self.misses += 1
+        response.raise_for_status()
+        payload = response.json()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            self.put(url, etag, last_modified, payload)
+        return payload
+
+
+class ArtifactCache(object):
+    """Content-addressed store of downloaded artifacts.
+
+    Files are stored once per SHA-256 digest in the `objects` directory,
+    and looked up with a key derived from the artifact identity. When the
+    total size exceeds `max_size` bytes, least recently used objects are
+    evicted. Files are stored with reflinks when the filesystem allows it,
+    copies otherwise, and served with hardlinks when possible. Objects
+    whose size or modification time changed since they were stored, e.g.
+    through a hardlink, are checked against their digest before being
+    served.
+    """
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.index_path = osp.join(path, 'index.json')
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def key(cls, *identity):
+        return hashlib.sha1(json.dumps(identity)).hexdigest()
+
+    def object_path(self, digest):
+        return osp.join(self.path, 'objects', digest[:2], digest)
+
+    def load_index(self):
+        try:
+            with open(self.index_path) as istr:
+                return json.load(istr)
+        except (IOError, ValueError):
+            return {'keys': {}, 'objects': {}}
+
+    def save_index(self, index):
+        atomic_write(self.index_path, json.dumps(index))
+
+    def get(self, key, path):
+        """Provide the artifact identified by `key` in `path`
+
+        :return: metadata given when the artifact was stored,
+        `None` if the artifact is not in the cache.
+        """
+        found = self.lookup(key)
+        if found is None:
+            return None
+        object_path, metadata = found
+        clone_file(object_path, path)
+        return metadata
+
+    def lookup(self, key):
+        """
+        :return: tuple (path of the stored file, metadata) of the artifact
+        identified by `key`, `None` if it is not in the cache. The file
+        may be evicted afterward, it must be opened right away.
+        """
+        with self.lock:
+            index = self.load_index()
+            digest = index['keys'].get(key)
+            entry = index['objects'].get(digest)
+            stamp = None if entry is None else self.stamp(digest)
+            if stamp is not None and stamp == entry.get('stamp'):
+                return self.hit(index, digest, stamp)
+        # objects are hashed outside of the lock, they may be large
+        if stamp is None or not self.verify(digest, stamp):
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            index = self.load_index()
+            if digest not in index['objects']:
+                self.misses += 1
+                return None
+            return self.hit(index, digest, stamp)
+
+    def hit(self, index, digest, stamp):
+        entry = index['objects'][digest]
+        entry['atime'] = time.time()
+        entry['stamp'] = stamp
+        self.save_index(index)
+        self.hits += 1
+        return self.object_path(digest), entry['metadata']
+
+    def stamp(self, digest):
+        """:return: size and modification time of a stored object,
+        `None` if it does not exist.
+        """
+        try:
+            st = os.stat(self.object_path(digest))
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime]
+
+    def verify(self, digest, stamp):
+        """Check an object modified since it was stored, `stamp` being
+        its current size and modification time.
+
+        :return: whether the object is intact, corrupted objects are
+        removed.
+        """
+        try:
+            if file_sha256(self.object_path(digest)) == digest:
+                return True
+        except IOError:
+            return False
+        with self.lock:
+            if self.stamp(digest) == stamp:
+                logging.warning("removing corrupted %s from artifact cache",
+                                digest)
+                os.remove(self.object_path(digest))
+        return False
+
+    def put(self, key, path, digest, **metadata):
+        """Store a copy of file `path` whose SHA-256 digest is `digest`"""
+        object_path = self.object_path(digest)
+        makedirs(osp.dirname(object_path))
+        # copied outside of the lock, then moved in place
+        fd, temp_path = tempfile.mkstemp(dir=osp.dirname(object_path),
+                                         prefix='.tmp-')
+        os.close(fd)
+        try:
+            clone_file(path, temp_path, hardlink=False)
+            with self.lock:
+                index = self.load_index()
+                entry = index['objects'].get(digest)
+                stamp = self.stamp(digest)
+                if entry is None or stamp is None or \
+                        stamp != entry.get('stamp'):
+                    os.rename(temp_path, object_path)
+                    stamp = self.stamp(digest)
+                index['keys'][key] = digest
+                index['objects'][digest] = dict(
+                    size=stamp[0],
+                    stamp=stamp,
+                    atime=time.time(),
+                    metadata=metadata,
+                )
+                self.evict(index)
+                self.save_index(index)
+        finally:
+            if osp.exists(temp_path):
+                os.remove(temp_path)
+
+    def evict(self, index):
+        objects = index['objects']
+        total = sum(entry['size'] for entry in objects.values())
+        lru = sorted(objects.items(), key=lambda item: item[1]['atime'])
+        for digest, entry in lru:
+            if total <= self.max_size:
+                break
+            logging.debug("evicting %s from artifact cache", digest)
+            object_path = self.object_path(digest)
+            if osp.exists(object_path):
+                os.remove(object_path)
+            total -= entry['size']
+            del objects[digest]
+        keys = index['keys']
+        for key, digest in keys.items():
+            if digest not in objects:
+                del keys[key]
@@ -1,53 +1,150 @@
 
 import argparse
 import logging
+import os
 import os.path as osp
+import sys
+import threading
 
-from . api import EasyUpgrade
+from . api import DEFAULT_CACHE_DIR, EasyUpgrade, parse_release
+from . import trace
 
 DEFAULT_CONFIG_PATH = osp.expanduser('~/.config/easy_upgrade/config.yml')
 
 
+def config_cache_dir(no_config_cache=False, **kwargs):
+    """
+    :return: directory where the parsed configuration is cached, given by
+    the EASY_UPGRADE_CONFIG_CACHE environment variable. `None` if it is
+    empty, or if --no-config-cache is given.
+    """
+    if no_config_cache:
+        return None
+    return os.environ.get('EASY_UPGRADE_CONFIG_CACHE', DEFAULT_CACHE_DIR) \
+        or None
+
+
+def load_config(config, jobs=None, metrics_file=None, **kwargs):
+    eu = EasyUpgrade.from_yaml(config, cache_dir=config_cache_dir(**kwargs))
+    if jobs is not None:
+        eu.config['jobs'] = jobs
+    if metrics_file is not None:
+        eu.config['metrics-file'] = metrics_file
+    return eu
+
+
 def list_outdated_packages(config, all_packages=False, **kwargs):
-    eu = EasyUpgrade.from_yaml(config)
-    method = eu.get_outdated_packages
-    if all_packages:
-        method = eu.get_packages_version
-    for pkg in method():
-        if 'candidate' not in pkg['versions']:
-            message = "{}:{}: no candidate".format(
-                pkg['provider'],
-                pkg['release']
-            )
-        else:
-            message = "{}:{}: candidate {}".format(
-                pkg['provider'],
-                pkg['release'],
-                pkg['versions']['candidate']['human']
-            )
-        installed = pkg['versions'].get('installed')
-        if installed:
-            message += ", currently installed: {}".format(installed['human'])
-        else:
-            message += ", not installed"
-        print message
+    with load_config(config, **kwargs) as eu:
+        method = eu.get_outdated_packages
+        if all_packages:
+            method = eu.get_packages_version
+        for pkg in method():
+            if 'candidate' not in pkg['versions']:
+                message = "{}:{}: no candidate".format(
+                    pkg['provider'],
+                    pkg['release']
+                )
+            else:
+                message = "{}:{}: candidate {}".format(
+                    pkg['provider'],
+                    pkg['release'],
+                    pkg['versions']['candidate']['human']
+                )
+            installed = pkg['versions'].get('installed')
+            if installed:
+                message += ", currently installed: {}".format(
+                    installed['human']
+                )
+            else:
+                message += ", not installed"
+            print message
 
 
 def install_outdated_packages(config, release=None, **kwargs):
-    eu = EasyUpgrade.from_yaml(config)
-    if len(release) == 0:
-        for provider in eu.providers.values():
-            provider.install()
-    else:
+    with load_config(config, **kwargs) as eu:
+        results = eu.install(*map(parse_release, release or []))
+        for result in results:
+            print result
+        failures = [r for r in results if r.failed]
+        if failures:
+            raise Exception(
+                "{} release(s) could not be installed".format(len(failures))
+            )
+
+
+def rollback_packages(config, release=None, **kwargs):
+    with load_config(config, **kwargs) as eu:
         for r in release:
-            try:
-                provider, release = r.split(':', 1)
-            except ValueError:
-                raise Exception(
-                    "Invalid syntax for release: {}".format(r) +
-                    ". Expecting provider/release"
-                )
-            eu.providers[provider].install(release)
+            provider, name = parse_release(r)
+            version = eu.providers[provider].releases[name].rollback()
+            print "{}: rolled back to {}".format(r, version)
+
+
+def serve_relay(config, bind=None, provider='github', **kwargs):
+    from .lib.relay import serve
+    with load_config(config, **kwargs) as eu:
+        relay_config = eu.config.get('relay') or {}
+        serve(
+            eu.providers[provider],
+            bind or relay_config.get('bind', '127.0.0.1:8080'),
+            metadata_ttl=relay_config.get('metadata-ttl', 60),
+        )
+
+
+def run_daemon(config, jobs=None, control_socket=None, metrics_file=None,
+               **kwargs):
+    from .daemon import Daemon
+    overrides = {}
+    if jobs is not None:
+        overrides['jobs'] = jobs
+    if metrics_file is not None:
+        overrides['metrics-file'] = metrics_file
+    Daemon(
+        config,
+        cache_dir=config_cache_dir(**kwargs),
+        control_path=control_socket,
+        overrides=overrides,
+    ).run()
+
+
+def control_daemon(config, command=None, control_socket=None, **kwargs):
+    from .config import load
+    from .daemon import control_socket as default_socket, send_command
+    if control_socket is None:
+        control_socket = default_socket(
+            load(config, cache_dir=config_cache_dir(**kwargs))
+        )
+    for line in send_command(control_socket, *command):
+        print line
+
+
+def profile_call(output, func, **kwargs):
+    """Call `func` with cProfile enabled in every thread, and print
+    the functions taking the most cumulative time.
+
+    :param output: file where the statistics are saved, '-' to only
+    print them.
+    """
+    import cProfile
+    import pstats
+    profilers = [cProfile.Profile()]
+
+    def _profile_thread(frame, event, arg):
+        profiler = cProfile.Profile()
+        profilers.append(profiler)
+        profiler.enable()
+
+    threading.setprofile(_profile_thread)
+    profilers[0].enable()
+    try:
+        return func(**kwargs)
+    finally:
+        profilers[0].disable()
+        threading.setprofile(None)
+        stats = pstats.Stats(*profilers, stream=sys.stderr)
+        if output != '-':
+            stats.dump_stats(output)
+        stats.sort_stats('cumulative').print_stats(30)
 
 
 def run(args=None):
@@ -72,6 +169,38 @@ def run(args=None):
         help='Specify custom configuration file. Default is %(default)s',
         default=DEFAULT_CONFIG_PATH
     )
+    parser.add_argument(
+        '--no-config-cache',
+        action='store_true',
+        help='Do not cache the parsed configuration, stored by default '
+             'in $EASY_UPGRADE_CONFIG_CACHE or {}'.format(DEFAULT_CACHE_DIR)
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        metavar='<n>',
+        type=int,
+        help="Number of releases processed concurrently, "
+             "overrides 'jobs' configuration option"
+    )
+    parser.add_argument(
+        '--metrics-file',
+        metavar='<file>',
+        help="Write metrics in Prometheus text format, overrides "
+             "'metrics-file' configuration option"
+    )
+    parser.add_argument(
+        '--trace',
+        metavar='<file>',
+        help='Write timed spans of the run in a Chrome trace JSON file'
+    )
+    parser.add_argument(
+        '--profile',
+        metavar='<file>',
+        nargs='?',
+        const='-',
+        help='Profile the run with cProfile and print the hot paths, '
+             'statistics are saved in <file> when specified'
+    )
     subparsers = parser.add_subparsers(help='sub-command help')
     list_parser = subparsers.add_parser(
         'list',
@@ -95,10 +224,63 @@ def run(args=None):
         help="Subset of releases to upgrade. Syntax: 'provider:release'"
     )
     install_parser.set_defaults(func=install_outdated_packages)
+
+    rollback_parser = subparsers.add_parser(
+        'rollback',
+        help='Reactivate the previously installed version of package(s)'
+    )
+    rollback_parser.add_argument(
+        'release',
+        nargs='+',
+        help="Releases to roll back. Syntax: 'provider:release'"
+    )
+    rollback_parser.set_defaults(func=rollback_packages)
+
+    serve_parser = subparsers.add_parser(
+        'serve',
+        help='Relay and cache GitHub metadata and assets for other hosts'
+    )
+    serve_parser.add_argument(
+        '-b', '--bind',
+        metavar='<host:port>',
+        help="Address to listen on, overrides 'relay.bind' "
+             "configuration option. Default is 127.0.0.1:8080"
+    )
+    serve_parser.add_argument(
+        '-p', '--provider',
+        default='github',
+        help='GitHub provider of the configuration to relay'
+    )
+    serve_parser.set_defaults(func=serve_relay)
+
+    daemon_parser = subparsers.add_parser(
+        'daemon',
+        help='Check releases periodically, keeping state in memory'
+    )
+    daemon_parser.add_argument(
+        '-s', '--control-socket',
+        metavar='<path>',
+        help="UNIX socket accepting commands, overrides "
+             "'daemon.control-socket' configuration option"
+    )
+    daemon_parser.set_defaults(func=run_daemon)
+
+    ctl_parser = subparsers.add_parser(
+        'ctl',
+        help='Send a command to the daemon: check [provider:release...], '
+             'status, reload, or stop'
+    )
+    ctl_parser.add_argument(
+        '-s', '--control-socket',
+        metavar='<path>',
+        help='UNIX socket of the daemon'
+    )
+    ctl_parser.add_argument('command', nargs='+')
+    ctl_parser.set_defaults(func=control_daemon)
     if args is None:
         args = parser.parse_args()
     else:
-        parser.parse_args(args)
+        args = parser.parse_args(args)
     if args.verbose >= 1:
         logging_level = logging.DEBUG
     else:
@@ -107,4 +289,15 @@ def run(args=None):
     if args.verbose < 1:
         for l in ['requests.packages.urllib3.connectionpool', ]:
             logging.getLogger(l).setLevel(logging.ERROR)
-    args.func(**vars(args))
+    if args.trace:
+        trace.enable()
+    try:
+        with trace.span('run', 'cli', command=args.func.__name__):
+            if args.profile:
+                profile_call(args.profile, **vars(args))
+            else:
+                args.func(**vars(args))
+    finally:
+        if args.trace:
+            trace.disable().dump(args.trace)
+            logging.info("trace written in %s", args.trace)
@@ -0,0 +1,147 @@
+"""Configuration loading.
+
+YAML files are parsed with the LibYAML bindings when available. A file
+may include other ones with a top-level `include` directive, a path or
+a list of paths and glob patterns relative to the including file.
+Included files are merged first, the including file overriding them.
+
+The merged configuration can be cached in a pickle, reused as long as
+none of the files it comes from is modified.
+"""
+import cPickle as pickle
+import glob
+import hashlib
+import os
+import os.path as osp
+
+from .cache import atomic_write
+
+CACHE_FORMAT = 1
+INCLUDE_KEY = 'include'
+
+
+def yaml_loader():
+    """:return: fastest YAML loader class available"""
+    import yaml
+    return getattr(yaml, 'CLoader', yaml.Loader)
+
+
+def merge(base, override):
+    """Recursively merge dictionary `override` into `base`"""
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    return st.st_mtime, st.st_size
+
+
+def file_digest(path):
+    with open(path, 'rb') as istr:
+        return hashlib.sha1(istr.read()).hexdigest()
+
+
+class ConfigLoader(object):
+    """Load a configuration file and the files it includes, recording
+    what the result depends on.
+    """
+    def __init__(self, loader=None):
+        self.loader = loader or yaml_loader()
+        self.files = {}
+        self.patterns = {}
+
+    def load(self, path, stack=()):
+        import yaml
+        path = osp.abspath(path)
+        if path in stack:
+            raise Exception("Circular configuration include: {}".format(
+                ' -> '.join(stack + (path,))
+            ))
+        with open(path, 'rb') as istr:
+            data = istr.read()
+        self.files[path] = file_stamp(path) + (hashlib.sha1(data).hexdigest(),)
+        config = yaml.load(data, Loader=self.loader)
+        if config is None:
+            config = {}
+        if not isinstance(config, dict):
+            raise Exception(
+                "Configuration file {} must be a dictionary".format(path)
+            )
+        includes = config.pop(INCLUDE_KEY, None) or []
+        if isinstance(includes, basestring):
+            includes = [includes]
+        result = {}
+        for include in includes:
+            pattern = osp.join(osp.dirname(path), osp.expanduser(include))
+            if glob.has_magic(pattern):
+                paths = self.patterns[pattern] = sorted(glob.glob(pattern))
+            else:
+                paths = [pattern]
+            for included in paths:
+                merge(result, self.load(included, stack + (path,)))
+        return merge(result, config)
+
+
+def is_fresh(entry):
+    """Files touched but left unchanged have their stamp updated in
+    `entry`, so that they are not hashed again next time.
+
+    :return: `True` if files a cache entry comes from are unchanged
+    """
+    for path, (mtime, size, digest) in entry['files'].items():
+        try:
+            stamp = file_stamp(path)
+            if stamp != (mtime, size):
+                if file_digest(path) != digest:
+                    return False
+                entry['files'][path] = stamp + (digest,)
+                entry['touched'] = True
+        except (IOError, OSError):
+            return False
+    for pattern, paths in entry['patterns'].items():
+        if sorted(glob.glob(pattern)) != paths:
+            return False
+    return True
+
+
+def load(path, cache_dir=None):
+    """
+    :param path: configuration file
+    :param cache_dir: directory where the merged configuration is cached,
+    `None` to disable caching.
+    :return: configuration dictionary
+    """
+    path = osp.abspath(path)
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = osp.join(
+            cache_dir, 'config', hashlib.sha1(path).hexdigest() + '.pickle'
+        )
+        try:
+            with open(cache_path, 'rb') as istr:
+                entry = pickle.load(istr)
+            if entry['format'] == CACHE_FORMAT and is_fresh(entry):
+                if entry.pop('touched', False):
+                    save_entry(cache_path, entry)
+                return entry['config']
+        except (IOError, EOFError, pickle.UnpicklingError, KeyError):
+            pass
+    loader = ConfigLoader()
+    config = loader.load(path)
+    if cache_path is not None:
+        save_entry(cache_path, dict(
+            format=CACHE_FORMAT,
+            files=loader.files,
+            patterns=loader.patterns,
+            config=config,
+        ))
+    return config
+
+
+def save_entry(cache_path, entry):
+    atomic_write(cache_path, pickle.dumps(entry, pickle.HIGHEST_PROTOCOL))
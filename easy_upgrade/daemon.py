@@ -0,0 +1,281 @@
+"""Long-running mode, checking releases on a schedule.
+
+The configuration, provider sessions and caches stay in memory between
+checks. Every release is checked every `interval` seconds, or its own
+`check-interval`, spread by a random `jitter` ratio so that a fleet of
+hosts does not poll at the same time:
+
+    daemon:
+      interval: 3600
+      jitter: 0.1
+      reload-interval: 5
+      control-socket: ~/.cache/easy_upgrade/daemon.sock
+
+Metrics are written after every check when the `metrics-file` option
+is set. The configuration is reloaded when it changes. Commands are accepted on
+a local UNIX socket, one per connection:
+
+    check [provider:release...]  check now, reply installation results
+    status                       reply the next check of every release
+    reload                       reload the configuration
+    stop                         stop the daemon
+"""
+import heapq
+import logging
+import os
+import os.path as osp
+import Queue
+import random
+import socket
+from SocketServer import (
+    StreamRequestHandler,
+    ThreadingMixIn,
+    UnixStreamServer,
+)
+import threading
+import time
+
+from .api import DEFAULT_CACHE_DIR, EasyUpgrade, parse_release
+from .config import load as load_config
+
+DEFAULT_INTERVAL = 3600
+
+
+class ControlHandler(StreamRequestHandler):
+    def handle(self):
+        words = self.rfile.readline().split()
+        if not words:
+            return
+        reply = Queue.Queue()
+        self.server.daemon.requests.put((words[0], words[1:], reply))
+        for message in iter(reply.get, None):
+            self.wfile.write(message + '\n')
+
+
+class ControlServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, daemon, path):
+        if osp.exists(path):
+            os.remove(path)
+        UnixStreamServer.__init__(self, path, ControlHandler)
+        self.daemon = daemon
+
+
+def control_socket(config):
+    """:return: path of the control socket of the daemon"""
+    options = config.get('daemon') or {}
+    path = options.get('control-socket')
+    if path is None:
+        cache_dir = config.get('cache-dir', DEFAULT_CACHE_DIR)
+        if cache_dir is None:
+            cache_dir = DEFAULT_CACHE_DIR
+        path = osp.join(cache_dir, 'daemon.sock')
+    return osp.expanduser(path)
+
+
+def send_command(path, *words):
+    """Send a command to the daemon listening on `path`
+
+    :return: generator of the reply lines
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    try:
+        sock.sendall(' '.join(words) + '\n')
+        istr = sock.makefile()
+        for line in istr:
+            yield line.rstrip('\n')
+    finally:
+        sock.close()
+
+
+class Daemon(object):
+    def __init__(self, config_path, cache_dir=DEFAULT_CACHE_DIR,
+                 control_path=None, overrides=None, factory=EasyUpgrade,
+                 clock=time.time, rng=random):
+        self.config_path = config_path
+        self.overrides = overrides or {}
+        self.cache_dir = cache_dir
+        self.control_path = control_path
+        self.factory = factory
+        self.clock = clock
+        self.rng = rng
+        self.config = None
+        self.eu = None
+        self.due = {}
+        self.schedule = []
+        self.requests = Queue.Queue()
+        self.running = False
+
+    @property
+    def options(self):
+        return self.config.get('daemon') or {}
+
+    def interval(self, release):
+        return release.get(
+            'check-interval',
+            self.options.get('interval', DEFAULT_INTERVAL)
+        )
+
+    def next_check(self, release, now):
+        jitter = self.options.get('jitter', 0.1)
+        return now + self.interval(release) * (
+            1 + self.rng.uniform(-jitter, jitter)
+        )
+
+    def releases(self):
+        for provider_name, provider in sorted(self.eu.providers.items()):
+            for name in sorted(provider.releases):
+                yield (provider_name, name), provider.releases[name]
+
+    def load(self):
+        """(Re)load configuration
+
+        :return: `True` if the configuration has changed
+        """
+        config = load_config(self.config_path, cache_dir=self.cache_dir)
+        config.update(self.overrides)
+        if config == self.config:
+            return False
+        eu = self.factory(config)
+        if self.eu is not None:
+            eu.metrics = self.eu.metrics
+            self.eu.close()
+        self.config, self.eu = config, eu
+        now = self.clock()
+        due, self.due, self.schedule = self.due, {}, []
+        for key, release in self.releases():
+            when = due.get(key)
+            if when is None:
+                # spread first checks of the hosts of a fleet
+                jitter = self.options.get('jitter', 0.1) * \
+                    self.interval(release)
+                when = now + self.rng.uniform(0, jitter)
+            self.reschedule(key, when)
+        logging.info("configuration loaded, %d release(s)", len(self.due))
+        return True
+
+    def reschedule(self, key, when):
+        self.due[key] = when
+        heapq.heappush(self.schedule, (when, key))
+
+    def next_due(self):
+        """:return: time of the next check, `None` if there is none"""
+        while self.schedule:
+            when, key = self.schedule[0]
+            if self.due.get(key) == when:
+                return when
+            heapq.heappop(self.schedule)  # outdated entry
+
+    def pop_due(self, now):
+        keys = []
+        while self.next_due() is not None and self.next_due() <= now:
+            keys.append(heapq.heappop(self.schedule)[1])
+        return keys
+
+    def check(self, keys):
+        """Install new versions of releases `keys`
+
+        :return: list of `InstallResult`
+        """
+        keys = [k for k in keys if k in self.due]
+        if not keys:
+            # installing no release at all would install them all
+            return []
+        try:
+            for provider, name in keys:
+                self.eu.providers[provider].releases[name].reset()
+            results = self.eu.install(*keys)
+        finally:
+            # checked again later even if the installation failed
+            now = self.clock()
+            for key in keys:
+                release = self.eu.providers[key[0]].releases[key[1]]
+                self.reschedule(key, self.next_check(release, now))
+        try:
+            self.eu.write_metrics()
+        except Exception:
+            logging.exception("could not write metrics")
+        return results
+
+    def run_due(self):
+        keys = self.pop_due(self.clock())
+        if keys:
+            self.check(keys)
+
+    def handle(self, command, args, reply):
+        try:
+            if command == 'check':
+                keys = map(parse_release, args) or list(self.due)
+                unknown = [k for k in keys if k not in self.due]
+                for key in unknown:
+                    reply.put('{}:{}: unknown release'.format(*key))
+                for result in self.check(keys):
+                    reply.put(str(result))
+            elif command == 'status':
+                now = self.clock()
+                for key, when in sorted(self.due.items()):
+                    reply.put('{}:{}: next check in {:.0f}s'.format(
+                        key[0], key[1], max(0, when - now)
+                    ))
+            elif command == 'reload':
+                reply.put('reloaded' if self.load() else 'unchanged')
+            elif command == 'stop':
+                self.running = False
+                reply.put('stopping')
+            else:
+                reply.put('unknown command: {}'.format(command))
+        except Exception as e:
+            logging.exception("command %s failed", command)
+            reply.put('error: {}'.format(e))
+        finally:
+            reply.put(None)
+
+    def wait(self, timeout):
+        """Wait for a command at most `timeout` seconds, and handle it"""
+        try:
+            command, args, reply = self.requests.get(timeout=timeout)
+        except Queue.Empty:
+            return
+        self.handle(command, args, reply)
+
+    def run(self):
+        self.load()
+        control_path = self.control_path or control_socket(self.config)
+        server = ControlServer(self, control_path)
+        thread = threading.Thread(
+            target=server.serve_forever,
+            kwargs=dict(poll_interval=0.1)
+        )
+        thread.daemon = True
+        thread.start()
+        self.running = True
+        last_reload = self.clock()
+        try:
+            while self.running:
+                reload_interval = self.options.get('reload-interval', 5)
+                now = self.clock()
+                timeout = reload_interval
+                next_due = self.next_due()
+                if next_due is not None:
+                    timeout = min(timeout, next_due - now)
+                self.wait(max(0.01, timeout))
+                if not self.running:
+                    break
+                if self.clock() - last_reload >= reload_interval:
+                    last_reload = self.clock()
+                    try:
+                        self.load()
+                    except Exception:
+                        logging.exception("could not reload configuration")
+                try:
+                    self.run_due()
+                except Exception:
+                    logging.exception("could not check releases")
+        finally:
+            server.shutdown()
+            server.server_close()
+            if osp.exists(control_path):
+                os.remove(control_path)
+            self.eu.close()
@@ -0,0 +1,150 @@
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+import os
+import os.path as osp
+import threading
+from urlparse import urlparse
+
+from .cache import atomic_write
+
+MiB = 1024 * 1024
+
+
+def no_auth(request):
+    """`requests` authentication overriding the one of the session"""
+    return request
+
+
+class RangedDownload(object):
+    """Download a file in HTTP Range segments fetched concurrently.
+
+    Data is written in `<path>.part`, and progress of every segment is
+    persisted in `<path>.part.json` so that an interrupted download
+    resumes where it stopped. The `run` method returns `False` without
+    downloading anything if the server does not support ranges.
+    """
+    def __init__(self, session, url, path, segment_size=8 * MiB,
+                 jobs=4, chunk_size=64 * 1024):
+        self.session = session
+        self.url = url
+        self.path = path
+        self.segment_size = segment_size
+        self.jobs = jobs
+        self.chunk_size = chunk_size
+        self.part_path = path + '.part'
+        self.state_path = path + '.part.json'
+        self.state = None
+        self.lock = threading.Lock()
+
+    def probe(self):
+        """
+        :return: tuple (final URL, size, validator) or `None` if the
+        resource cannot be downloaded with ranges.
+        """
+        response = self.session.head(
+            self.url,
+            allow_redirects=True,
+            headers={'Accept-Encoding': 'identity'}
+        )
+        if not response.ok:
+            # some servers only allow GET requests
+            logging.debug("HEAD %s: HTTP %d", self.url, response.status_code)
+            return None
+        if response.headers.get('Accept-Ranges') != 'bytes':
+            return None
+        size = int(response.headers.get('Content-Length') or 0)
+        if size == 0:
+            return None
+        validator = (
+            response.headers.get('ETag') or
+            response.headers.get('Last-Modified')
+        )
+        return response.url, size, validator
+
+    def load_state(self, size, validator):
+        try:
+            with open(self.state_path) as istr:
+                state = json.load(istr)
+        except (IOError, ValueError):
+            return None
+        if not osp.isfile(self.part_path):
+            return None
+        if state.get('size') != size or state.get('validator') != validator:
+            return None
+        return state
+
+    def new_state(self, size, validator):
+        segments = [
+            [offset, min(offset + self.segment_size, size), 0]
+            for offset in range(0, size, self.segment_size)
+        ]
+        with open(self.part_path, 'wb') as ostr:
+            ostr.truncate(size)
+        return dict(size=size, validator=validator, segments=segments)
+
+    def save_state(self):
+        with self.lock:
+            atomic_write(self.state_path, json.dumps(self.state))
+
+    def fetch_segment(self, segment):
+        start, end, done = segment
+        if start + done >= end:
+            return
+        headers = {
+            'Accept-Encoding': 'identity',
+            'Range': 'bytes={}-{}'.format(start + done, end - 1),
+        }
+        auth = None
+        if urlparse(self.final_url).netloc != urlparse(self.url).netloc:
+            # credentials must not leak to the storage host
+            auth = no_auth
+        response = self.session.get(
+            self.final_url, headers=headers, stream=True, auth=auth
+        )
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise Exception(
+                "Server ignored range request of {}".format(self.url)
+            )
+        with open(self.part_path, 'r+b') as ostr:
+            ostr.seek(start + done)
+            unsaved = 0
+            for chunk in response.iter_content(self.chunk_size):
+                ostr.write(chunk)
+                segment[2] += len(chunk)
+                unsaved += len(chunk)
+                if unsaved >= self.segment_size / 4:
+                    ostr.flush()
+                    self.save_state()
+                    unsaved = 0
+        if start + segment[2] != end:
+            raise Exception(
+                "Incomplete segment {}-{} of {}".format(start, end, self.url)
+            )
+
+    def run(self):
+        probe = self.probe()
+        if probe is None:
+            return False
+        self.final_url, size, validator = probe
+        dir_path = osp.dirname(self.path)
+        if dir_path and not osp.isdir(dir_path):
+            os.makedirs(dir_path)
+        self.state = self.load_state(size, validator)
+        if self.state is None:
+            self.state = self.new_state(size, validator)
+        else:
+            logging.info("resuming download of %s", self.url)
+        self.save_state()
+        segments = self.state['segments']
+        pool = ThreadPool(max(1, min(self.jobs, len(segments))))
+        try:
+            pool.map(self.fetch_segment, segments)
+        finally:
+            pool.terminate()
+            pool.join()
+            self.save_state()
+        os.rename(self.part_path, self.path)
+        os.remove(self.state_path)
+        return True
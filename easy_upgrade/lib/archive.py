@@ -0,0 +1,250 @@
+from fnmatch import fnmatch
+import hashlib
+import os
+import os.path as osp
+import shutil
+import stat
+import subprocess
+import tarfile
+import tempfile
+import threading
+import zipfile
+
+from .. toolbox import (
+    CHUNK_SIZE,
+    check_sha256,
+    find_executable,
+    makedirs,
+)
+from .. download import MiB
+from . github import GitHubAsset
+
+FORMATS = [
+    ('.tar.gz', 'tar'),
+    ('.tgz', 'tar'),
+    ('.tar.bz2', 'tar'),
+    ('.tbz2', 'tar'),
+    ('.tar', 'tar'),
+    ('.tar.xz', 'tar.xz'),
+    ('.txz', 'tar.xz'),
+    ('.zip', 'zip'),
+]
+ZIP_MEMORY_SIZE = 16 * MiB
+
+
+def archive_format(file_name):
+    for suffix, fmt in FORMATS:
+        if file_name.endswith(suffix):
+            return fmt
+    raise Exception("Unknown archive format: {}".format(file_name))
+
+
+class DigestReader(object):
+    """File-like object computing SHA-256 digest of the data read"""
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=None):
+        if size is None or size < 0:
+            data = self.fileobj.read()
+        else:
+            data = self.fileobj.read(size)
+        self.sha256.update(data)
+        return data
+
+    def drain(self):
+        while self.read(CHUNK_SIZE):
+            pass
+        return self.sha256.hexdigest()
+
+
+class MemberFilter(object):
+    """Select archive members, and compute their extraction path"""
+    def __init__(self, strip_components=0, members=None, exclude=None):
+        self.strip_components = strip_components
+        self.members = members or []
+        self.exclude = exclude or []
+
+    def __call__(self, name):
+        """
+        :param name: member name, as stored in the archive. Members and
+        exclude patterns are matched against it.
+        :return: path relative to the extraction directory,
+        `None` if member must be skipped.
+        """
+        components = [c for c in name.split('/') if c not in ('', '.')]
+        if '..' in components:
+            raise Exception("Unsafe path in archive: {}".format(name))
+        name = '/'.join(components)
+        if self.members and \
+                not any(fnmatch(name, p) for p in self.members):
+            return None
+        if any(fnmatch(name, p) for p in self.exclude):
+            return None
+        components = components[self.strip_components:]
+        if not any(components):
+            return None
+        return '/'.join(components)
+
+
+def inside(directory, path):
+    """
+    :return: `True` if `path` resolves inside `directory`, following
+    symbolic links already on disk.
+    """
+    directory = osp.realpath(directory)
+    path = osp.realpath(path)
+    return path == directory or path.startswith(directory + os.sep)
+
+
+def check_target(output_directory, path, name):
+    """Ensure that `path` of member `name` is written inside
+    `output_directory`, and not through a symbolic link leading outside.
+    """
+    if not inside(output_directory, osp.join(output_directory, path)):
+        raise Exception("Unsafe path in archive: {}".format(name))
+
+
+def check_link(output_directory, path, member):
+    """Ensure that symbolic link `member`, extracted in `path`, resolves
+    inside `output_directory`, both lexically and on disk.
+    """
+    target = osp.join(osp.dirname(path), member.linkname)
+    if osp.isabs(member.linkname) or \
+            osp.normpath(target).split(os.sep)[0] == '..' or \
+            not inside(output_directory, osp.join(output_directory, target)):
+        raise Exception("Unsafe symbolic link in archive: {} -> {}".format(
+            member.name, member.linkname
+        ))
+
+
+def extract_tar(fileobj, output_directory, member_filter, mode='r|*'):
+    """Extract members of a tar stream as they are read. Devices and
+    FIFOs are skipped, setuid and setgid bits are dropped.
+    """
+    links = []
+    with tarfile.open(fileobj=fileobj, mode=mode) as tar:
+        for member in tar:
+            path = member_filter(member.name)
+            if path is None or member.isdev():
+                continue
+            member.mode &= ~(stat.S_ISUID | stat.S_ISGID)
+            check_target(output_directory, path, member.name)
+            if member.issym():
+                check_link(output_directory, path, member)
+                links.append((path, member))
+            elif member.islnk():
+                member.linkname = member_filter(member.linkname)
+                if member.linkname is None:
+                    continue
+                check_target(output_directory, member.linkname, member.name)
+            member.name = path
+            tar.extract(member, output_directory)
+    # links extracted afterward may redirect the ones extracted before
+    for path, member in links:
+        check_link(output_directory, path, member)
+
+
+def extract_tar_xz(fileobj, output_directory, member_filter):
+    """Extract a tar.xz stream, decompressed by the `xz` executable"""
+    process = subprocess.Popen(
+        [find_executable('xz'), '-dc'],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+
+    def feed():
+        try:
+            for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), ''):
+                process.stdin.write(chunk)
+        except IOError:
+            pass  # decompression aborted
+        finally:
+            process.stdin.close()
+    feeder = threading.Thread(target=feed)
+    feeder.daemon = True
+    feeder.start()
+    try:
+        extract_tar(process.stdout, output_directory, member_filter, 'r|')
+        while process.stdout.read(CHUNK_SIZE):
+            pass
+    except Exception:
+        process.kill()
+        raise
+    finally:
+        feeder.join()
+        returncode = process.wait()
+    if returncode != 0:
+        raise Exception("xz decompression failed")
+
+
+def extract_zip(fileobj, output_directory, member_filter):
+    """Extract a zip archive. Zip directory is stored at the end of the
+    archive, so it is buffered first, on disk beyond `ZIP_MEMORY_SIZE`.
+    """
+    buf = tempfile.SpooledTemporaryFile(max_size=ZIP_MEMORY_SIZE)
+    shutil.copyfileobj(fileobj, buf, CHUNK_SIZE)
+    buf.seek(0)
+    with buf, zipfile.ZipFile(buf) as archive:
+        for info in archive.infolist():
+            path = member_filter(info.filename)
+            if path is None:
+                continue
+            check_target(output_directory, path, info.filename)
+            target = osp.join(output_directory, path)
+            if info.filename.endswith('/'):
+                makedirs(target)
+                continue
+            makedirs(osp.dirname(target))
+            with archive.open(info) as istr, open(target, 'wb') as ostr:
+                for chunk in iter(lambda: istr.read(CHUNK_SIZE), ''):
+                    ostr.write(chunk)
+            mode = info.external_attr >> 16
+            if mode:
+                os.chmod(target, mode & 0777)
+
+
+EXTRACTORS = {
+    'tar': extract_tar,
+    'tar.xz': extract_tar_xz,
+    'zip': extract_zip,
+}
+
+
+def extract(fileobj, fmt, output_directory, member_filter):
+    makedirs(output_directory)
+    EXTRACTORS[fmt](fileobj, output_directory, member_filter)
+
+
+class GitHubArchive(GitHubAsset):
+    """Extract a release archive while it is downloaded. The archive
+    itself is never written on disk.
+    """
+    __slots__ = ()
+    name = 'archive'
+
+    def member_filter(self):
+        return MemberFilter(
+            strip_components=self.get('strip-components', 0),
+            members=self.get('members'),
+            exclude=self.get('exclude'),
+        )
+
+    def download_asset(self, asset, output_directory):
+        url = self.provider.asset_url(asset)
+        fmt = self.get('format') or archive_format(asset['name'])
+        sha256 = self.expected_sha256(asset)
+        output_directory = osp.join(output_directory, self.get('path', ''))
+        response = self.provider.session(url).get(
+            url,
+            stream=True,
+            headers={'Accept-Encoding': 'identity'}
+        )
+        try:
+            response.raise_for_status()
+            reader = DigestReader(response.raw)
+            extract(reader, fmt, output_directory, self.member_filter())
+            check_sha256(asset['name'], reader.drain(), sha256)
+        finally:
+            response.close()
@@ -0,0 +1,98 @@
+import os
+import os.path as osp
+
+from .. api import Installer
+from .. manifest import Manifest
+from .. toolbox import makedirs, move_tree
+
+
+def switch_symlink(path, dest):
+    """Atomically make `path` a symbolic link to `dest`"""
+    tmp_path = '{}.tmp-{}'.format(path, os.getpid())
+    if osp.lexists(tmp_path):
+        os.remove(tmp_path)
+    os.symlink(dest, tmp_path)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+
+
+class CurrentInstaller(Installer):
+    """Install every version in its own directory, and activate one by
+    replacing a `current` symbolic link:
+
+        <path>/<package>/1.0/
+        <path>/<package>/1.1/
+        <path>/<package>/current -> 1.1
+
+    Activation and rollback cost the same whatever the size of the
+    package, and never expose a partially activated version.
+    """
+    __slots__ = ('path', 'package_dir', 'activate', '_manifest')
+    name = 'current'
+
+    def __init__(self, provider, release, config):
+        super(CurrentInstaller, self).__init__(provider, release, config)
+        self.path = config['path']
+        self.package_dir = osp.join(self.path, self.release.pkg_name)
+        self.activate = config.get('activate', True)
+        self._manifest = None
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            self._manifest = Manifest(
+                osp.join(self.package_dir, '.manifest.json')
+            )
+        return self._manifest
+
+    @property
+    def current(self):
+        return osp.join(self.package_dir, 'current')
+
+    def version_dir(self, version):
+        if version in ('', os.curdir, os.pardir, 'current') or \
+                os.sep in version or version.startswith('.'):
+            raise Exception("Invalid version: {}".format(version))
+        return osp.join(self.package_dir, version)
+
+    def installed_version(self):
+        return self.release.version_scheme.max(self.manifest.versions())
+
+    def staging_dir(self):
+        path = osp.join(self.package_dir, '.staging')
+        makedirs(path)
+        return path
+
+    def install(self, fetched_items_path, version):
+        version_dir = self.version_dir(version)
+        if osp.lexists(version_dir):
+            raise Exception(
+                "Cannot install {}/{} in {}: directory exists".format(
+                    self.provider.name,
+                    self.release.name,
+                    version_dir
+                )
+            )
+        move_tree(fetched_items_path, version_dir)
+        self.manifest.add_version(version, version_dir)
+        if self.activate:
+            self.activate_version(version)
+        return version_dir
+
+    def activate_version(self, version):
+        switch_symlink(self.current, osp.basename(self.version_dir(version)))
+        self.manifest.activate(version)
+
+    def rollback(self):
+        version = self.manifest.previous
+        if version is None or not osp.isdir(self.version_dir(version)):
+            raise Exception(
+                "No previous version of {} to roll back to".format(
+                    self.release.name
+                )
+            )
+        self.activate_version(version)
+        return version
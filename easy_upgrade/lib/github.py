@@ -1,26 +1,76 @@
 
+import collections
+from contextlib import contextmanager
 from datetime import datetime
 from fnmatch import fnmatch
+import hashlib
 import logging
 import os
 import os.path as osp
 import shutil
 import stat
-
-import requests
+import threading
+import time
+from urlparse import urlparse
 
 from .. api import (
     Fetcher,
     Release,
     ReleaseProvider,
 )
+from .. cache import (
+    ArtifactCache,
+    HttpCache,
+)
+from .. download import MiB, RangedDownload
+from .. import trace
+from . release_index import ReleaseIndex
 from .. toolbox import (
-    download_http_url,
-    temp_dir,
+    check_sha256,
+    download_file,
+    file_sha256,
 )
 
 GITHUB_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S%Z'
 GITHUB_ROOT_API = "https://api.github.com"
+GITHUB_DOWNLOAD_ROOT = "https://github.com"
+RELEASES_PER_PAGE = 100
+GRAPHQL_RELEASES_FIELDS = """
+releases(first: $count, orderBy: {field: CREATED_AT, direction: DESC}) {
+  pageInfo { hasNextPage }
+  nodes {
+    databaseId
+    name
+    tagName
+    isPrerelease
+    isDraft
+    publishedAt
+    releaseAssets(first: 100) {
+      nodes { id name size contentType downloadUrl }
+    }
+  }
+}
+"""
+
+
+def graphql_releases_query(count):
+    """
+    :return: aliased GraphQL query of the latest releases of `count`
+    repositories, given by the `$o<i>` and `$n<i>` variables.
+    """
+    declarations = ['$count: Int!']
+    fields = []
+    for i in range(count):
+        declarations.append('$o{0}: String!, $n{0}: String!'.format(i))
+        fields.append(
+            'r{0}: repository(owner: $o{0}, name: $n{0}) {{{1}}}'.format(
+                i, GRAPHQL_RELEASES_FIELDS
+            )
+        )
+    return 'query({}) {{\n{}\n}}'.format(
+        ', '.join(declarations),
+        '\n'.join(fields)
+    )
 
 
 def parse_date(date):
@@ -29,13 +79,212 @@ def parse_date(date):
     return datetime.strptime(date, GITHUB_DATE_FORMAT)
 
 
+class RateLimitExceeded(Exception):
+    pass
+
+
+class RateLimitScheduler(object):
+    """Pace GitHub API requests according to the rate-limit headers.
+
+    Budgets are tracked per rate-limit resource (`core`, `graphql`).
+    Requests issued while installing a release have priority: plain
+    listing requests stop consuming a budget once it goes below
+    `reserve`, and yield to install requests waiting for their turn.
+    Secondary rate limits are handled by waiting as requested by the
+    server, and by spacing subsequent requests with an adaptive delay.
+    """
+    PRIORITIES = ('install', 'list')
+
+    def __init__(self, reserve=0, max_wait=900, max_retries=5,
+                 sleep=time.sleep, clock=time.time):
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.sleep = sleep
+        self.clock = clock
+        self.budgets = {}
+        self.consumed = 0
+        self.requests = 0
+        self.waited = 0
+        self.interval = 0
+        self.last_request = None
+        self.waiting_installs = 0
+        self._local = threading.local()
+        self._cond = threading.Condition()
+
+    @classmethod
+    def resource(cls, url):
+        return 'graphql' if url.endswith('/graphql') else 'core'
+
+    @property
+    def current_priority(self):
+        return getattr(self._local, 'priority', 'list')
+
+    @contextmanager
+    def priority(self, priority):
+        """Give `priority` to the requests issued by the current thread"""
+        if priority not in self.PRIORITIES:
+            raise Exception("Unknown request priority: {}".format(priority))
+        previous = self.current_priority
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def _delay(self, resource, priority):
+        """:return: seconds to wait before sending a request"""
+        now = self.clock()
+        delay = 0
+        if self.interval and self.last_request is not None:
+            delay = self.last_request + self.interval - now
+        budget = self.budgets.get(resource)
+        if budget is not None and budget['reset'] > now:
+            threshold = self.reserve if priority == 'list' else 0
+            if budget['remaining'] <= threshold:
+                delay = max(delay, budget['reset'] - now)
+        return max(delay, 0)
+
+    def _wait(self, delay):
+        if delay > self.max_wait:
+            raise RateLimitExceeded(
+                "GitHub rate limit exceeded, "
+                "next request possible in {:.0f} seconds".format(delay)
+            )
+        self.waited += delay
+        self.sleep(delay)
+
+    def acquire(self, resource):
+        priority = self.current_priority
+        with self._cond:
+            if priority == 'install':
+                self.waiting_installs += 1
+            try:
+                while True:
+                    if priority == 'list' and self.waiting_installs:
+                        self._cond.wait(1)
+                        continue
+                    delay = self._delay(resource, priority)
+                    if delay <= 0:
+                        break
+                    self._cond.release()
+                    try:
+                        self._wait(delay)
+                    finally:
+                        self._cond.acquire()
+            finally:
+                if priority == 'install':
+                    self.waiting_installs -= 1
+                    self._cond.notify_all()
+            self.last_request = self.clock()
+            self.requests += 1
+
+    def update(self, resource, response):
+        headers = response.headers
+        if 'X-RateLimit-Remaining' not in headers:
+            return
+        remaining = int(headers['X-RateLimit-Remaining'])
+        limit = int(headers.get('X-RateLimit-Limit', remaining))
+        reset = int(headers.get('X-RateLimit-Reset') or 0)
+        resource = headers.get('X-RateLimit-Resource', resource)
+        with self._cond:
+            budget = self.budgets.get(resource)
+            if budget is not None and budget['reset'] == reset:
+                # remaining budget only decreases within a window, older
+                # responses received late are ignored.
+                if remaining < budget['remaining']:
+                    self.consumed += budget['remaining'] - remaining
+                    budget['remaining'] = remaining
+            else:
+                if response.status_code != 304:
+                    self.consumed += 1
+                self.budgets[resource] = dict(
+                    limit=limit,
+                    remaining=remaining,
+                    reset=reset,
+                )
+            self._cond.notify_all()
+
+    def retry_delay(self, response, attempt):
+        """
+        :return: seconds to wait before retrying the request if `response`
+        reports a rate limit, `None` otherwise.
+        """
+        if response.status_code not in (403, 429):
+            return None
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None:
+            self.interval = max(self.interval * 2, 1)
+            return float(retry_after)
+        if response.headers.get('X-RateLimit-Remaining') == '0':
+            reset = int(response.headers.get('X-RateLimit-Reset') or 0)
+            return max(reset - self.clock(), 1)
+        if 'rate limit' in response.text.lower():
+            # secondary rate limit without hint
+            self.interval = max(self.interval * 2, 1)
+            return 60 * 2 ** attempt
+        return None
+
+    def request(self, session, method, url, **kwargs):
+        resource = self.resource(url)
+        for attempt in range(self.max_retries + 1):
+            self.acquire(resource)
+            response = session.request(method, url, **kwargs)
+            self.update(resource, response)
+            delay = self.retry_delay(response, attempt)
+            if delay is None:
+                self.interval /= 2.0
+                if self.interval < 0.1:
+                    self.interval = 0
+                return response
+            logging.warning(
+                "GitHub rate limit hit on %s, retrying in %d seconds",
+                url, delay
+            )
+            self._wait(delay)
+        return response
+
+    def session(self, session):
+        """:return: `session` proxy whose requests are scheduled"""
+        return _ScheduledSession(self, session)
+
+    def report(self):
+        message = "GitHub API: {} request(s), {} rate-limit point(s) consumed"
+        message = message.format(self.requests, self.consumed)
+        for resource, budget in sorted(self.budgets.items()):
+            message += ", {} {}/{} remaining".format(
+                resource, budget['remaining'], budget['limit']
+            )
+        if self.waited:
+            message += ", waited {:.0f} seconds".format(self.waited)
+        return message
+
+
+class _ScheduledSession(object):
+    def __init__(self, scheduler, session):
+        self.scheduler = scheduler
+        self.session = session
+
+    def get(self, url, **kwargs):
+        return self.scheduler.request(self.session, 'GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.scheduler.request(self.session, 'POST', url, **kwargs)
+
+
 class GitHubRelease(Release):
+    __slots__ = (
+        'organization', 'repository', 'with_prerelease', 'with_draft',
+        'name_filter', 'prefetched',
+    )
+
     def __init__(self, provider, name, config):
         self.organization, self.repository = name.split('/', 1)
         super(GitHubRelease, self).__init__(provider, name, config)
         self.with_prerelease = self.get('with-prerelease', False)
         self.with_draft = self.get('with-draft', False)
         self.name_filter = config.get('name')
+        self.prefetched = None
 
     @property
     def pkg_name(self):
@@ -43,19 +292,15 @@ class GitHubRelease(Release):
 
     def get_releases(self):
         url = "{root}/repos/{org}/{repo}/releases".format(
-            root=GITHUB_ROOT_API,
+            root=self.provider.api_root,
             org=self.organization,
             repo=self.repository
         )
-        response = requests.get(url, auth=self.provider.basic_auth)
-        response.raise_for_status()
-        return response.json()
+        return self.provider.get_json(url)
 
-    def get_latest_release(self):
+    def select_latest_release(self, releases):
         result = None
         release_date = None
-
-        releases = self.get_releases()
         for release in releases:
             name = release['name']
             if not self.with_prerelease and release['prerelease']:
@@ -74,6 +319,98 @@ class GitHubRelease(Release):
                     result = release
         return result
 
+    def update_index(self, index):
+        """Add to the release index the releases published since
+        the last update, and remove the ones deleted from GitHub.
+        """
+        known_ids = index.known_ids(self.name)
+        page = 1
+        while True:
+            url = "{root}/repos/{org}/{repo}/releases?per_page={count}"
+            url = url.format(
+                root=self.provider.api_root,
+                org=self.organization,
+                repo=self.repository,
+                count=RELEASES_PER_PAGE,
+            )
+            if page > 1:
+                url += '&page={}'.format(page)
+            releases = self.provider.get_json(url)
+            index.update(self.name, releases)
+            if page == 1:
+                # the first page is the whole list when it is not full
+                index.remove_missing(
+                    self.name, releases,
+                    complete=len(releases) < RELEASES_PER_PAGE
+                )
+            if len(releases) < RELEASES_PER_PAGE:
+                break
+            if any(release['id'] in known_ids for release in releases):
+                break
+            page += 1
+
+    def is_due(self):
+        index = self.provider.release_index
+        if self.provider.polling is None or index is None:
+            return True
+        return index.is_due(self.name, time.time())
+
+    def record_poll(self, published):
+        """Schedule the next check of the repository, given the
+        publication timestamps of its releases.
+        """
+        index = self.provider.release_index
+        if self.provider.polling is None or index is None:
+            return
+        next_check = index.record_poll(
+            self.name, published, time.time(), **self.provider.polling
+        )
+        self.logger.debug("next check at %s", time.ctime(next_check))
+
+    def get_latest_release(self):
+        index = self.provider.release_index
+        if self.offline and index is not None:
+            # not due for a check, answered from the release index
+            return self.indexed_latest_release(index)
+        if self.prefetched is not None:
+            releases, complete = self.prefetched
+            result = self.select_latest_release(releases)
+            if result is not None or complete:
+                if index is not None:
+                    # so that it can be answered offline later on
+                    index.update(self.name, releases)
+                    self.record_poll([
+                        index.timestamp(release['published_at'])
+                        for release in releases
+                        if release['published_at'] and not release['draft']
+                    ])
+                return result
+        if index is not None:
+            self.update_index(index)
+            self.record_poll(index.publications(self.name))
+            return self.indexed_latest_release(index)
+        return self.select_latest_release(self.get_releases())
+
+    def indexed_latest_release(self, index):
+        return index.latest(
+            self.name,
+            with_prerelease=self.with_prerelease,
+            with_draft=self.with_draft,
+            name_filter=self.name_filter,
+        )
+
+    def reset(self):
+        super(GitHubRelease, self).reset()
+        self.prefetched = None
+
+    def resolve(self):
+        with self.provider.rate_limit.priority('install'):
+            return super(GitHubRelease, self).resolve()
+
+    def fetch(self, version):
+        with self.provider.rate_limit.priority('install'):
+            return super(GitHubRelease, self).fetch(version)
+
 
 class GitHubProvider(ReleaseProvider):
     def __init__(self, name, top_config, release_cls=GitHubRelease):
@@ -81,9 +418,252 @@ class GitHubProvider(ReleaseProvider):
         self.basic_auth = self.get('basic-auth')
         if self.basic_auth:
             self.basic_auth = tuple(self.basic_auth.split(':', 1))
+        self.http_cache = None
+        cache_path = self.cache_path('http')
+        if cache_path is not None and self.get('http-cache', True):
+            self.http_cache = HttpCache(cache_path)
+        self.release_index = None
+        cache_path = self.cache_path('releases.sqlite')
+        if cache_path is not None and self.get('release-index', True):
+            self.release_index = ReleaseIndex(cache_path, parse_date)
+        self.polling = None
+        polling = self.get('polling')
+        if polling:
+            if not isinstance(polling, dict):  # polling: true
+                polling = {}
+            self.polling = dict(
+                min_interval=polling.get('min-interval', 3600),
+                max_interval=polling.get('max-interval', 7 * 86400),
+            )
+        self.http_config = self.get('http') or {}
+        self.download_config = self.get('download') or {}
+        self.artifact_cache = None
+        cache_path = self.cache_path('artifacts')
+        cache_size = self.get('artifact-cache-size', 2048 * MiB)
+        if cache_path is not None and cache_size:
+            self.artifact_cache = ArtifactCache(cache_path, cache_size)
+        self.api_root = self.get('api-root', GITHUB_ROOT_API).rstrip('/')
+        self.download_root = self.get('download-root')
+        if self.download_root:
+            self.download_root = self.download_root.rstrip('/')
+        self.resolution = self.get('resolution', 'rest')
+        if self.resolution not in ('rest', 'graphql'):
+            raise Exception(
+                "Unknown GitHub resolution mode: {}".format(self.resolution)
+            )
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+        self.stats = collections.Counter()
+        self._stats_lock = threading.Lock()
+        rate_limit = self.get('rate-limit') or {}
+        self.rate_limit = RateLimitScheduler(
+            reserve=rate_limit.get('reserve', 0),
+            max_wait=rate_limit.get('max-wait', 900),
+            max_retries=rate_limit.get('max-retries', 5),
+        )
+
+    def create_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from requests.packages.urllib3.util.retry import Retry
+        pool_size = self.http_config.get('pool-size', 10)
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=self.http_config.get('retries', 3),
+                backoff_factor=self.http_config.get('backoff-factor', 0.3),
+                status_forcelist=(500, 502, 503, 504),
+            ),
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Accept-Encoding'] = 'gzip, deflate'
+        session.auth = self.basic_auth
+        session.hooks['response'].extend([
+            self.count_response,
+            trace.count_response,
+        ])
+        return session
+
+    def count(self, key, value=1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def count_response(self, response, *args, **kwargs):
+        self.count('http_requests')
+
+    def session(self, url):
+        """
+        :return: keep-alive session dedicated to the host of `url`,
+        shared by all releases of this provider.
+        """
+        netloc = urlparse(url).netloc
+        with self._sessions_lock:
+            session = self._sessions.get(netloc)
+            if session is None:
+                session = self.create_session()
+                self._sessions[netloc] = session
+        return session
+
+    def asset_url(self, asset):
+        """
+        :return: download URL of `asset`, relative to the 'download-root'
+        option when specified.
+        """
+        url = asset['browser_download_url']
+        if self.download_root and url.startswith(GITHUB_DOWNLOAD_ROOT + '/'):
+            url = self.download_root + url[len(GITHUB_DOWNLOAD_ROOT):]
+        return url
+
+    def api_session(self, url):
+        """
+        :return: session to query the GitHub API, whose requests are
+        paced according to the rate limit.
+        """
+        return self.rate_limit.session(self.session(url))
+
+    def collect_metrics(self, metrics):
+        labels = dict(provider=self.name)
+        metrics.set(
+            'http_requests_total', self.stats['http_requests'],
+            'HTTP requests sent', kind='counter', **labels
+        )
+        metrics.set(
+            'downloaded_bytes_total', self.stats['downloaded_bytes'],
+            'Bytes of release assets downloaded', kind='counter', **labels
+        )
+        metrics.set(
+            'github_rate_limit_wait_seconds_total', self.rate_limit.waited,
+            'Time spent waiting for the GitHub rate limit', kind='counter',
+            **labels
+        )
+        for resource, budget in self.rate_limit.budgets.items():
+            metrics.set(
+                'github_rate_limit_remaining', budget['remaining'],
+                'Requests remaining in the GitHub rate-limit window',
+                resource=resource, **labels
+            )
+            metrics.set(
+                'github_rate_limit_limit', budget['limit'],
+                'Requests allowed in a GitHub rate-limit window',
+                resource=resource, **labels
+            )
+        for cache_name, cache in [('http', self.http_cache),
+                                  ('artifact', self.artifact_cache)]:
+            if cache is None:
+                continue
+            metrics.set(
+                'cache_hits_total', cache.hits, 'Cache hits',
+                kind='counter', cache=cache_name, **labels
+            )
+            metrics.set(
+                'cache_misses_total', cache.misses, 'Cache misses',
+                kind='counter', cache=cache_name, **labels
+            )
+            lookups = cache.hits + cache.misses
+            if lookups:
+                metrics.set(
+                    'cache_hit_ratio', float(cache.hits) / lookups,
+                    'Ratio of cache lookups served from the cache',
+                    cache=cache_name, **labels
+                )
+
+    def close(self):
+        if self.rate_limit.requests:
+            logging.info(self.rate_limit.report())
+        if self.release_index is not None:
+            self.release_index.close()
+            self.release_index = None
+        with self._sessions_lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def get_json(self, url):
+        session = self.api_session(url)
+        with trace.span('api', 'http', url=url):
+            if self.http_cache is not None:
+                return self.http_cache.get_json(session, url)
+            response = session.get(url)
+            response.raise_for_status()
+            return response.json()
+
+    def prefetch(self, releases):
+        if self.resolution == 'graphql':
+            batch_size = self.get('graphql-batch-size', 50)
+            releases = [r for r in releases if r.prefetched is None]
+            for i in range(0, len(releases), batch_size):
+                if not self.prefetch_graphql(releases[i:i + batch_size]):
+                    break
+
+    @classmethod
+    def graphql_release(cls, node):
+        """convert a GraphQL release node to its REST API representation"""
+        return {
+            'id': node['databaseId'],
+            'name': node['name'],
+            'tag_name': node['tagName'],
+            'prerelease': node['isPrerelease'],
+            'draft': node['isDraft'],
+            'published_at': node['publishedAt'],
+            'assets': [
+                {
+                    'id': asset['id'],
+                    'name': asset['name'],
+                    'size': asset['size'],
+                    'content_type': asset['contentType'],
+                    'browser_download_url': asset['downloadUrl'],
+                }
+                for asset in node['releaseAssets']['nodes']
+            ],
+        }
+
+    def prefetch_graphql(self, releases):
+        """Retrieve latest releases of several repositories
+        with one aliased GraphQL query. Repositories the query could not
+        resolve are left to the REST API.
+
+        :return: `False` if the query failed, all repositories are then
+        left to the REST API.
+        """
+        import requests
+        variables = {'count': self.get('graphql-releases', 20)}
+        for i, release in enumerate(releases):
+            variables['o{}'.format(i)] = release.organization
+            variables['n{}'.format(i)] = release.repository
+        query = graphql_releases_query(len(releases))
+        url = self.api_root + '/graphql'
+        try:
+            with trace.span('graphql', 'http', repositories=len(releases)):
+                response = self.api_session(url).post(
+                    url,
+                    json={'query': query, 'variables': variables}
+                )
+            response.raise_for_status()
+            payload = response.json()
+        except (requests.RequestException, ValueError) as e:
+            logging.warning("GitHub GraphQL query failed, "
+                            "falling back to the REST API: %s", e)
+            return False
+        for error in payload.get('errors') or []:
+            logging.warning("GitHub GraphQL: %s", error.get('message'))
+        data = payload.get('data') or {}
+        for i, release in enumerate(releases):
+            repository = data.get('r{}'.format(i))
+            if repository is None:
+                continue
+            nodes = repository['releases']['nodes']
+            release.prefetched = (
+                map(self.graphql_release, nodes),
+                not repository['releases']['pageInfo']['hasNextPage']
+            )
+        return True
 
 
 class GitHubAsset(Fetcher):
+    __slots__ = ('grelease', '_checksums')
     providers = 'github'
     name = 'asset'
 
@@ -112,21 +692,104 @@ class GitHubAsset(Fetcher):
         if not any(assets):
             raise Exception("Didn't find asset matching requirements")
 
+    def download_ranges(self, asset, output_file):
+        """Download large assets in concurrent HTTP Range segments
+
+        :return: `True` if the asset has been downloaded, `False` if it
+        should be downloaded in a single stream instead.
+        """
+        config = self.provider.download_config
+        if asset.get('size', 0) < config.get('min-size', 32 * MiB):
+            return False
+        url = self.provider.asset_url(asset)
+        part_dir = self.provider.cache_path('downloads')
+        if part_dir is None:
+            part_path = output_file
+        else:
+            # partial downloads outlive the run to be resumed later on
+            part_path = osp.join(
+                part_dir, hashlib.sha1(url).hexdigest()
+            )
+        download = RangedDownload(
+            self.provider.session(url),
+            url,
+            part_path,
+            segment_size=config.get('segment-size', 8 * MiB),
+            jobs=config.get('jobs', 4),
+        )
+        if not download.run():
+            return False
+        if part_path != output_file:
+            shutil.move(part_path, output_file)
+        return True
+
+    def checksums(self):
+        """
+        :return: SHA-256 digests of the release assets, given by the
+        'checksums' asset of the release (SHA256SUMS by default).
+        """
+        if getattr(self, '_checksums', None) is not None:
+            return self._checksums
+        name = self.get('checksums', 'SHA256SUMS')
+        self._checksums = {}
+        for asset in self.grelease.get('assets', []):
+            if asset['name'] == name:
+                url = self.provider.asset_url(asset)
+                response = self.provider.session(url).get(url)
+                response.raise_for_status()
+                for line in response.text.splitlines():
+                    fields = line.split()
+                    if len(fields) == 2:
+                        digest, file_name = fields
+                        self._checksums[file_name.lstrip('*')] = digest
+                break
+        else:
+            if 'checksums' in self:
+                raise Exception(
+                    "Could not find checksums asset {}".format(name)
+                )
+        return self._checksums
+
+    def expected_sha256(self, asset):
+        sha256 = self.get('sha256')
+        if sha256 is not None:
+            return sha256
+        return self.checksums().get(asset['name'])
+
+    def fetch_asset(self, asset, output_file, sha256):
+        """Download `asset` in `output_file`
+
+        :return: tuple (content type, SHA-256 digest)
+        """
+        url = self.provider.asset_url(asset)
+        if self.download_ranges(asset, output_file):
+            digest = file_sha256(output_file)
+            check_sha256(output_file, digest, sha256)
+            return asset.get('content_type'), digest
+        return download_file(
+            self.provider.session(url), url, output_file, sha256
+        )
+
     def download_asset(self, asset, output_directory):
-        session = requests.Session()
-        session.auth = self.provider.basic_auth
+        url = self.provider.asset_url(asset)
         output_file = osp.join(output_directory, self['file'])
-        with temp_dir(cleanup=False) as download_dir:
-            file_path, content_type = download_http_url(
-                asset['browser_download_url'],
-                session,
-                download_dir,
-                filename=self['file']
-            )
-            dir_path = osp.dirname(output_file)
-            if not osp.isdir(dir_path):
-                os.makedirs(dir_path)
-            shutil.move(file_path, output_file)
+        dir_path = osp.dirname(output_file)
+        if not osp.isdir(dir_path):
+            os.makedirs(dir_path)
+        sha256 = self.expected_sha256(asset)
+        cache = self.provider.artifact_cache
+        cached = None
+        if cache is not None:
+            key = cache.key(asset.get('id') or url, asset.get('size'), sha256)
+            cached = cache.get(key, output_file)
+        if cached is not None:
+            self.release.logger.info("using cached asset %s", asset['name'])
+            content_type = cached['content_type']
+        else:
+            content_type, digest = self.fetch_asset(asset, output_file, sha256)
+            self.provider.count('downloaded_bytes', osp.getsize(output_file))
+            if cache is not None:
+                cache.put(key, output_file, digest, content_type=content_type)
         if content_type in ['application/octet-stream']:
             st = os.stat(output_file)
             os.chmod(
@@ -0,0 +1,339 @@
+"""Caching relay of the GitHub API and release assets.
+
+Hosts of a fleet point their GitHub provider at the relay with:
+
+    github:
+      api-root: http://relay:8080/api
+      download-root: http://relay:8080/download
+
+Metadata is served from memory for `metadata-ttl` seconds, then
+revalidated against GitHub with conditional requests. Assets are
+downloaded once and served from the artifact cache, with support of
+single byte ranges. Concurrent requests of the same resource are
+coalesced into one upstream request.
+
+Only the releases configured in the relayed provider are served: their
+release listings, assets, and GraphQL queries of their latest releases.
+"""
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import hashlib
+import json
+import logging
+import os
+import re
+from SocketServer import ThreadingMixIn
+import sys
+import tempfile
+import threading
+import time
+
+from .. toolbox import CHUNK_SIZE, download_file, makedirs
+from . github import GITHUB_DOWNLOAD_ROOT, graphql_releases_query
+
+BYTE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+RELEASES_PATH = re.compile(r'^/repos/([^/?]+)/([^/?]+)/releases(\?.*)?$')
+ASSET_PATH = re.compile(r'^/([^/]+)/([^/]+)/releases/download/')
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls sharing the same key: the first caller
+    executes the function while the others wait for its outcome.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executions = 0
+
+    def do(self, key, func, *args):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.executions += 1
+        if leader:
+            try:
+                call.result = func(*args)
+            except Exception:
+                call.exc_info = sys.exc_info()
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.event.set()
+        else:
+            call.event.wait()
+        if call.exc_info is not None:
+            raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+        return call.result
+
+
+class GitHubRelay(object):
+    """Resources served by the relay, fetched with the GitHub `provider`
+    of the relay configuration.
+    """
+    def __init__(self, provider, metadata_ttl=60):
+        if provider.artifact_cache is None:
+            raise Exception(
+                "relay requires the artifact cache, "
+                "check 'cache-dir' and 'artifact-cache-size' options"
+            )
+        self.provider = provider
+        self.metadata_ttl = metadata_ttl
+        self.download_root = provider.download_root or GITHUB_DOWNLOAD_ROOT
+        self.staging_dir = provider.cache_path('relay')
+        self.metadata = {}
+        self.flights = SingleFlight()
+
+    def is_relayed(self, organization, repository):
+        return '{}/{}'.format(organization, repository) in \
+            self.provider.releases
+
+    def is_relayed_path(self, pattern, path):
+        """:return: whether `path` matches `pattern`, and belongs to a
+        relayed repository
+        """
+        match = pattern.match(path)
+        return match is not None and self.is_relayed(*match.groups()[:2])
+
+    def is_relayed_query(self, body):
+        """:return: whether GraphQL request `body` is a query of the
+        latest releases of relayed repositories, as sent by providers.
+        """
+        try:
+            payload = json.loads(body)
+            variables = payload['variables']
+            count = (len(variables) - 1) // 2
+            names = [
+                (variables.pop('o{}'.format(i)),
+                 variables.pop('n{}'.format(i)))
+                for i in range(count)
+            ]
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return False
+        return (
+            sorted(payload) == ['query', 'variables'] and
+            payload['query'] == graphql_releases_query(count) and
+            variables.keys() == ['count'] and
+            isinstance(variables['count'], int) and
+            all(self.is_relayed(*name) for name in names)
+        )
+
+    def get_metadata(self, path):
+        """
+        :param path: API path, with its query string
+        :return: tuple (expiration time, JSON body, ETag)
+        """
+        url = self.provider.api_root + path
+        entry = self.metadata.get(url)
+        if entry is not None and entry[0] > time.time():
+            return entry
+        return self.flights.do(('api', url), self.fetch_metadata, url)
+
+    def fetch_metadata(self, url):
+        body = json.dumps(self.provider.get_json(url))
+        entry = (
+            time.time() + self.metadata_ttl,
+            body,
+            '"{}"'.format(hashlib.sha1(body).hexdigest()),
+        )
+        self.metadata[url] = entry
+        return entry
+
+    def graphql(self, body):
+        """:return: tuple (status, response body) of a GraphQL query"""
+        key = ('graphql', hashlib.sha1(body).hexdigest())
+        return self.flights.do(key, self.post_graphql, body)
+
+    def post_graphql(self, body):
+        url = self.provider.api_root + '/graphql'
+        response = self.provider.api_session(url).post(
+            url,
+            data=body,
+            headers={'Content-Type': 'application/json'}
+        )
+        return response.status_code, response.content
+
+    def open_asset(self, path):
+        """
+        :param path: asset path, relative to the download root
+        :return: tuple (opened file, metadata)
+        """
+        url = self.download_root + path
+        cache = self.provider.artifact_cache
+        key = cache.key('relay', url)
+        for attempt in range(2):
+            found = cache.lookup(key)
+            if found is None:
+                self.flights.do(('asset', url), self.fetch_asset, url, key)
+                found = cache.lookup(key)
+            if found is not None:
+                try:
+                    return open(found[0], 'rb'), found[1]
+                except IOError:
+                    pass  # evicted in the meantime
+        raise Exception("Could not cache asset {}".format(url))
+
+    def fetch_asset(self, url, key):
+        makedirs(self.staging_dir)
+        fd, path = tempfile.mkstemp(dir=self.staging_dir)
+        os.close(fd)
+        try:
+            content_type, digest = download_file(
+                self.provider.session(url), url, path
+            )
+            self.provider.artifact_cache.put(
+                key, path, digest, content_type=content_type
+            )
+        finally:
+            os.remove(path)
+
+
+class RelayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'easy_upgrade-relay'
+
+    def log_message(self, format, *args):
+        logging.debug("%s - " + format, self.client_address[0], *args)
+
+    @property
+    def relay(self):
+        return self.server.relay
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_HEAD(self):
+        self.dispatch(head=True)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        if self.path != '/api/graphql':
+            return self.send_error(404)
+        if not self.relay.is_relayed_query(body):
+            return self.send_error(403, 'Only release queries are relayed')
+        try:
+            status, content = self.relay.graphql(body)
+        except Exception as e:
+            return self.upstream_error(e)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def dispatch(self, head=False):
+        try:
+            if self.path.startswith('/api/'):
+                path = self.path[len('/api'):]
+                if self.relay.is_relayed_path(RELEASES_PATH, path):
+                    return self.serve_metadata(path, head)
+            elif self.path.startswith('/download/'):
+                path = self.path[len('/download'):]
+                if self.relay.is_relayed_path(ASSET_PATH, path):
+                    return self.serve_asset(path, head)
+            self.send_error(404)
+        except Exception as e:
+            self.upstream_error(e)
+
+    def upstream_error(self, error):
+        response = getattr(error, 'response', None)
+        if response is not None:
+            self.send_error(response.status_code)
+        else:
+            logging.exception("relay error on %s", self.path)
+            self.send_error(502, str(error))
+
+    def serve_metadata(self, path, head):
+        _, body, etag = self.relay.get_metadata(path)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def byte_range(self, size):
+        """
+        :return: tuple (start, end) of the requested range, end excluded,
+        `None` to serve the whole file.
+        """
+        match = BYTE_RANGE.match(self.headers.get('Range') or '')
+        if match is None:
+            return None
+        start, end = match.groups()
+        if not start and not end:
+            return None
+        if not start:
+            return max(0, size - int(end)), size
+        end = size if not end else min(size, int(end) + 1)
+        return int(start), end
+
+    def serve_asset(self, path, head):
+        istr, metadata = self.relay.open_asset(path)
+        with istr:
+            size = os.fstat(istr.fileno()).st_size
+            byte_range = self.byte_range(size)
+            if byte_range is None:
+                start, end = 0, size
+                self.send_response(200)
+            elif byte_range[0] >= byte_range[1]:
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{}'.format(size))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            else:
+                start, end = byte_range
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                    start, end - 1, size
+                ))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Type', metadata.get('content_type') or
+                             'application/octet-stream')
+            self.send_header('Content-Length', str(end - start))
+            self.end_headers()
+            if head:
+                return
+            istr.seek(start)
+            remaining = end - start
+            while remaining:
+                chunk = istr.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+
+class RelayServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, relay, address):
+        HTTPServer.__init__(self, address, RelayHandler)
+        self.relay = relay
+
+
+def serve(provider, bind='127.0.0.1:8080', metadata_ttl=60):
+    host, port = bind.rsplit(':', 1)
+    relay = GitHubRelay(provider, metadata_ttl)
+    server = RelayServer(relay, (host, int(port)))
+    logging.info("relaying GitHub on http://%s:%s", *server.server_address)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
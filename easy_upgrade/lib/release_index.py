@@ -0,0 +1,229 @@
+import calendar
+import cPickle as pickle
+import os.path as osp
+import sqlite3
+import threading
+
+from .. toolbox import makedirs
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS releases (
+    repository TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    name TEXT,
+    prerelease INTEGER NOT NULL,
+    draft INTEGER NOT NULL,
+    published_at INTEGER,
+    payload BLOB NOT NULL,
+    PRIMARY KEY (repository, id)
+);
+CREATE INDEX IF NOT EXISTS releases_latest
+ON releases (repository, draft, prerelease, published_at);
+CREATE INDEX IF NOT EXISTS releases_name
+ON releases (repository, name);
+CREATE TABLE IF NOT EXISTS polls (
+    repository TEXT PRIMARY KEY,
+    checked_at INTEGER NOT NULL,
+    next_check INTEGER NOT NULL,
+    interval INTEGER NOT NULL,
+    latest INTEGER
+);
+"""
+
+CADENCE_RELEASES = 10
+
+
+def glob_pattern(pattern):
+    """convert a `fnmatch` pattern to its SQLite GLOB equivalent"""
+    return pattern.replace('[!', '[^')
+
+
+def release_cadence(published):
+    """
+    :param published: publication timestamps of a repository
+    :return: median delay between two consecutive releases among the
+    most recent ones, `None` if there are less than two.
+    """
+    published = sorted(published)[-CADENCE_RELEASES:]
+    gaps = sorted(b - a for a, b in zip(published, published[1:]))
+    if not gaps:
+        return None
+    return gaps[len(gaps) // 2]
+
+
+def poll_interval(published, now, previous=None, min_interval=3600,
+                  max_interval=7 * 86400):
+    """Delay before the next check of a repository
+
+    The interval is reset to `min_interval` when a new release shows up,
+    then doubles at every check finding nothing new. It is capped to a
+    quarter of the release cadence while a release is expected, that is
+    until twice the cadence has passed since the latest release, and to
+    `max_interval` otherwise.
+
+    :param published: publication timestamps of the repository releases
+    :param previous: previous poll state, as returned by
+    `ReleaseIndex.poll`
+    """
+    latest = max(published) if published else None
+    ceiling = max_interval
+    cadence = release_cadence(published)
+    if cadence is not None and now - latest < 2 * cadence:
+        ceiling = min(ceiling, cadence // 4)
+    if previous is None or latest > previous['latest']:
+        interval = min_interval
+    else:
+        interval = min(previous['interval'] * 2, ceiling)
+    return max(min_interval, interval)
+
+
+class ReleaseIndex(object):
+    """SQLite index of the releases of several repositories.
+
+    Releases are stored with pre-parsed publication timestamps, so that
+    selecting the latest release matching a name filter is a single
+    indexed query.
+    """
+    def __init__(self, path, parse_date):
+        makedirs(osp.dirname(path))
+        self.parse_date = parse_date
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            self.db.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def timestamp(self, date):
+        if date is None:
+            return None
+        return calendar.timegm(self.parse_date(date).utctimetuple())
+
+    def publications(self, repository):
+        """:return: publication timestamps of the repository releases"""
+        with self.lock:
+            cursor = self.db.execute(
+                'SELECT published_at FROM releases WHERE repository = ? '
+                'AND draft = 0 AND published_at IS NOT NULL',
+                (repository,)
+            )
+            return [row[0] for row in cursor]
+
+    def poll(self, repository):
+        """
+        :return: dictionary describing the last check of `repository`,
+        `None` if it was never checked.
+        """
+        with self.lock:
+            row = self.db.execute(
+                'SELECT checked_at, next_check, interval, latest '
+                'FROM polls WHERE repository = ?',
+                (repository,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['checked_at', 'next_check', 'interval', 'latest'],
+                        row))
+
+    def record_poll(self, repository, published, now, **kwargs):
+        """Record a check of `repository` and schedule the next one
+
+        :param published: publication timestamps of the releases
+        :param kwargs: optional arguments given to `poll_interval`
+        :return: time of the next check
+        """
+        now = int(now)
+        interval = poll_interval(published, now, self.poll(repository),
+                                 **kwargs)
+        latest = max(published) if published else None
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO polls VALUES (?, ?, ?, ?, ?)',
+                (repository, now, now + interval, interval, latest)
+            )
+        return now + interval
+
+    def is_due(self, repository, now):
+        poll = self.poll(repository)
+        return poll is None or poll['next_check'] <= now
+
+    def known_ids(self, repository):
+        with self.lock:
+            cursor = self.db.execute(
+                'SELECT id FROM releases WHERE repository = ?',
+                (repository,)
+            )
+            return set(row[0] for row in cursor)
+
+    def update(self, repository, releases):
+        rows = [
+            (
+                repository,
+                release['id'],
+                release['name'],
+                int(bool(release['prerelease'])),
+                int(bool(release['draft'])),
+                self.timestamp(release['published_at']),
+                sqlite3.Binary(
+                    pickle.dumps(release, pickle.HIGHEST_PROTOCOL)
+                ),
+            )
+            for release in releases
+        ]
+        with self.lock, self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO releases VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+
+    def remove_missing(self, repository, releases, complete=False):
+        """Remove releases of `repository` deleted since they were indexed
+
+        :param releases: most recent releases of the repository, as
+        listed by GitHub.
+        :param complete: whether `releases` is the whole list. Otherwise,
+        only indexed releases published after the oldest of `releases`
+        are considered.
+        """
+        query = 'DELETE FROM releases WHERE repository = ?'
+        params = [repository]
+        if not complete:
+            published = [
+                self.timestamp(release['published_at'])
+                for release in releases if release['published_at']
+            ]
+            if not published:
+                return
+            query += ' AND published_at >= ?'
+            params.append(min(published))
+        if releases:
+            query += ' AND id NOT IN ({})'.format(
+                ', '.join('?' * len(releases))
+            )
+            params += [release['id'] for release in releases]
+        with self.lock, self.db:
+            self.db.execute(query, params)
+
+    def latest(self, repository, with_prerelease=False, with_draft=False,
+               name_filter=None):
+        """
+        :return: most recently published release matching the criteria,
+        `None` if there is none.
+        """
+        query = 'SELECT payload FROM releases WHERE repository = ?'
+        params = [repository]
+        if not with_draft:
+            query += ' AND draft = 0'
+        if not with_prerelease:
+            query += ' AND prerelease = 0'
+        if name_filter:
+            query += ' AND name GLOB ?'
+            params.append(glob_pattern(name_filter))
+        query += ' ORDER BY published_at DESC LIMIT 1'
+        with self.lock:
+            row = self.db.execute(query, params).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(str(row[0]))
@@ -1,14 +1,228 @@
 
 import os
 import os.path as osp
-import shutil
 import subprocess
 
-from .. api import Installer, parse_version
-from .. toolbox import find_executable, pushd
+from .. api import Installer
+from .. manifest import Manifest
+from .. import trace
+from .. toolbox import find_executable, makedirs, move_tree
+
+
+def package_files(package_dir):
+    """
+    :return: paths of the files of a package, relative to its directory.
+    Symbolic links are considered as files.
+    """
+    files = set()
+    for root, dirs, names in os.walk(package_dir):
+        rel_root = osp.relpath(root, package_dir)
+        for name in names + [d for d in dirs if osp.islink(osp.join(root, d))]:
+            files.add(osp.normpath(osp.join(rel_root, name)))
+    return files
+
+
+class TargetView(object):
+    """State of a target directory once the planned operations are
+    applied. Operations are recorded, the file system is left untouched.
+    """
+    def __init__(self, farm):
+        self.farm = farm
+        self.overlay = {}
+        self.operations = []
+
+    def state(self, rel_path):
+        """
+        :return: `None` if `rel_path` does not exist, a tuple
+        (kind, owner) otherwise, where `kind` is either 'dir', 'file'
+        or 'link'. `owner` is given for links, see `SymlinkFarm.owner`.
+        """
+        if rel_path in self.overlay:
+            return self.overlay[rel_path]
+        parent = osp.dirname(rel_path)
+        while parent:
+            if parent in self.overlay:
+                # replaced entry, original content is gone
+                return None
+            parent = osp.dirname(parent)
+        path = osp.join(self.farm.target_dir, rel_path)
+        if osp.islink(path):
+            return 'link', self.farm.owner(path)
+        elif osp.isdir(path):
+            return 'dir', None
+        elif osp.lexists(path):
+            return 'file', None
+
+    def link(self, rel_path, owner):
+        self.operations.append(
+            ('link', rel_path, self.farm.link_dest(rel_path, owner))
+        )
+        self.overlay[rel_path] = ('link', owner)
+
+    def unlink(self, rel_path):
+        self.operations.append(('unlink', rel_path, None))
+        self.overlay[rel_path] = None
+
+    def mkdir(self, rel_path):
+        self.operations.append(('mkdir', rel_path, None))
+        self.overlay[rel_path] = ('dir', None)
+
+    def prune(self, rel_path):
+        self.operations.append(('prune', rel_path, None))
+
+
+class SymlinkFarm(object):
+    """In-process equivalent of `stow`, managing the symbolic links of
+    the packages of `stow_dir` into `target_dir`.
+
+    Switching from one package to another only touches the links that
+    differ between both trees. Directories folded into a single link by
+    `stow` are unfolded when needed. Conflicts are all detected before
+    the target directory is modified.
+    """
+    def __init__(self, target_dir, stow_dir):
+        self.target_dir = target_dir
+        self.stow_dir = stow_dir
+
+    def owner(self, path):
+        """
+        :return: tuple (package, path in package) the link `path` points
+        to, `None` if it does not point inside the stow directory.
+        """
+        dest = osp.normpath(osp.join(osp.dirname(path), os.readlink(path)))
+        rel = osp.relpath(dest, self.stow_dir)
+        if rel == os.curdir or rel.split(os.sep)[0] == os.pardir:
+            return None
+        components = rel.split(os.sep, 1)
+        return components[0], components[1] if len(components) > 1 else ''
+
+    def link_dest(self, rel_path, owner):
+        return osp.relpath(
+            osp.join(self.stow_dir, *owner),
+            osp.dirname(osp.join(self.target_dir, rel_path))
+        )
+
+    def plan(self, package, previous=()):
+        """Compute the operations replacing the links of the `previous`
+        packages by the ones of `package`.
+
+        :return: list of tuples (operation, relative path, argument)
+        """
+        previous = set(previous) - set([package])
+        view = TargetView(self)
+        conflicts = []
+
+        def prepare_dir(rel_dir):
+            """:return: `True` if `rel_dir` can receive links"""
+            if not rel_dir:
+                return True
+            if not prepare_dir(osp.dirname(rel_dir)):
+                return False
+            state = view.state(rel_dir)
+            if state is None:
+                view.mkdir(rel_dir)
+                return True
+            kind, owner = state
+            if kind == 'dir':
+                return True
+            if kind == 'link' and owner is not None:
+                source = osp.join(self.stow_dir, *owner)
+                if owner[0] in previous:
+                    view.unlink(rel_dir)
+                    view.mkdir(rel_dir)
+                    return True
+                elif osp.isdir(source):
+                    # unfold directory of another package
+                    view.unlink(rel_dir)
+                    view.mkdir(rel_dir)
+                    for name in sorted(os.listdir(source)):
+                        view.link(
+                            osp.join(rel_dir, name),
+                            (owner[0], osp.join(owner[1], name))
+                        )
+                    return True
+            conflicts.append(
+                "existing target is not a directory: " + rel_dir
+            )
+            return False
+
+        new_files = set()
+        if package is not None:
+            new_files = package_files(osp.join(self.stow_dir, package))
+        for rel_path in sorted(new_files):
+            if not prepare_dir(osp.dirname(rel_path)):
+                continue
+            state = view.state(rel_path)
+            if state is None:
+                view.link(rel_path, (package, rel_path))
+                continue
+            kind, owner = state
+            if kind == 'link' and owner == (package, rel_path):
+                continue
+            elif kind == 'link' and owner and owner[0] in previous:
+                view.unlink(rel_path)
+                view.link(rel_path, (package, rel_path))
+            elif kind == 'link' and owner:
+                conflicts.append(
+                    "existing target is stowed to a different package: "
+                    "{} => {}".format(rel_path, osp.join(*owner))
+                )
+            else:
+                conflicts.append(
+                    "existing target is not owned by stow: " + rel_path
+                )
+        if conflicts:
+            raise Exception(
+                "Cannot stow {} in {}:\n  ".format(package, self.target_dir) +
+                "\n  ".join(conflicts)
+            )
+        for old in sorted(previous):
+            old_files = package_files(osp.join(self.stow_dir, old))
+            for rel_path in sorted(old_files):
+                # link may be the file itself, or a folded parent directory
+                components = rel_path.split(os.sep)
+                for i in range(1, len(components) + 1):
+                    current = os.sep.join(components[:i])
+                    state = view.state(current)
+                    if state is None or state[0] != 'dir':
+                        break
+                if state is not None and state[0] == 'link' and \
+                        state[1] is not None and state[1][0] in previous:
+                    view.unlink(current)
+                    view.prune(osp.dirname(current))
+        return view.operations
+
+    def apply(self, operations):
+        with trace.span('symlink_farm', 'filesystem',
+                        operations=len(operations)):
+            for operation, rel_path, arg in operations:
+                path = osp.join(self.target_dir, rel_path)
+                if operation == 'link':
+                    os.symlink(arg, path)
+                elif operation == 'unlink':
+                    os.remove(path)
+                elif operation == 'mkdir':
+                    os.mkdir(path)
+                elif operation == 'prune':
+                    # remove directories left empty
+                    while rel_path and not osp.islink(path) and \
+                            osp.isdir(path) and not os.listdir(path):
+                        os.rmdir(path)
+                        rel_path = osp.dirname(rel_path)
+                        path = osp.join(self.target_dir, rel_path)
+
+    def switch(self, package, previous=()):
+        """Stow `package` in place of the `previous` ones"""
+        self.apply(self.plan(package, previous))
+
+    def unstow(self, *packages):
+        self.apply(self.plan(None, packages))
 
 
 class StowInstaller(Installer):
+    __slots__ = (
+        'path', 'pkg_path', 'activate', 'engine', '_executable', '_manifest',
+    )
     name = 'stow'
 
     def __init__(self, provider, release, config):
@@ -16,41 +230,93 @@ class StowInstaller(Installer):
         self.path = config['path']
         self.pkg_path = osp.join(self.path, 'stow')
         self.activate = config.get('activate', True)
-        self.executable = find_executable(
-            *config.get('stow', ('stow', 'xstow'))
-        )
+        self.engine = config.get('engine', 'stow')
+        if self.engine not in ('stow', 'native'):
+            raise Exception("Unknown stow engine: {}".format(self.engine))
+        self._executable = None
+        self._manifest = None
+
+    @property
+    def executable(self):
+        if self._executable is None:
+            self._executable = find_executable(
+                *self.get('stow', ('stow', 'xstow'))
+            )
+        return self._executable
 
     def release_dir_name(self, version=''):
         return '{}-{}'.format(self.release.pkg_name, version)
 
-    def get_local_versions(self):
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            self._manifest = Manifest(osp.join(
+                self.pkg_path,
+                '.manifests',
+                '{}.json'.format(self.release.pkg_name)
+            ))
+        return self._manifest
+
+    def sibling_prefixes(self):
+        """
+        :return: directory prefixes of the packages having a manifest
+        whose name starts with the one of this package, for instance
+        `foo-bar-` for package `foo`.
+        """
+        prefix = self.release_dir_name()
+        manifests = osp.dirname(self.manifest.path)
+        if not osp.isdir(manifests):
+            return []
+        siblings = []
+        for f in os.listdir(manifests):
+            name, ext = osp.splitext(f)
+            if ext == '.json' and name != self.release.pkg_name and \
+                    name.startswith(prefix):
+                siblings.append(name + '-')
+        return siblings
+
+    def scan_local_versions(self):
+        """
+        :return: versions found in stow packages directory. Directories
+        of known sibling packages are ignored, so that `foo-bar-1.0` is
+        not considered as a version of `foo` once `foo-bar` has a manifest.
+        """
         versions = []
-        if not osp.isdir(self.pkg_path):
-            return versions
+        prefix = self.release_dir_name()
+        siblings = self.sibling_prefixes()
         for p in os.listdir(self.pkg_path):
-            fp = osp.join(self.pkg_path, p)
-            if osp.isdir(fp) and p.startswith(self.release_dir_name()):
-                versions.append(p[len(self.release_dir_name()):])
+            if p.startswith(prefix) and \
+                    not any(p.startswith(s) for s in siblings) and \
+                    osp.isdir(osp.join(self.pkg_path, p)):
+                versions.append(p[len(prefix):])
         return versions
 
+    def get_local_versions(self):
+        if not self.manifest.exists():
+            if not osp.isdir(self.pkg_path):
+                return []
+            # package installed before manifests were introduced
+            for version in self.scan_local_versions():
+                self.manifest.add_version(
+                    version,
+                    osp.join(self.pkg_path, self.release_dir_name(version))
+                )
+            self.manifest.save()
+        return self.manifest.versions()
+
     def installed_version(self):
         """
         :return: most recent version available in stow packages directory.
         :rtype: string
         """
-        installed_version = reduce(
-            lambda a, b: a if a > b else b,
-            map(
-                lambda v: (parse_version(v), v),
-                self.get_local_versions()
-            ),
-            (None, None)
-        )
-        return installed_version[1]
+        return self.release.version_scheme.max(self.get_local_versions())
 
     def _stow(self, *args):
-        with pushd(self.pkg_path):
-            subprocess.check_call([self.executable] + list(args))
+        with trace.span('stow', 'subprocess', args=' '.join(args)):
+            subprocess.check_call(
+                [self.executable] + list(args),
+                cwd=self.pkg_path
+            )
 
     def disable_package(self, version):
         self._stow('-D', self.release_dir_name(version))
@@ -58,6 +324,13 @@ class StowInstaller(Installer):
     def enable_package(self, version):
         self._stow(self.release_dir_name(version))
 
+    def staging_dir(self):
+        """fetch releases on the filesystem of the stow directory, so
+        that they can be moved there afterward"""
+        path = osp.join(self.pkg_path, '.staging')
+        makedirs(path)
+        return path
+
     def install(self, fetched_items_path, version):
         rdir_name = self.release_dir_name(version)
         release_path = osp.join(self.pkg_path, rdir_name)
@@ -71,10 +344,38 @@ class StowInstaller(Installer):
                     release_path
                 )
             )
-        shutil.copytree(fetched_items_path, release_path)
+        move_tree(fetched_items_path, release_path)
+        self.manifest.add_version(version, release_path)
         if self.activate:
+            self.activate_version(version)
+        return release_path
+
+    def activate_version(self, version):
+        active = self.manifest.active
+        if active is not None:
+            versions_to_disable = set([active])
+        else:
+            # active version unknown, disable all of them
             versions_to_disable = set(self.get_local_versions())
-            versions_to_disable.remove(version)
+        versions_to_disable.discard(version)
+        if self.engine == 'native':
+            SymlinkFarm(self.path, self.pkg_path).switch(
+                self.release_dir_name(version),
+                map(self.release_dir_name, versions_to_disable)
+            )
+        else:
             for v in versions_to_disable:
                 self.disable_package(v)
             self.enable_package(version)
+        self.manifest.activate(version)
+
+    def rollback(self):
+        version = self.manifest.previous
+        if version is None or version not in self.get_local_versions():
+            raise Exception(
+                "No previous version of {} to roll back to".format(
+                    self.release.name
+                )
+            )
+        self.activate_version(version)
+        return version
@@ -0,0 +1,165 @@
+from contextlib import contextmanager
+import json
+import os
+import os.path as osp
+import threading
+import time
+
+from .cache import atomic_write
+from .toolbox import file_sha256
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    return dict(size=st.st_size, mtime=st.st_mtime)
+
+
+def tree_stamps(path):
+    """
+    :return: dictionary giving the size and modification time of every
+    file of directory `path` by relative path, `None` for symbolic links.
+    """
+    stamps = {}
+    for root, dirs, files in os.walk(path):
+        for name in files + [d for d in dirs if osp.islink(osp.join(root, d))]:
+            f = osp.join(root, name)
+            rel_path = osp.relpath(f, path)
+            stamps[rel_path] = None if osp.islink(f) else file_stamp(f)
+    return stamps
+
+
+class Manifest(object):
+    """Installed state of a package, stored in a JSON file:
+
+        {
+            "active": "1.1",
+            "previous": "1.0",
+            "versions": {
+                "1.1": {
+                    "installed_at": 1445161919,
+                    "path": "/usr/local/stow/tool-1.1",
+                    "files": {
+                        "bin/tool": {
+                            "size": 1024,
+                            "mtime": 1445161900.0,
+                            "sha256": "<SHA-256 digest>"
+                        }
+                    }
+                }
+            }
+        }
+
+    Files are only stat'ed when a version is added, their digest is
+    computed on demand by `digests`. Modifications are made in
+    transactions, readers never see a partially written manifest.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self._data = None
+
+    def exists(self):
+        return osp.isfile(self.path)
+
+    @property
+    def data(self):
+        with self.lock:
+            if self._data is None:
+                try:
+                    with open(self.path) as istr:
+                        self._data = json.load(istr)
+                except IOError:
+                    self._data = {}
+                self._data.setdefault('active', None)
+                self._data.setdefault('previous', None)
+                self._data.setdefault('versions', {})
+            return self._data
+
+    @contextmanager
+    def transaction(self):
+        """Yield manifest data, saved if the block succeeds"""
+        with self.lock:
+            self._data = None
+            data = self.data
+            try:
+                yield data
+            except Exception:
+                self._data = None
+                raise
+            atomic_write(self.path, json.dumps(data, indent=2,
+                                               sort_keys=True))
+
+    def save(self):
+        with self.transaction():
+            pass
+
+    @property
+    def active(self):
+        return self.data['active']
+
+    @property
+    def previous(self):
+        """version active before the current one"""
+        return self.data['previous']
+
+    def versions(self):
+        return self.data['versions'].keys()
+
+    def files(self, version):
+        return self.data['versions'][version]['files']
+
+    def add_version(self, version, path, digests=None):
+        """Record `version` of the package, installed in `path`
+
+        :param digests: SHA-256 digests of files already known, by
+        relative path.
+        """
+        files = tree_stamps(path)
+        for rel_path, digest in (digests or {}).items():
+            if files.get(rel_path) is not None:
+                files[rel_path]['sha256'] = digest
+        with self.transaction() as data:
+            data['versions'][version] = dict(
+                installed_at=int(time.time()),
+                path=path,
+                files=files,
+            )
+
+    def digests(self, version):
+        """
+        :return: dictionary giving the SHA-256 digest of every file of
+        `version` by relative path, `None` for symbolic links and for
+        files modified since they were installed.
+        """
+        with self.transaction() as data:
+            entry = data['versions'][version]
+            digests = {}
+            for rel_path, stamp in entry['files'].items():
+                if stamp is None:
+                    digests[rel_path] = None
+                    continue
+                if 'sha256' not in stamp:
+                    f = osp.join(entry['path'], rel_path)
+                    try:
+                        if file_stamp(f) == dict(size=stamp['size'],
+                                                 mtime=stamp['mtime']):
+                            stamp['sha256'] = file_sha256(f)
+                    except OSError:
+                        pass
+                digests[rel_path] = stamp.get('sha256')
+            return digests
+
+    def remove_version(self, version):
+        with self.transaction() as data:
+            data['versions'].pop(version, None)
+            for key in ['active', 'previous']:
+                if data[key] == version:
+                    data[key] = None
+
+    def activate(self, version):
+        with self.transaction() as data:
+            if version is not None and version not in data['versions']:
+                raise Exception("Unknown version: {}".format(version))
+            if data['active'] != version:
+                data['previous'] = data['active']
+                data['active'] = version
@@ -0,0 +1,201 @@
+"""Metrics of runs, exported in the Prometheus text format.
+
+The file is meant to be collected by the node_exporter textfile
+collector. It is enabled by the top-level `metrics-file` option, or the
+--metrics-file command line option:
+
+    metrics-file: /var/lib/node_exporter/textfile/easy_upgrade.prom
+"""
+import collections
+import os
+import threading
+import time
+
+from .cache import atomic_write
+
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+PREFIX = 'easy_upgrade_'
+
+
+def escape(value):
+    return unicode(value).replace('\\', r'\\').replace('\n', r'\n') \
+        .replace('"', r'\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(key, escape(value)) for key, value in labels
+    ) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return repr(value)
+
+
+class Family(object):
+    """Samples of a metric, by label values"""
+    def __init__(self, name, kind, description):
+        self.name = name
+        self.kind = kind
+        self.description = description
+        self.samples = collections.OrderedDict()
+
+
+class Metrics(object):
+    """Registry of gauges, counters and histograms, safe to update from
+    several threads.
+    """
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.families = collections.OrderedDict()
+
+    def family(self, name, kind, description):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = Family(
+                PREFIX + name, kind, description
+            )
+        elif family.kind != kind:
+            raise Exception("Metric {} is a {}, not a {}".format(
+                name, family.kind, kind
+            ))
+        return family
+
+    def set(self, name, value, description='', kind='gauge', **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.family(name, kind, description).samples[key] = value
+
+    def inc(self, name, value=1, description='', **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            samples = self.family(name, 'counter', description).samples
+            samples[key] = samples.get(key, 0) + value
+
+    def observe(self, name, value, description='',
+                buckets=DURATION_BUCKETS, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            samples = self.family(name, 'histogram', description).samples
+            histogram = samples.get(key)
+            if histogram is None:
+                histogram = samples[key] = dict(
+                    buckets=collections.OrderedDict(
+                        (bound, 0) for bound in buckets + (float('inf'),)
+                    ),
+                    sum=0,
+                    count=0,
+                )
+            for bound in histogram['buckets']:
+                if value <= bound:
+                    histogram['buckets'][bound] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def get(self, name, **labels):
+        """:return: value of a sample, `None` if there is none"""
+        family = self.families.get(name)
+        if family is not None:
+            return family.samples.get(tuple(sorted(labels.items())))
+
+    def record_packages(self, packages):
+        """Record outdated status of `EasyUpgrade.get_packages_version`
+        results.
+        """
+        for pkg in packages:
+            versions = pkg['versions']
+            candidate = versions.get('candidate')
+            installed = versions.get('installed')
+            outdated = candidate is not None and (
+                installed is None or installed['tuple'] < candidate['tuple']
+            )
+            self.set(
+                'release_outdated', int(outdated),
+                'Whether a newer version of the release is available',
+                provider=pkg['provider'], release=pkg['release']
+            )
+
+    def record_results(self, results):
+        """Record `InstallResult` of an installation run"""
+        for result in results:
+            labels = dict(
+                provider=result.release.provider.name,
+                release=result.release.name,
+            )
+            for stage, duration in sorted(result.durations.items()):
+                self.observe(
+                    'release_stage_duration_seconds', duration,
+                    'Duration of installation stages of releases',
+                    stage=stage, **labels
+                )
+            self.inc(
+                'release_installs_total', 1,
+                'Installation attempts of releases, by outcome',
+                status=result.status, **labels
+            )
+            self.set(
+                'release_failed', int(result.failed),
+                'Whether the last installation attempt failed', **labels
+            )
+            if not result.failed:
+                self.set(
+                    'release_outdated', 0,
+                    'Whether a newer version of the release is available',
+                    **labels
+                )
+            if result.installed:
+                self.set(
+                    'release_last_install_timestamp_seconds',
+                    self.clock(),
+                    'Time of the last installation of the release',
+                    **labels
+                )
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for family in self.families.values():
+                if not family.samples:
+                    continue
+                if family.description:
+                    lines.append('# HELP {} {}'.format(
+                        family.name, family.description
+                    ))
+                lines.append('# TYPE {} {}'.format(family.name, family.kind))
+                for labels, value in family.samples.items():
+                    if family.kind != 'histogram':
+                        lines.append('{}{} {}'.format(
+                            family.name,
+                            format_labels(labels),
+                            format_value(value)
+                        ))
+                        continue
+                    for bound, count in value['buckets'].items():
+                        lines.append('{}_bucket{} {}'.format(
+                            family.name,
+                            format_labels(
+                                labels + (('le', format_value(bound)),)
+                            ),
+                            count
+                        ))
+                    lines.append('{}_sum{} {}'.format(
+                        family.name, format_labels(labels),
+                        format_value(value['sum'])
+                    ))
+                    lines.append('{}_count{} {}'.format(
+                        family.name, format_labels(labels), value['count']
+                    ))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Atomically write the metrics in `path`"""
+        atomic_write(path, self.render().encode('utf-8'))
+        # readable by the exporter, mkstemp creates private files
+        os.chmod(path, 0o644)
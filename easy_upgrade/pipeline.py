@@ -0,0 +1,148 @@
+"""Install releases in a pipeline of three stages: resolution of the
+version to install, fetch, then installation and post-installation.
+
+Each stage has its own bounded pool of workers, so that a release can
+be downloaded while another one is being installed.
+"""
+import logging
+from multiprocessing.pool import ThreadPool
+import threading
+import time
+
+
+class InstallResult(object):
+    """Outcome of the installation of a release"""
+    INSTALLED = 'installed'
+    UP_TO_DATE = 'up-to-date'
+    FAILED = 'failed'
+
+    def __init__(self, release, status, version=None, error=None,
+                 durations=None):
+        self.release = release
+        self.status = status
+        self.version = version
+        self.error = error
+        # seconds spent in every stage of the pipeline
+        self.durations = durations or {}
+
+    @property
+    def installed(self):
+        return self.status == self.INSTALLED
+
+    @property
+    def failed(self):
+        return self.status == self.FAILED
+
+    def __str__(self):
+        message = '{}:{}: {}'.format(
+            self.release.provider.name,
+            self.release.name,
+            self.status
+        )
+        if self.version is not None:
+            message += ' ' + self.version
+        if self.error is not None:
+            message += ' ({})'.format(self.error)
+        return message
+
+
+class Pipeline(object):
+    def __init__(self, resolve_jobs=1, fetch_jobs=1, install_jobs=1):
+        self.resolve_jobs = resolve_jobs
+        self.fetch_jobs = fetch_jobs
+        self.install_jobs = install_jobs
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Pools are sized by the top-level `pipeline` option:
+
+            pipeline:
+              resolve-jobs: 4  # defaults to `jobs`
+              fetch-jobs: 4    # defaults to `jobs`
+              install-jobs: 1
+        """
+        jobs = max(1, int(config.get('jobs') or 1))
+        pipeline = config.get('pipeline') or {}
+        return cls(
+            resolve_jobs=pipeline.get('resolve-jobs', jobs),
+            fetch_jobs=pipeline.get('fetch-jobs', jobs),
+            install_jobs=pipeline.get('install-jobs', 1),
+        )
+
+    def run(self, releases):
+        """
+        :return: list of `InstallResult`, in the order of `releases`
+        """
+        releases = list(releases)
+        results = [None] * len(releases)
+        durations = [dict() for _ in releases]
+        if not releases:
+            return results
+        pools = dict(
+            resolve=ThreadPool(min(self.resolve_jobs, len(releases))),
+            fetch=ThreadPool(min(self.fetch_jobs, len(releases))),
+            install=ThreadPool(min(self.install_jobs, len(releases))),
+        )
+        done = threading.Condition()
+
+        def finish(index, result):
+            with done:
+                results[index] = result
+                done.notify()
+
+        def stage(func):
+            """Run a stage of a release, then either finish with the
+            `InstallResult` it returns or schedule the next stage
+            given as a tuple (pool name, stage, arguments).
+            """
+            def _wrapper(index, *args):
+                release = releases[index]
+                start = time.time()
+                try:
+                    outcome = func(index, release, *args)
+                except Exception as e:
+                    release.logger.exception("installation failed")
+                    outcome = InstallResult(
+                        release, InstallResult.FAILED, error=e
+                    )
+                durations[index][func.__name__] = time.time() - start
+                if isinstance(outcome, InstallResult):
+                    outcome.durations = durations[index]
+                    finish(index, outcome)
+                else:
+                    pool, next_stage, next_args = outcome
+                    pools[pool].apply_async(next_stage, (index,) + next_args)
+            return _wrapper
+
+        @stage
+        def resolve(index, release):
+            version = release.resolve()
+            if version is None:
+                return InstallResult(release, InstallResult.UP_TO_DATE)
+            return 'fetch', fetch, (version,)
+
+        @stage
+        def fetch(index, release, version):
+            fetched_items_path = release.fetch(version)
+            return 'install', install, (version, fetched_items_path)
+
+        @stage
+        def install(index, release, version, fetched_items_path):
+            release.deploy(fetched_items_path, version)
+            return InstallResult(release, InstallResult.INSTALLED, version)
+
+        try:
+            for index in range(len(releases)):
+                pools['resolve'].apply_async(resolve, (index,))
+            with done:
+                while None in results:
+                    # timeout keeps the wait interruptible
+                    done.wait(1)
+        finally:
+            for name in ['resolve', 'fetch', 'install']:
+                pools[name].terminate()
+                pools[name].join()
+        for result in results:
+            logging.info(str(result))
+        return results
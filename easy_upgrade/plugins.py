@@ -0,0 +1,120 @@
+from importlib import import_module
+import inspect
+import json
+import logging
+import os
+import os.path as osp
+import sys
+
+from .cache import atomic_write
+
+ACTIONS_GROUP = 'easy_upgrade.actions'
+PROVIDERS_GROUP = 'easy_upgrade.providers'
+
+
+def distributions_fingerprint():
+    """
+    :return: value changing whenever a distribution is installed,
+    removed or its entry points are modified.
+    """
+    stamps = [sys.version]
+    for path in sys.path:
+        try:
+            stamps.append((path, os.stat(path or '.').st_mtime))
+            if not osp.isdir(path or '.'):
+                continue
+            for entry in os.listdir(path or '.'):
+                if entry.endswith(('.egg-info', '.dist-info')):
+                    entry_points = osp.join(path, entry, 'entry_points.txt')
+                    if osp.isfile(entry_points):
+                        stamps.append(
+                            (entry, os.stat(entry_points).st_mtime)
+                        )
+        except OSError:
+            stamps.append((path, None))
+    return repr(stamps)
+
+
+class PluginRegistry(object):
+    """Actions and providers declared by installed distributions.
+
+    Scanning entry points requires `pkg_resources` and imports every
+    action module, so the outcome of the scan is persisted and reused
+    until installed distributions change. Modules are then imported only
+    when an action or a provider they declare is referenced.
+    """
+    def __init__(self, actions, providers):
+        self.actions = actions
+        self.providers = providers
+
+    @classmethod
+    def scan(cls):
+        import pkg_resources
+        from .api import Action
+        actions = {}
+        for entrypoint in pkg_resources.iter_entry_points(ACTIONS_GROUP):
+            module = entrypoint.load()
+            for obj in vars(module).values():
+                if not inspect.isclass(obj) or not issubclass(obj, Action):
+                    continue
+                if obj is Action or obj.__name__ in Action.bases:
+                    continue
+                if 'name' in vars(obj):
+                    base = Action.get_action_basename(obj)
+                    actions.setdefault(base, {})[obj.name] = obj.__module__
+        providers = {}
+        for entrypoint in pkg_resources.iter_entry_points(PROVIDERS_GROUP):
+            providers[entrypoint.name] = '{}:{}'.format(
+                entrypoint.module_name,
+                '.'.join(entrypoint.attrs)
+            )
+        return cls(actions, providers)
+
+    @classmethod
+    def load(cls, cache_dir=None):
+        """
+        :return: registry persisted in `cache_dir` if still valid,
+        a freshly scanned one otherwise.
+        """
+        fingerprint = distributions_fingerprint()
+        path = None
+        if cache_dir is not None:
+            path = osp.join(cache_dir, 'plugins.json')
+            try:
+                with open(path) as istr:
+                    data = json.load(istr)
+                if data['fingerprint'] == fingerprint:
+                    return cls(data['actions'], data['providers'])
+            except (IOError, ValueError, KeyError):
+                pass
+        registry = cls.scan()
+        if path is not None:
+            atomic_write(path, json.dumps({
+                'fingerprint': fingerprint,
+                'actions': registry.actions,
+                'providers': registry.providers,
+            }))
+        return registry
+
+    def load_action(self, base, name):
+        """Import the module declaring action `name`
+
+        :return: `True` if the module was found, `False` otherwise
+        """
+        module = self.actions.get(base, {}).get(name)
+        if module is None:
+            return False
+        try:
+            import_module(module)
+        except ImportError:
+            logging.exception("Could not import action module %s", module)
+            return False
+        return True
+
+    def load_provider(self, name):
+        """:return: class of provider `name`"""
+        module, attrs = self.providers[name].split(':', 1)
+        obj = import_module(module)
+        for attr in attrs.split('.'):
+            obj = getattr(obj, attr)
+        return obj
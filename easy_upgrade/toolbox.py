@@ -1,29 +1,148 @@
-
-from collections import namedtuple
 from contextlib import contextmanager
+import errno
+import hashlib
 import os
 import os.path as osp
 import shutil
 import tempfile
-from urlparse import urlparse
 
-from pip.download import _download_http_url
+from . import trace
+
+CHUNK_SIZE = 64 * 1024
+FICLONE = 0x40049409  # Linux ioctl sharing the extents of a file
+
+
+def file_sha256(path, chunk_size=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as istr:
+        for chunk in iter(lambda: istr.read(chunk_size), ''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_sha256(path, actual, expected):
+    if expected is not None and actual != expected.lower():
+        raise Exception(
+            "SHA-256 mismatch for {}: expected {} but got {}".format(
+                path, expected, actual
+            )
+        )
+
 
+def reflink(src, dst):
+    import fcntl
+    with open(src, 'rb') as istr, open(dst, 'wb') as ostr:
+        fcntl.ioctl(ostr.fileno(), FICLONE, istr.fileno())
+
+
+def clone_file(src, dst, hardlink=True):
+    """Create file `dst` with the content of `src`, sharing its data
+    with a hardlink, or a reflink on copy-on-write filesystems,
+    and falling back to a plain copy.
+
+    :param hardlink: whether `dst` may be a hardlink, only if neither
+    file is modified afterward.
+    :return: method used: 'hardlink', 'reflink' or 'copy'
+    """
+    if osp.lexists(dst):
+        os.remove(dst)
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    try:
+        reflink(src, dst)
+        shutil.copystat(src, dst)
+        return 'reflink'
+    except (ImportError, IOError, OSError):
+        if osp.exists(dst):
+            os.remove(dst)
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def clone_tree(src, dst):
+    """Recursively clone directory `src` into `dst` with `clone_file`,
+    symbolic links are preserved.
+    """
+    os.mkdir(dst)
+    for name in os.listdir(src):
+        src_path, dst_path = osp.join(src, name), osp.join(dst, name)
+        if osp.islink(src_path):
+            os.symlink(os.readlink(src_path), dst_path)
+        elif osp.isdir(src_path):
+            clone_tree(src_path, dst_path)
+        else:
+            clone_file(src_path, dst_path)
+    shutil.copystat(src, dst)
 
-def download_http_url(url, session, temp_dir, **kwargs):
-    Link = namedtuple(
-        'Link',
-        ('url', 'show_url', 'filename', 'hash',
-            'hash_name', 'netloc', 'url_without_fragment')
-    )
-    kwargs.setdefault('hash', None)
-    kwargs.setdefault('hash_name', None)
-    kwargs.setdefault('filename', None)
-    kwargs.setdefault('show_url', False)
-    kwargs.setdefault('netloc', urlparse(url).netloc)
-    kwargs.setdefault('url_without_fragment', url)
-    link = Link(url=url, **kwargs)
-    return _download_http_url(link, session, temp_dir)
+
+def move_tree(src, dst):
+    """Move directory `src` to `dst`, atomically when both are on the
+    same filesystem.
+
+    :return: method used: 'rename' or 'clone'
+    """
+    with trace.span('move_tree', 'filesystem', dst=dst):
+        try:
+            os.rename(src, dst)
+            trace.annotate(method='rename')
+            return 'rename'
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+        trace.annotate(method='clone')
+        try:
+            clone_tree(src, dst)
+        except Exception:
+            shutil.rmtree(dst, ignore_errors=True)
+            raise
+        shutil.rmtree(src)
+        return 'clone'
+
+
+def makedirs(path):
+    """create directory `path` unless it exists"""
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not osp.isdir(path):
+            raise
+
+
+def download_file(session, url, path, sha256=None,
+                  chunk_size=CHUNK_SIZE, **kwargs):
+    """Stream `url` into `path` in bounded chunks, while computing its
+    SHA-256 digest. The file is removed if the digest does not match
+    the `sha256` expected one.
+
+    :return: tuple (content type, SHA-256 hex digest)
+    """
+    with trace.span('download', 'http', url=url):
+        response = session.get(
+            url,
+            stream=True,
+            headers={'Accept-Encoding': 'identity'},
+            **kwargs
+        )
+        try:
+            response.raise_for_status()
+            digest = hashlib.sha256()
+            try:
+                with open(path, 'wb') as ostr:
+                    for chunk in response.iter_content(chunk_size):
+                        digest.update(chunk)
+                        ostr.write(chunk)
+                check_sha256(path, digest.hexdigest(), sha256)
+            except Exception:
+                if osp.exists(path):
+                    os.remove(path)
+                raise
+        finally:
+            response.close()
+    return response.headers.get('Content-Type'), digest.hexdigest()
 
 
 @contextmanager
@@ -42,18 +161,35 @@ def temp_dir(cleanup=True, **kwargs):
     try:
         yield temp_dir
     finally:
-        if cleanup:
+        # directory may have been moved away
+        if cleanup and osp.isdir(temp_dir):
             shutil.rmtree(temp_dir)
 
 
-def find_executable(*names, **kwargs):
+_executables = {}
+
+
+def _lookup_executable(names, search_path):
     for name in names:
         if osp.isabs(name):
             return name
-        for path in os.environ['PATH'].split(os.pathsep):
+        for path in search_path.split(os.pathsep):
             f = osp.join(path, name)
             if osp.isfile(f) and os.access(f, os.X_OK):
                 return f
+
+
+def find_executable(*names, **kwargs):
+    """Successful lookups are memoized as long as `PATH` is left
+    unchanged, executables installed afterward are still found.
+    """
+    search_path = os.environ['PATH']
+    key = (names, search_path)
+    executable = _executables.get(key) or \
+        _lookup_executable(names, search_path)
+    if executable is not None:
+        _executables[key] = executable
+        return executable
     if kwargs.get('raise_if_missing', True):
         if len(names) > 1:
             raise Exception(
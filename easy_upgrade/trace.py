@@ -0,0 +1,148 @@
+"""Timed spans of a run, written in the Chrome trace event format.
+
+Traces can be opened with chrome://tracing or https://ui.perfetto.dev.
+Tracing is disabled unless `enable` is called, spans then cost a
+function call.
+"""
+import collections
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+_tracer = None
+
+
+class Tracer(object):
+    """Record spans of every thread. Counters, like the number of HTTP
+    round trips, are added to the innermost span of the current thread
+    and summed over the whole run.
+    """
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.origin = clock()
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.events = []
+        self.threads = {}
+        self.totals = collections.Counter()
+
+    @property
+    def stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def timestamp(self, when):
+        """:return: microseconds elapsed since the tracer creation"""
+        return int((when - self.origin) * 1e6)
+
+    @contextmanager
+    def span(self, name, category, **args):
+        self.stack.append(args)
+        start = self.clock()
+        try:
+            yield
+        except Exception as e:
+            args['error'] = str(e)
+            raise
+        finally:
+            end = self.clock()
+            self.stack.pop()
+            thread = threading.current_thread()
+            with self.lock:
+                self.threads[thread.ident] = thread.name
+                self.events.append(dict(
+                    name=name,
+                    cat=category,
+                    ph='X',
+                    ts=self.timestamp(start),
+                    dur=self.timestamp(end) - self.timestamp(start),
+                    pid=self.pid,
+                    tid=thread.ident,
+                    args=args,
+                ))
+
+    def annotate(self, **kwargs):
+        """Add arguments to the innermost span of the current thread"""
+        if self.stack:
+            self.stack[-1].update(kwargs)
+
+    def add(self, key, value=1):
+        if self.stack:
+            args = self.stack[-1]
+            args[key] = args.get(key, 0) + value
+        with self.lock:
+            self.totals[key] += value
+
+    def to_json(self):
+        with self.lock:
+            events = [
+                dict(name='thread_name', ph='M', pid=self.pid, tid=tid,
+                     args=dict(name=name))
+                for tid, name in sorted(self.threads.items())
+            ]
+            events += sorted(self.events, key=lambda e: e['ts'])
+            return dict(
+                traceEvents=events,
+                displayTimeUnit='ms',
+                otherData=dict(self.totals),
+            )
+
+    def dump(self, path):
+        with open(path, 'w') as ostr:
+            json.dump(self.to_json(), ostr)
+
+
+def enable(clock=time.time):
+    """Start recording spans
+
+    :return: the `Tracer`
+    """
+    global _tracer
+    _tracer = Tracer(clock)
+    return _tracer
+
+
+def disable():
+    """Stop recording spans
+
+    :return: the `Tracer` disabled, `None` if tracing was not enabled
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+@contextmanager
+def _no_span():
+    yield
+
+
+def span(name, category='easy_upgrade', **args):
+    """:return: context manager timing the block it wraps"""
+    if _tracer is None:
+        return _no_span()
+    return _tracer.span(name, category, **args)
+
+
+def annotate(**kwargs):
+    if _tracer is not None:
+        _tracer.annotate(**kwargs)
+
+
+def add(key, value=1):
+    if _tracer is not None:
+        _tracer.add(key, value)
+
+
+def count_response(response, *args, **kwargs):
+    """`requests` response hook counting HTTP round trips and bytes"""
+    if _tracer is not None:
+        _tracer.add('http_requests')
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit():
+            _tracer.add('http_bytes', int(length))
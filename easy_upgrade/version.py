@@ -0,0 +1,192 @@
+"""Version parsing and comparison.
+
+Every scheme converts a version string to a compact sort key, made of
+tuples of integers and strings. Keys are memoized, so comparing the
+same versions over and over only costs tuple comparisons.
+"""
+import re
+import threading
+
+# ranks of version components, in ascending order
+_PRE, _FINAL, _WORD, _NUMBER = range(4)
+
+PRE_RELEASE_TAGS = {
+    'dev': 0,
+    'a': 1,
+    'alpha': 1,
+    'b': 2,
+    'beta': 2,
+    'c': 3,
+    'pre': 3,
+    'preview': 3,
+    'rc': 3,
+}
+POST_RELEASE_TAGS = frozenset(['post', 'p', 'pl', 'patch', 'r', 'rev'])
+
+
+class VersionScheme(object):
+    """Base class of version schemes, memoizing the computed keys"""
+    name = None
+
+    def __init__(self, **options):
+        self.options = options
+        self._keys = {}
+
+    def parse(self, version):
+        """
+        :return: sort key of `version`, `None` if it cannot be parsed
+        """
+        raise NotImplementedError()
+
+    def key(self, version):
+        if version is None:
+            return None
+        try:
+            return self._keys[version]
+        except KeyError:
+            key = self._keys[version] = self.parse(version)
+            return key
+
+    def max(self, versions):
+        """:return: most recent version of `versions`, `None` if empty"""
+        result, result_key = None, None
+        for version in versions:
+            key = self.key(version)
+            if result is None or key > result_key:
+                result, result_key = version, key
+        return result
+
+    def sort(self, versions, reverse=False):
+        return sorted(versions, key=self.key, reverse=reverse)
+
+
+class LooseScheme(VersionScheme):
+    """Accept any version string, with pre and post-release tags.
+
+    `1.0 == 1.0.0`, `1.0rc1 < 1.0 < 1.0.post1 < 1.0.1`
+    """
+    name = 'loose'
+    TOKENS = re.compile(r'\d+|[a-z]+')
+
+    def parse(self, version):
+        key = []
+        for token in self.TOKENS.findall(version.lower().lstrip('v')):
+            if token.isdigit():
+                key.append((_NUMBER, int(token)))
+                continue
+            while key and key[-1] == (_NUMBER, 0):
+                key.pop()
+            if token in PRE_RELEASE_TAGS:
+                key.append((_PRE, PRE_RELEASE_TAGS[token]))
+            elif token in POST_RELEASE_TAGS:
+                key.append((_WORD, ''))
+            else:
+                key.append((_WORD, token))
+        while key and key[-1] == (_NUMBER, 0):
+            key.pop()
+        key.append((_FINAL,))
+        return tuple(key)
+
+
+class SemVerScheme(VersionScheme):
+    """Semantic versioning 2.0.0, build metadata is ignored"""
+    name = 'semver'
+    PATTERN = re.compile(
+        r'(\d+)\.(\d+)\.(\d+)'
+        r'(?:-([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?'
+        r'(?:\+[0-9A-Za-z-.]+)?'
+    )
+
+    def parse(self, version):
+        match = self.PATTERN.search(version)
+        if match is None:
+            return None
+        major, minor, patch, pre_release = match.groups()
+        if pre_release is None:
+            # a normal version has precedence over its pre-releases
+            pre_release = (_FINAL,)
+        else:
+            pre_release = (_PRE,) + tuple(
+                (0, int(i), '') if i.isdigit() else (1, 0, i)
+                for i in pre_release.split('.')
+            )
+        return (int(major), int(minor), int(patch), pre_release)
+
+
+class CalVerScheme(VersionScheme):
+    """Calendar versioning, like `2015.07.1` or `15.07-beta`.
+
+    Date components are compared numerically, and a version with a
+    suffix precedes the same version without it.
+    """
+    name = 'calver'
+    PATTERN = re.compile(r'(\d+(?:[._]\d+)*)(?:[-._+]?(.+))?$')
+
+    def parse(self, version):
+        match = self.PATTERN.search(version)
+        if match is None:
+            return None
+        components, modifier = match.groups()
+        numbers = tuple(int(c) for c in re.split('[._]', components))
+        if modifier is None:
+            return numbers, (_FINAL,)
+        return numbers, (_PRE, modifier)
+
+
+class RegexScheme(VersionScheme):
+    """Extract the version with the `regex` option, then compare it with
+    the `loose` scheme. The version is the `version` named group of the
+    expression, its first group, or the entire match.
+    """
+    name = 'regex'
+
+    def __init__(self, **options):
+        super(RegexScheme, self).__init__(**options)
+        if not options.get('regex'):
+            raise Exception("'regex' version scheme expects a 'version-regex'")
+        self.pattern = re.compile(options['regex'])
+        self.loose = get_scheme('loose')
+
+    def parse(self, version):
+        match = self.pattern.search(version)
+        if match is None:
+            return None
+        groups = match.groupdict()
+        if 'version' in groups:
+            version = groups['version']
+        elif match.groups():
+            version = match.group(1)
+        else:
+            version = match.group(0)
+        return self.loose.key(version)
+
+
+SCHEMES = dict(
+    (cls.name, cls)
+    for cls in [LooseScheme, SemVerScheme, CalVerScheme, RegexScheme]
+)
+_schemes = {}
+_schemes_lock = threading.Lock()
+
+
+def get_scheme(name='loose', **options):
+    """:return: shared instance of the scheme `name`"""
+    options = dict((k, v) for k, v in options.items() if v is not None)
+    cache_key = (name, tuple(sorted(options.items())))
+    with _schemes_lock:
+        scheme = _schemes.get(cache_key)
+    if scheme is None:
+        if name not in SCHEMES:
+            raise Exception("Unknown version scheme: {}".format(name))
+        scheme = SCHEMES[name](**options)
+        with _schemes_lock:
+            scheme = _schemes.setdefault(cache_key, scheme)
+    return scheme
+
+
+def parse_version(version, scheme='loose'):
+    return get_scheme(scheme).key(version)
+
+
+def max_version(versions, scheme='loose'):
+    return get_scheme(scheme).max(versions)
@@ -49,7 +49,6 @@ setup(
     install_requires=[
         'PyYAML>=3.11',
         'requests>=2.7.0',
-        'pip>=7.1.0',
     ],
     tests_require=[
     ],
@@ -57,6 +56,8 @@ setup(
         [console_scripts]
         easy_upgrade = easy_upgrade.cli:run
         [easy_upgrade.actions]
+        archive = easy_upgrade.lib.archive
+        current = easy_upgrade.lib.current
         github = easy_upgrade.lib.github
         stow = easy_upgrade.lib.stow
         [easy_upgrade.providers]
@@ -0,0 +1,103 @@
+"""Local stand-in HTTP server used by unit-tests"""
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+import json
+import socket
+import threading
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def process_request(self, request, client_address):
+        self.stand_in.connections.append(request)
+        ThreadingMixIn.process_request(self, request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_HEAD(self):
+        self._dispatch('HEAD')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else ''
+        self.server.stand_in.requests.append(
+            (method, self.path, dict(self.headers), self.body)
+        )
+        self.server.stand_in.clients.add(self.client_address)
+        route = self.server.stand_in.routes.get(self.path.split('?', 1)[0])
+        if route is None:
+            status, headers, body = 404, {}, ''
+        elif callable(route):
+            status, headers, body = route(self)
+        else:
+            status, headers, body = route
+            etag = headers.get('ETag')
+            if etag and self.headers.get('If-None-Match') == etag:
+                status, body = 304, ''
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if method != 'HEAD':
+            self.wfile.write(body)
+
+
+class StandInServer(object):
+    """HTTP server answering canned responses from a background thread.
+
+    Routes map a request path either to a `(status, headers, body)` tuple
+    or to a callable taking the request handler and returning such tuple.
+    """
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self.clients = set()
+        self.connections = []
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.stand_in = self
+        self.thread = threading.Thread(
+            target=self.server.serve_forever,
+            kwargs=dict(poll_interval=0.05)
+        )
+        self.thread.daemon = True
+
+    @property
+    def root(self):
+        return 'http://{}:{}'.format(*self.server.server_address)
+
+    def url(self, path):
+        return self.root + path
+
+    def route(self, path, body, status=200, headers=None):
+        self.routes[path] = (status, headers or {}, body)
+
+    def route_json(self, path, payload, status=200, headers=None):
+        headers = dict(headers or {})
+        headers['Content-Type'] = 'application/json'
+        self.route(path, json.dumps(payload), status, headers)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+        for connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
@@ -0,0 +1,229 @@
+from cStringIO import StringIO
+import hashlib
+import os
+import os.path as osp
+import subprocess
+import tarfile
+import unittest
+import zipfile
+
+from easy_upgrade.lib.archive import MemberFilter, archive_format, extract
+from easy_upgrade.lib.github import GitHubProvider
+from easy_upgrade.toolbox import find_executable, temp_dir
+import easy_upgrade.lib.stow  # noqa
+
+from httpd import StandInServer
+
+FILES = [
+    ('tool-1.0/bin/tool', '#!/bin/sh\necho tool\n', 0755),
+    ('tool-1.0/share/doc/README', 'documentation', 0644),
+    ('tool-1.0/share/man/tool.1', 'manual', 0644),
+]
+
+
+def make_tar(mode):
+    buf = StringIO()
+    with tarfile.open(fileobj=buf, mode=mode) as tar:
+        for name, content, perm in FILES:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mode = perm
+            tar.addfile(info, StringIO(content))
+    return buf.getvalue()
+
+
+def make_tar_xz():
+    process = subprocess.Popen(
+        [find_executable('xz'), '-c'],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    return process.communicate(make_tar('w'))[0]
+
+
+def make_zip():
+    buf = StringIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content, perm in FILES:
+            info = zipfile.ZipInfo(name)
+            info.external_attr = perm << 16
+            archive.writestr(info, content)
+    return buf.getvalue()
+
+
+class MemberFilterTest(unittest.TestCase):
+    def test_strip_components(self):
+        member_filter = MemberFilter(strip_components=1)
+        self.assertEqual(member_filter('./tool-1.0/bin/tool'), 'bin/tool')
+        self.assertEqual(member_filter('tool-1.0/.hidden'), '.hidden')
+        self.assertIsNone(member_filter('tool-1.0/'))
+        with self.assertRaises(Exception):
+            member_filter('tool-1.0/../../etc/passwd')
+
+    def test_patterns(self):
+        member_filter = MemberFilter(
+            members=['*/bin/*', '*/share/*'],
+            exclude=['*/share/man/*'],
+        )
+        self.assertEqual(member_filter('/tool/bin/tool'), 'tool/bin/tool')
+        self.assertIsNone(member_filter('tool/share/man/tool.1'))
+        self.assertIsNone(member_filter('tool/LICENSE'))
+
+    def test_archive_format(self):
+        self.assertEqual(archive_format('tool-linux.tgz'), 'tar')
+        self.assertEqual(archive_format('tool-linux.tar.xz'), 'tar.xz')
+        self.assertEqual(archive_format('tool-linux.zip'), 'zip')
+        with self.assertRaises(Exception):
+            archive_format('tool-linux')
+
+
+class ExtractTest(unittest.TestCase):
+    def extract_links(self, *links):
+        """Extract a tar archive made of symbolic links `links`, given as
+        (name, link target) tuples, followed by `tool-1.0/escape/file`.
+        Link targets may refer to an `{outside}` directory, which must
+        be left untouched.
+        """
+        with temp_dir() as d:
+            outside = osp.join(d, 'outside')
+            os.mkdir(outside)
+            buf = StringIO()
+            with tarfile.open(fileobj=buf, mode='w') as tar:
+                for name, target in links:
+                    info = tarfile.TarInfo(name)
+                    info.type = tarfile.SYMTYPE
+                    info.linkname = target.format(outside=outside)
+                    tar.addfile(info)
+                info = tarfile.TarInfo('tool-1.0/escape/file')
+                info.size = 4
+                tar.addfile(info, StringIO('data'))
+            buf.seek(0)
+            try:
+                extract(buf, 'tar', osp.join(d, 'output'),
+                        MemberFilter(strip_components=1))
+            finally:
+                self.assertEqual(os.listdir(outside), [])
+
+    def test_absolute_symlink(self):
+        with self.assertRaises(Exception) as cm:
+            self.extract_links(('tool-1.0/escape', '{outside}'))
+        self.assertIn('Unsafe symbolic link', cm.exception.message)
+
+    def test_relative_symlink(self):
+        with self.assertRaises(Exception) as cm:
+            self.extract_links(('tool-1.0/escape', '../outside'))
+        self.assertIn('Unsafe symbolic link', cm.exception.message)
+
+    def test_inner_symlink(self):
+        with self.assertRaises(Exception) as cm:
+            self.extract_links(
+                ('tool-1.0/up', '.'),
+                ('tool-1.0/escape', 'up/../outside'),
+            )
+        self.assertIn('Unsafe symbolic link', cm.exception.message)
+        self.extract_links(('tool-1.0/bin', '.'),
+                           ('tool-1.0/escape', 'bin'))
+
+    def test_special_members(self):
+        with temp_dir() as d:
+            buf = StringIO()
+            with tarfile.open(fileobj=buf, mode='w') as tar:
+                for name, kind in [('fifo', tarfile.FIFOTYPE),
+                                   ('null', tarfile.CHRTYPE)]:
+                    info = tarfile.TarInfo(name)
+                    info.type = kind
+                    tar.addfile(info)
+                info = tarfile.TarInfo('tool')
+                info.size = 4
+                info.mode = 06755
+                tar.addfile(info, StringIO('data'))
+            buf.seek(0)
+            extract(buf, 'tar', d, MemberFilter())
+            self.assertEqual(os.listdir(d), ['tool'])
+            self.assertEqual(os.stat(osp.join(d, 'tool')).st_mode & 07777,
+                             0755)
+
+    def test_redirected_symlink(self):
+        # the second link makes the first one escape
+        with self.assertRaises(Exception) as cm:
+            self.extract_links(
+                ('tool-1.0/a', 'p/q/../outside'),
+                ('tool-1.0/p/q', '..'),
+            )
+        self.assertIn('Unsafe symbolic link', cm.exception.message)
+
+
+class GitHubArchiveTest(unittest.TestCase):
+    def fetch(self, asset_name, content, **fetch_config):
+        fetch_config.setdefault('name', asset_name)
+        fetch_config.setdefault('strip-components', 1)
+        provider = GitHubProvider('github', {
+            'cache-dir': None,
+            'github': {'releases': {
+                'org/tool': {
+                    'fetch': {'archive': fetch_config},
+                    'install': {
+                        'stow': {'path': '/tmp', 'stow': ['/bin/true']}
+                    },
+                }
+            }}
+        })
+        fetcher = provider.releases['org/tool'].fetcher
+        with StandInServer() as server, temp_dir() as d:
+            server.route('/' + asset_name, content)
+            fetcher.grelease = {'name': '1.0', 'assets': [{
+                'name': asset_name,
+                'size': len(content),
+                'browser_download_url': server.url('/' + asset_name),
+            }]}
+            fetcher.fetch(d)
+            extracted = {}
+            for root, dirs, files in os.walk(d):
+                for f in files:
+                    path = osp.join(root, f)
+                    with open(path) as istr:
+                        extracted[osp.relpath(path, d)] = (
+                            istr.read(),
+                            os.stat(path).st_mode & 0777
+                        )
+            return extracted
+
+    def check_archive(self, asset_name, content):
+        self.assertEqual(self.fetch(asset_name, content), {
+            'bin/tool': ('#!/bin/sh\necho tool\n', 0755),
+            'share/doc/README': ('documentation', 0644),
+            'share/man/tool.1': ('manual', 0644),
+        })
+
+    def test_tar_gz(self):
+        self.check_archive('tool-linux.tar.gz', make_tar('w:gz'))
+
+    def test_tar_bz2(self):
+        self.check_archive('tool-linux.tar.bz2', make_tar('w:bz2'))
+
+    def test_tar_xz(self):
+        self.check_archive('tool-linux.tar.xz', make_tar_xz())
+
+    def test_zip(self):
+        self.check_archive('tool-linux.zip', make_zip())
+
+    def test_members(self):
+        extracted = self.fetch(
+            'tool-linux.tar.gz',
+            make_tar('w:gz'),
+            members=['*/bin/*'],
+            path='opt',
+        )
+        self.assertEqual(extracted.keys(), ['opt/bin/tool'])
+
+    def test_checksum(self):
+        content = make_tar('w:gz')
+        self.fetch('tool.tgz', content,
+                   sha256=hashlib.sha256(content).hexdigest())
+        with self.assertRaises(Exception) as cm:
+            self.fetch('tool.tgz', content, sha256='0' * 64)
+        self.assertIn('SHA-256 mismatch', cm.exception.message)
+
+
+if __name__ == '__main__':
+    unittest.main()
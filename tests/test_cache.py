@@ -0,0 +1,159 @@
+import os
+import os.path as osp
+import unittest
+
+import requests
+
+from easy_upgrade import cache as cache_module
+from easy_upgrade.cache import ArtifactCache, HttpCache
+from easy_upgrade.toolbox import file_sha256, temp_dir
+
+from httpd import StandInServer
+
+
+class HttpCacheTest(unittest.TestCase):
+    def test_conditional_request(self):
+        with temp_dir() as d, StandInServer() as server:
+            server.route_json('/releases', [{'name': 'v1'}],
+                              headers={'ETag': '"abc"'})
+            cache = HttpCache(osp.join(d, 'http'))
+            url = server.url('/releases')
+            self.assertEqual(cache.get_json(requests, url), [{'name': 'v1'}])
+            self.assertEqual(cache.get(url)['etag'], '"abc"')
+            self.assertEqual(cache.get_json(requests, url), [{'name': 'v1'}])
+            self.assertEqual(len(server.requests), 2)
+            headers = server.requests[1][2]
+            self.assertEqual(headers.get('if-none-match'), '"abc"')
+
+    def test_resource_updated(self):
+        with temp_dir() as d, StandInServer() as server:
+            url = server.url('/releases')
+            cache = HttpCache(d)
+            server.route_json('/releases', [1], headers={'ETag': '"1"'})
+            self.assertEqual(cache.get_json(requests, url), [1])
+            server.route_json('/releases', [1, 2], headers={'ETag': '"2"'})
+            self.assertEqual(cache.get_json(requests, url), [1, 2])
+            self.assertEqual(cache.get(url)['etag'], '"2"')
+
+    def test_no_validator(self):
+        with temp_dir() as d, StandInServer() as server:
+            url = server.url('/releases')
+            server.route_json('/releases', [])
+            cache = HttpCache(d)
+            self.assertEqual(cache.get_json(requests, url), [])
+            self.assertIsNone(cache.get(url))
+
+    def test_http_error(self):
+        with temp_dir() as d, StandInServer() as server:
+            cache = HttpCache(d)
+            with self.assertRaises(requests.HTTPError):
+                cache.get_json(requests, server.url('/unknown'))
+
+
+class ArtifactCacheTest(unittest.TestCase):
+    @classmethod
+    def write(cls, path, content):
+        with open(path, 'w') as ostr:
+            ostr.write(content)
+        return file_sha256(path)
+
+    @classmethod
+    def read(cls, path):
+        with open(path) as istr:
+            return istr.read()
+
+    def test_hit(self):
+        with temp_dir() as d:
+            cache = ArtifactCache(osp.join(d, 'artifacts'), 100)
+            key = cache.key(42, 3, None)
+            src = osp.join(d, 'src')
+            digest = self.write(src, 'foo')
+            self.assertIsNone(cache.get(key, osp.join(d, 'dst')))
+            cache.put(key, src, digest, content_type='text/plain')
+            # files given may be modified afterward
+            self.write(src, 'bar')
+            dst = osp.join(d, 'dst')
+            self.assertEqual(cache.get(key, dst),
+                             {'content_type': 'text/plain'})
+            self.assertEqual(self.read(dst), 'foo')
+            # objects are not hashed again while left unchanged
+            cache_module.file_sha256 = None
+            try:
+                self.assertIsNotNone(cache.get(key, osp.join(d, 'dst2')))
+            finally:
+                cache_module.file_sha256 = file_sha256
+            self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_modified_hardlink(self):
+        with temp_dir() as d:
+            cache = ArtifactCache(d, 100)
+            src = osp.join(d, 'src')
+            digest = self.write(src, 'foo')
+            cache.put(cache.key(1), src, digest)
+            dst = osp.join(d, 'dst')
+            cache.get(cache.key(1), dst)
+            os.chmod(dst, 0o755)
+            self.assertIsNotNone(cache.get(cache.key(1), dst))
+
+            def unlocked_sha256(path):
+                self.assertFalse(cache.lock.locked())
+                return file_sha256(path)
+            cache_module.file_sha256 = unlocked_sha256
+            try:
+                # an object touched but left intact is still served
+                os.utime(cache.object_path(digest), (0, 0))
+                self.assertIsNotNone(cache.get(cache.key(1), dst))
+                self.write(dst, 'modified')
+                self.assertIsNone(
+                    cache.get(cache.key(1), osp.join(d, 'dst2'))
+                )
+            finally:
+                cache_module.file_sha256 = file_sha256
+            self.assertFalse(osp.exists(cache.object_path(digest)))
+            # stored again
+            cache.put(cache.key(1), src, digest)
+            self.assertIsNotNone(cache.get(cache.key(1), dst))
+            self.assertEqual(self.read(dst), 'foo')
+
+    def test_corrupted(self):
+        with temp_dir() as d:
+            cache = ArtifactCache(d, 100)
+            src = osp.join(d, 'src')
+            digest = self.write(src, 'foo')
+            cache.put(cache.key(1), src, digest)
+            self.write(cache.object_path(digest), 'corrupted')
+            self.assertIsNone(cache.get(cache.key(1), osp.join(d, 'dst')))
+            self.assertFalse(osp.exists(cache.object_path(digest)))
+            self.assertFalse(osp.exists(osp.join(d, 'dst')))
+
+    def test_content_addressed(self):
+        with temp_dir() as d:
+            cache = ArtifactCache(d, 100)
+            src = osp.join(d, 'src')
+            digest = self.write(src, 'foo')
+            cache.put(cache.key(1), src, digest)
+            cache.put(cache.key(2), src, digest)
+            index = cache.load_index()
+            self.assertEqual(len(index['keys']), 2)
+            self.assertEqual(index['objects'].keys(), [digest])
+
+    def test_lru_eviction(self):
+        with temp_dir() as d:
+            cache = ArtifactCache(osp.join(d, 'artifacts'), 10)
+            src = osp.join(d, 'src')
+            digests = []
+            for i in range(3):
+                digests.append(self.write(src, str(i) * 4))
+                cache.put(cache.key(i), src, digests[i])
+                os.remove(src)
+                if i == 1:
+                    # refresh first artifact
+                    cache.get(cache.key(0), osp.join(d, 'dst'))
+            self.assertIsNotNone(cache.get(cache.key(0), src))
+            self.assertIsNone(cache.get(cache.key(1), src))
+            self.assertIsNotNone(cache.get(cache.key(2), src))
+            self.assertFalse(osp.exists(cache.object_path(digests[1])))
+
+
+if __name__ == '__main__':
+    unittest.main()
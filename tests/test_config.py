@@ -0,0 +1,99 @@
+import os
+import os.path as osp
+import unittest
+
+from easy_upgrade import config
+from easy_upgrade.toolbox import temp_dir
+
+
+def write(path, content):
+    with open(path, 'w') as ostr:
+        ostr.write(content)
+
+
+class ConfigTest(unittest.TestCase):
+    def test_include(self):
+        with temp_dir() as d:
+            os.mkdir(osp.join(d, 'conf.d'))
+            write(osp.join(d, 'config.yml'), """
+include:
+  - defaults.yml
+  - conf.d/*.yml
+github:
+  api-root: https://github.example.com/api/v3
+""")
+            write(osp.join(d, 'defaults.yml'), """
+jobs: 2
+github:
+  api-root: https://api.github.com
+""")
+            write(osp.join(d, 'conf.d', 'a.yml'), """
+github:
+  releases:
+    org/a: {fetch: {asset: {}}}
+""")
+            write(osp.join(d, 'conf.d', 'b.yml'), """
+github:
+  releases:
+    org/b: {fetch: {asset: {}}}
+""")
+            self.assertEqual(config.load(osp.join(d, 'config.yml')), {
+                'jobs': 2,
+                'github': {
+                    'api-root': 'https://github.example.com/api/v3',
+                    'releases': {
+                        'org/a': {'fetch': {'asset': {}}},
+                        'org/b': {'fetch': {'asset': {}}},
+                    },
+                },
+            })
+
+    def test_circular_include(self):
+        with temp_dir() as d:
+            write(osp.join(d, 'a.yml'), 'include: b.yml\n')
+            write(osp.join(d, 'b.yml'), 'include: a.yml\n')
+            with self.assertRaises(Exception) as cm:
+                config.load(osp.join(d, 'a.yml'))
+            self.assertIn('Circular', str(cm.exception))
+
+    def test_cache(self):
+        with temp_dir() as d:
+            path = osp.join(d, 'config.yml')
+            shard = osp.join(d, 'shard.yml')
+            write(path, 'include: "*.part.yml"\njobs: 1\n')
+            write(shard, 'cleanup-temp-dir: true\n')
+            cache_dir = osp.join(d, 'cache')
+            self.assertEqual(config.load(path, cache_dir), {'jobs': 1})
+            self.assertEqual(len(os.listdir(osp.join(cache_dir, 'config'))), 1)
+
+            load_yaml = config.ConfigLoader.load
+            file_digest = config.file_digest
+
+            def fail(*args):
+                raise Exception("unexpected parsing")
+            config.ConfigLoader.load = fail
+            try:
+                self.assertEqual(config.load(path, cache_dir), {'jobs': 1})
+                # same content, only the modification time changed
+                os.utime(path, (0, 0))
+                self.assertEqual(config.load(path, cache_dir), {'jobs': 1})
+                # the new modification time is recorded
+                config.file_digest = fail
+                self.assertEqual(config.load(path, cache_dir), {'jobs': 1})
+            finally:
+                config.ConfigLoader.load = load_yaml
+                config.file_digest = file_digest
+
+            write(path, 'include: "*.part.yml"\njobs: 3\n')
+            os.utime(path, (1, 1))
+            self.assertEqual(config.load(path, cache_dir), {'jobs': 3})
+            # a new file matching an include pattern is picked up
+            os.rename(shard, osp.join(d, 'shard.part.yml'))
+            self.assertEqual(config.load(path, cache_dir), {
+                'jobs': 3,
+                'cleanup-temp-dir': True,
+            })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import os.path as osp
+import unittest
+
+import yaml
+
+from easy_upgrade.cli import run
+from easy_upgrade.lib.current import CurrentInstaller, switch_symlink
+from easy_upgrade.toolbox import temp_dir
+from easy_upgrade.version import get_scheme
+
+
+class FakeProvider(object):
+    name = 'github'
+
+
+class FakeRelease(object):
+    name = 'org/tool'
+    pkg_name = 'tool'
+    version_scheme = get_scheme()
+
+
+class CurrentInstallerTest(unittest.TestCase):
+    def install(self, installer, version):
+        with temp_dir(dir=installer.staging_dir()) as fetched:
+            with open(osp.join(fetched, 'tool'), 'w') as ostr:
+                ostr.write(version)
+            return installer.install(fetched, version)
+
+    def read_current(self, root):
+        with open(osp.join(root, 'tool', 'current', 'tool')) as istr:
+            return istr.read()
+
+    def test_switch_symlink(self):
+        with temp_dir() as d:
+            path = osp.join(d, 'current')
+            switch_symlink(path, '1.0')
+            switch_symlink(path, '1.1')
+            self.assertEqual(os.readlink(path), '1.1')
+            self.assertEqual(os.listdir(d), ['current'])
+
+    def test_install_and_rollback(self):
+        with temp_dir() as d:
+            installer = CurrentInstaller(FakeProvider(), FakeRelease(), {
+                'path': d,
+            })
+            self.assertIsNone(installer.installed_version())
+            with self.assertRaises(Exception):
+                installer.rollback()
+            self.assertEqual(self.install(installer, '1.0'),
+                             osp.join(d, 'tool', '1.0'))
+            self.install(installer, '1.1')
+            self.assertEqual(installer.installed_version(), '1.1')
+            self.assertEqual(self.read_current(d), '1.1')
+            self.assertEqual(installer.rollback(), '1.0')
+            self.assertEqual(self.read_current(d), '1.0')
+            self.assertEqual(installer.manifest.active, '1.0')
+            # rolling back again restores the newest version
+            self.assertEqual(installer.rollback(), '1.1')
+            self.assertEqual(self.read_current(d), '1.1')
+            with self.assertRaises(Exception):
+                self.install(installer, '1.1')
+            with self.assertRaises(Exception):
+                self.install(installer, '../1.2')
+            self.assertEqual(
+                sorted(os.listdir(osp.join(d, 'tool'))),
+                ['.manifest.json', '.staging', '1.0', '1.1', 'current']
+            )
+
+    def test_rollback_command(self):
+        with temp_dir() as d:
+            installer = CurrentInstaller(FakeProvider(), FakeRelease(), {
+                'path': d,
+            })
+            self.install(installer, '1.0')
+            self.install(installer, '1.1')
+            config = osp.join(d, 'config.yml')
+            with open(config, 'w') as ostr:
+                yaml.dump({
+                    'cache-dir': None,
+                    'github': {
+                        'releases': {
+                            'org/tool': {
+                                'fetch': {'asset': {}},
+                                'install': {'current': {'path': d}},
+                            },
+                        },
+                    },
+                }, ostr)
+            os.environ['EASY_UPGRADE_CONFIG_CACHE'] = osp.join(d, 'cache')
+            try:
+                run(['-c', config, 'rollback', 'github:org/tool'])
+            finally:
+                del os.environ['EASY_UPGRADE_CONFIG_CACHE']
+            self.assertEqual(len(os.listdir(osp.join(d, 'cache', 'config'))),
+                             1)
+            self.assertEqual(self.read_current(d), '1.0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+import os.path as osp
+import threading
+import time
+import unittest
+
+import yaml
+
+from easy_upgrade.api import (
+    EasyUpgrade,
+    Fetcher,
+    Installer,
+    ReleaseProvider,
+)
+from easy_upgrade.daemon import Daemon, send_command
+from easy_upgrade.toolbox import temp_dir
+
+CANDIDATES = {}
+INSTALLED = {}
+
+
+class DaemonFetcher(Fetcher):
+    name = 'daemon-fetch'
+
+    def candidate_version(self):
+        return CANDIDATES.get(self.release.name)
+
+    def fetch(self, output_directory):
+        pass
+
+
+class DaemonInstaller(Installer):
+    name = 'daemon-install'
+
+    def installed_version(self):
+        return INSTALLED.get(self.release.name)
+
+    def install(self, fetched_items_path, version):
+        INSTALLED[self.release.name] = version
+
+
+class DaemonProvider(ReleaseProvider):
+    def __init__(self, top_config):
+        super(DaemonProvider, self).__init__('daemon-provider', top_config)
+
+
+def create_easy_upgrade(config):
+    eu = EasyUpgrade(config)
+    eu.providers['daemon-provider'] = DaemonProvider(config)
+    return eu
+
+
+class UpperBound(object):
+    """deterministic random generator"""
+    def uniform(self, a, b):
+        return b
+
+
+RELEASE = {
+    'fetch': {'daemon-fetch': {}},
+    'install': {'daemon-install': {}},
+}
+
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        CANDIDATES.clear()
+        INSTALLED.clear()
+
+    def write_config(self, d, *releases, **options):
+        config = {
+            'cache-dir': osp.join(d, 'cache'),
+            'daemon': {'interval': 100, 'jitter': 0.1},
+            'daemon-provider': {'releases': {}},
+        }
+        config['daemon'].update(options)
+        for name in releases:
+            config['daemon-provider']['releases'][name] = dict(RELEASE)
+        config['daemon-provider']['releases']['org/b'] = dict(
+            RELEASE, **{'check-interval': 10}
+        )
+        path = osp.join(d, 'config.yml')
+        with open(path, 'w') as ostr:
+            yaml.dump(config, ostr)
+        return path
+
+    def test_schedule(self):
+        with temp_dir() as d:
+            now = [1000.0]
+            daemon = Daemon(
+                self.write_config(d, 'org/a'),
+                cache_dir=osp.join(d, 'cache'),
+                factory=create_easy_upgrade,
+                clock=lambda: now[0],
+                rng=UpperBound(),
+            )
+            self.assertTrue(daemon.load())
+            a, b = ('daemon-provider', 'org/a'), ('daemon-provider', 'org/b')
+            self.assertEqual(daemon.due, {a: 1010.0, b: 1001.0})
+            CANDIDATES.update({'org/a': '1.0', 'org/b': '2.0'})
+            now[0] = 1005.0
+            daemon.run_due()
+            self.assertEqual(INSTALLED, {'org/b': '2.0'})
+            self.assertEqual(daemon.due, {a: 1010.0, b: 1016.0})
+            self.assertEqual(daemon.next_due(), 1010.0)
+
+            self.assertFalse(daemon.load())
+            self.write_config(d, 'org/a', 'org/c')
+            self.assertTrue(daemon.load())
+            c = ('daemon-provider', 'org/c')
+            self.assertEqual(daemon.due, {a: 1010.0, b: 1016.0, c: 1015.0})
+
+            # releases are resolved again at every check
+            CANDIDATES['org/b'] = '2.1'
+            now[0] = 1020.0
+            daemon.run_due()
+            self.assertEqual(INSTALLED, {
+                'org/a': '1.0',
+                'org/b': '2.1',
+            })
+            self.assertEqual(daemon.due[b], 1031.0)
+
+    def test_check_unknown_release(self):
+        with temp_dir() as d:
+            daemon = Daemon(
+                self.write_config(d, 'org/a'),
+                cache_dir=osp.join(d, 'cache'),
+                factory=create_easy_upgrade,
+                rng=UpperBound(),
+            )
+            daemon.load()
+            CANDIDATES.update({'org/a': '1.0', 'org/b': '2.0'})
+            self.assertEqual(
+                daemon.check([('daemon-provider', 'org/typo')]), []
+            )
+            self.assertEqual(INSTALLED, {})
+
+    def test_failed_check(self):
+        with temp_dir() as d:
+            now = [1000.0]
+            daemon = Daemon(
+                self.write_config(d),
+                cache_dir=osp.join(d, 'cache'),
+                factory=create_easy_upgrade,
+                clock=lambda: now[0],
+                rng=UpperBound(),
+            )
+            daemon.load()
+            b = ('daemon-provider', 'org/b')
+            daemon.eu.install = lambda *keys: 1 / 0
+            now[0] = 1005.0
+            with self.assertRaises(ZeroDivisionError):
+                daemon.run_due()
+            # the release is not dropped from the schedule
+            self.assertEqual(daemon.due, {b: 1016.0})
+            self.assertEqual(daemon.next_due(), 1016.0)
+
+    def test_control_socket(self):
+        with temp_dir() as d:
+            path = osp.join(d, 'daemon.sock')
+            daemon = Daemon(
+                self.write_config(d, 'org/a'),
+                cache_dir=osp.join(d, 'cache'),
+                control_path=path,
+                factory=create_easy_upgrade,
+            )
+            thread = threading.Thread(target=daemon.run)
+            thread.start()
+            try:
+                for _ in range(100):
+                    if osp.exists(path):
+                        break
+                    time.sleep(0.05)
+                CANDIDATES['org/a'] = '1.0'
+                self.assertEqual(
+                    list(send_command(path, 'check', 'daemon-provider:org/a',
+                                      'foo:bar')),
+                    [
+                        'foo:bar: unknown release',
+                        'daemon-provider:org/a: installed 1.0',
+                    ]
+                )
+                status = list(send_command(path, 'status'))
+                self.assertEqual(len(status), 2)
+                self.assertTrue(status[0].startswith(
+                    'daemon-provider:org/a: next check in '
+                ))
+                self.assertEqual(list(send_command(path, 'reload')),
+                                 ['unchanged'])
+                self.assertEqual(list(send_command(path, 'foo')),
+                                 ['unknown command: foo'])
+            finally:
+                self.assertEqual(list(send_command(path, 'stop')),
+                                 ['stopping'])
+                thread.join(5)
+            self.assertFalse(thread.is_alive())
+            self.assertFalse(osp.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import json
+import os.path as osp
+import re
+import unittest
+
+import requests
+
+from easy_upgrade.download import RangedDownload
+from easy_upgrade.toolbox import temp_dir
+
+from httpd import StandInServer
+
+CONTENT = ''.join(chr(i % 251) for i in range(10000))
+
+
+def ranged_route(content, accept_ranges=True):
+    def route(handler):
+        headers = {'ETag': '"v1"'}
+        if accept_ranges:
+            headers['Accept-Ranges'] = 'bytes'
+        range_header = handler.headers.get('Range')
+        if handler.command == 'HEAD':
+            return 200, headers, content
+        if not accept_ranges or range_header is None:
+            return 200, headers, content
+        start, end = map(int, re.match(r'bytes=(\d+)-(\d+)',
+                                       range_header).groups())
+        headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+            start, end, len(content)
+        )
+        return 206, headers, content[start:end + 1]
+    return route
+
+
+class RangedDownloadTest(unittest.TestCase):
+    def ranges(self, server):
+        return [
+            headers['range'] for method, _, headers, _ in server.requests
+            if method == 'GET'
+        ]
+
+    def test_segments(self):
+        with temp_dir() as d, StandInServer() as server:
+            server.routes['/asset'] = ranged_route(CONTENT)
+            path = osp.join(d, 'asset')
+            download = RangedDownload(
+                requests.Session(), server.url('/asset'), path,
+                segment_size=3000, jobs=3, chunk_size=512
+            )
+            self.assertTrue(download.run())
+            with open(path, 'rb') as istr:
+                self.assertEqual(istr.read(), CONTENT)
+            self.assertEqual(sorted(self.ranges(server)), [
+                'bytes=0-2999', 'bytes=3000-5999',
+                'bytes=6000-8999', 'bytes=9000-9999',
+            ])
+            self.assertFalse(osp.exists(path + '.part'))
+            self.assertFalse(osp.exists(path + '.part.json'))
+
+    def test_resume(self):
+        with temp_dir() as d, StandInServer() as server:
+            server.routes['/asset'] = ranged_route(CONTENT)
+            path = osp.join(d, 'asset')
+            with open(path + '.part', 'wb') as ostr:
+                ostr.write(CONTENT[:6000] + '\0' * 4000)
+            with open(path + '.part.json', 'w') as ostr:
+                json.dump({
+                    'size': len(CONTENT),
+                    'validator': '"v1"',
+                    'segments': [[0, 5000, 5000], [5000, 10000, 1000]],
+                }, ostr)
+            download = RangedDownload(
+                requests.Session(), server.url('/asset'), path,
+                segment_size=5000
+            )
+            self.assertTrue(download.run())
+            with open(path, 'rb') as istr:
+                self.assertEqual(istr.read(), CONTENT)
+            self.assertEqual(self.ranges(server), ['bytes=6000-9999'])
+
+    def test_stale_progress(self):
+        with temp_dir() as d, StandInServer() as server:
+            server.routes['/asset'] = ranged_route(CONTENT)
+            path = osp.join(d, 'asset')
+            with open(path + '.part', 'wb') as ostr:
+                ostr.write('\0' * 10000)
+            with open(path + '.part.json', 'w') as ostr:
+                json.dump({
+                    'size': len(CONTENT),
+                    'validator': '"v0"',
+                    'segments': [[0, 10000, 10000]],
+                }, ostr)
+            download = RangedDownload(
+                requests.Session(), server.url('/asset'), path,
+                segment_size=10000
+            )
+            self.assertTrue(download.run())
+            with open(path, 'rb') as istr:
+                self.assertEqual(istr.read(), CONTENT)
+
+    def test_ranges_not_supported(self):
+        with temp_dir() as d, StandInServer() as server:
+            server.routes['/asset'] = ranged_route(CONTENT, False)
+            path = osp.join(d, 'asset')
+            download = RangedDownload(
+                requests.Session(), server.url('/asset'), path
+            )
+            self.assertFalse(download.run())
+            self.assertFalse(osp.exists(path))
+            self.assertEqual(self.ranges(server), [])
+
+    def test_head_not_allowed(self):
+        with temp_dir() as d, StandInServer() as server:
+            server.routes['/asset'] = lambda handler: (
+                405 if handler.command == 'HEAD' else 200, {}, CONTENT
+            )
+            path = osp.join(d, 'asset')
+            download = RangedDownload(
+                requests.Session(), server.url('/asset'), path
+            )
+            self.assertFalse(download.run())
+            self.assertFalse(osp.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
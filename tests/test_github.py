@@ -1,3 +1,5 @@
+import hashlib
+import json
 import os
 import os.path as osp
 import re
@@ -8,6 +10,16 @@ import unittest
 import yaml
 
 from easy_upgrade.api import EasyUpgrade
+from easy_upgrade.config import yaml_loader
+from easy_upgrade.toolbox import temp_dir
+from easy_upgrade.lib.github import (
+    GitHubProvider,
+    RateLimitExceeded,
+    RateLimitScheduler,
+)
+import easy_upgrade.lib.stow  # noqa
+
+from httpd import StandInServer
 
 
 class GithubTest(unittest.TestCase):
@@ -33,10 +45,7 @@ class GithubTest(unittest.TestCase):
                 'versions': {
                     'candidate': {
                         'human': u'v0.3.1',
-                        'tuple': (
-                            u'00000000', u'00000003',
-                            u'00000001', '*final'
-                        )
+                        'tuple': ((3, 0), (3, 3), (3, 1), (1,))
                     }
                 }
             },
@@ -46,10 +55,7 @@ class GithubTest(unittest.TestCase):
                 'versions': {
                     'candidate': {
                         'human': u'1.3.3',
-                        'tuple': (
-                            u'00000001', u'00000003',
-                            u'00000003', '*final'
-                        )
+                        'tuple': ((3, 1), (3, 3), (3, 3), (1,))
                     }
                 }
             }
@@ -63,7 +69,8 @@ class GithubTest(unittest.TestCase):
         if osp.isdir(self.stow_root_dir):
             shutil.rmtree(self.stow_root_dir)
         eu = EasyUpgrade.from_yaml(self.YAML_CONFIG_FILE)
-        eu.providers['github'].install('docker/compose')
+        [result] = eu.providers['github'].install('docker/compose')
+        self.assertTrue(result.installed, str(result))
         compose_executable = osp.join(
             self.stow_root_dir,
             'stow',
@@ -82,11 +89,461 @@ class GithubTest(unittest.TestCase):
     def register_temp_stow_dir(cls):
         yaml_pattern = re.compile(r'^\<%= temp_stow_dir %\>$')
         cls.stow_root_dir = tempfile.mkdtemp(prefix='stow_root')
-        yaml.add_implicit_resolver('!temp_stow_dir', yaml_pattern)
+        loader = yaml_loader()
+        yaml.add_implicit_resolver('!temp_stow_dir', yaml_pattern,
+                                   Loader=loader)
 
         def temp_stow_dir(loader, node):
             return cls.stow_root_dir
-        yaml.add_constructor('!temp_stow_dir', temp_stow_dir)
+        yaml.add_constructor('!temp_stow_dir', temp_stow_dir, Loader=loader)
+
+
+class GitHubProviderTest(unittest.TestCase):
+    def create_provider(self, **config):
+        config.setdefault('releases', {})
+        return GitHubProvider('github', {'github': config, 'cache-dir': None})
+
+    def test_sessions_per_host(self):
+        provider = self.create_provider(
+            http={'pool-size': 4, 'retries': 2},
+            **{'basic-auth': 'user:token'}
+        )
+        session = provider.session('https://api.github.com/repos/a/b')
+        self.assertIs(
+            provider.session('https://api.github.com/repos/c/d'),
+            session
+        )
+        self.assertIsNot(
+            provider.session('https://github.com/a/b/releases/download'),
+            session
+        )
+        self.assertEqual(session.auth, ('user', 'token'))
+        adapter = session.get_adapter('https://api.github.com')
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter.max_retries.total, 2)
+        provider.close()
+        self.assertIsNot(
+            provider.session('https://api.github.com/repos/a/b'),
+            session
+        )
+
+    def test_connection_reuse(self):
+        provider = self.create_provider()
+        with StandInServer() as server:
+            server.route_json('/releases', [])
+            for _ in range(3):
+                self.assertEqual(
+                    provider.get_json(server.url('/releases')), []
+                )
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(len(server.clients), 1)
+
+    def create_asset_fetcher(self, server, files, cache_dir=None,
+                             **fetch_config):
+        fetch_config.setdefault('name', 'tool-linux')
+        fetch_config.setdefault('file', 'bin/tool')
+        provider = GitHubProvider('github', {
+            'cache-dir': cache_dir,
+            'github': {'releases': {
+                'org/tool': {
+                    'fetch': {'asset': fetch_config},
+                    'install': {
+                        'stow': {'path': '/tmp', 'stow': ['/bin/true']}
+                    },
+                }
+            }}
+        })
+        fetcher = provider.releases['org/tool'].fetcher
+        fetcher.grelease = {'name': '1.0', 'assets': []}
+        for name, content in files.items():
+            server.route('/download/' + name, content, headers={
+                'Content-Type': 'application/octet-stream'
+            })
+            fetcher.grelease['assets'].append({
+                'name': name,
+                'size': len(content),
+                'browser_download_url': server.url('/download/' + name),
+            })
+        return fetcher
+
+    def test_fetch_asset_checksums(self):
+        sha256 = hashlib.sha256('binary').hexdigest()
+        with StandInServer() as server, temp_dir() as d:
+            fetcher = self.create_asset_fetcher(server, {
+                'tool-linux': 'binary',
+                'SHA256SUMS': '{}  tool-darwin\n{} *tool-linux\n'.format(
+                    '0' * 64, sha256
+                ),
+            })
+            fetcher.fetch(d)
+            tool = osp.join(d, 'bin', 'tool')
+            with open(tool) as istr:
+                self.assertEqual(istr.read(), 'binary')
+            self.assertTrue(os.access(tool, os.X_OK))
+
+        with StandInServer() as server, temp_dir() as d:
+            fetcher = self.create_asset_fetcher(server, {
+                'tool-linux': 'corrupted',
+                'SHA256SUMS': '{}  tool-linux\n'.format(sha256),
+            })
+            with self.assertRaises(Exception) as cm:
+                fetcher.fetch(d)
+            self.assertIn('SHA-256 mismatch', cm.exception.message)
+            self.assertFalse(osp.exists(osp.join(d, 'bin', 'tool')))
+
+    def test_fetch_asset_cached(self):
+        with StandInServer() as server, temp_dir() as d:
+            cache_dir = osp.join(d, 'cache')
+            for i in range(2):
+                fetcher = self.create_asset_fetcher(
+                    server, {'tool-linux': 'binary'}, cache_dir
+                )
+                fetcher.fetch(osp.join(d, str(i)))
+            tool = osp.join(d, '1', 'bin', 'tool')
+            with open(tool) as istr:
+                self.assertEqual(istr.read(), 'binary')
+            self.assertTrue(os.access(tool, os.X_OK))
+            downloads = [
+                path for _, path, _, _ in server.requests
+                if path == '/download/tool-linux'
+            ]
+            self.assertEqual(len(downloads), 1)
+
+    def test_fetch_asset_explicit_digest(self):
+        with StandInServer() as server, temp_dir() as d:
+            fetcher = self.create_asset_fetcher(
+                server,
+                {'tool-linux': 'binary'},
+                sha256=hashlib.sha256('binary').hexdigest()
+            )
+            fetcher.fetch(d)
+            fetcher = self.create_asset_fetcher(
+                server,
+                {'tool-linux': 'binary'},
+                checksums='checksums.txt'
+            )
+            with self.assertRaises(Exception):
+                fetcher.fetch(d)
+
+    def test_incremental_release_index(self):
+        def rest_release(i):
+            return {
+                'id': i,
+                'name': '1.{}'.format(i),
+                'prerelease': False,
+                'draft': False,
+                'published_at': '2015-07-01T00:{:02d}:{:02d}Z'.format(
+                    i / 60, i % 60
+                ),
+            }
+        path = '/repos/org/tool/releases'
+        with StandInServer() as server, temp_dir() as d:
+            server.routes[path] = lambda handler: (
+                200,
+                {'Content-Type': 'application/json'},
+                json.dumps([
+                    rest_release(i) for i in published
+                ][100 * (int(handler.path.split('&page=')[-1]) - 1
+                         if '&page=' in handler.path else 0):][:100])
+            )
+
+            def latest_release():
+                provider = GitHubProvider('github', {
+                    'cache-dir': d,
+                    'github': {
+                        'api-root': server.root,
+                        'releases': {'org/tool': {
+                            'fetch': {'asset': {'file': 'bin/tool'}},
+                            'install': {'stow': {
+                                'path': d, 'stow': ['/bin/true']
+                            }},
+                        }}
+                    }
+                })
+                release = provider.releases['org/tool']
+                try:
+                    return release.get_latest_release()['name']
+                finally:
+                    provider.close()
+
+            published = range(250, 0, -1)
+            self.assertEqual(latest_release(), '1.250')
+            self.assertEqual(len(server.requests), 3)
+            del server.requests[:]
+            published = range(260, 0, -1)
+            self.assertEqual(latest_release(), '1.260')
+            # only the first page is retrieved
+            self.assertEqual(len(server.requests), 1)
+            # releases deleted on GitHub are removed from the index
+            published = range(258, 0, -1)
+            self.assertEqual(latest_release(), '1.258')
+
+    def test_adaptive_polling(self):
+        path = '/repos/org/tool/releases'
+        with StandInServer() as server, temp_dir() as d:
+            server.route_json(path, [{
+                'id': 1,
+                'name': '1.0',
+                'tag_name': '1.0',
+                'prerelease': False,
+                'draft': False,
+                'published_at': '2015-07-01T00:00:00Z',
+                'assets': [],
+            }])
+            eu = EasyUpgrade({
+                'cache-dir': d,
+                'github': {
+                    'api-root': server.root,
+                    'http-cache': False,
+                    'polling': {'min-interval': 600},
+                    'releases': {'org/tool': {
+                        'fetch': {'asset': {'file': 'bin/tool'}},
+                        'install': {'stow': {
+                            'path': d, 'stow': ['/bin/true']
+                        }},
+                    }}
+                }
+            })
+            with eu:
+                [pkg] = eu.get_outdated_packages()
+                self.assertEqual(pkg['versions']['candidate']['human'],
+                                 '1.0')
+                self.assertEqual(len(server.requests), 1)
+                index = eu.providers['github'].release_index
+                release = eu.providers['github'].releases['org/tool']
+                poll = index.poll('org/tool')
+                self.assertEqual(poll['interval'], 600)
+                # not due yet, answered from the release index
+                release.reset()
+                [pkg] = eu.get_outdated_packages()
+                self.assertEqual(pkg['versions']['candidate']['human'],
+                                 '1.0')
+                self.assertEqual(len(server.requests), 1)
+                # listing all packages still checks every repository
+                release.reset()
+                self.assertEqual(len(list(eu.get_packages_version())), 1)
+                self.assertEqual(len(server.requests), 2)
+                # nothing new, next check is postponed
+                self.assertEqual(index.poll('org/tool')['interval'], 1200)
+                with index.db:
+                    index.db.execute('UPDATE polls SET next_check = 0')
+                release.reset()
+                self.assertEqual(len(list(eu.get_outdated_packages())), 1)
+                self.assertEqual(len(server.requests), 3)
+
+    @classmethod
+    def graphql_node(cls, name, published_at, prerelease=False):
+        return {
+            'databaseId': int(name.replace('.', '').replace('rc', '')),
+            'name': name,
+            'tagName': name,
+            'isPrerelease': prerelease,
+            'isDraft': False,
+            'publishedAt': published_at,
+            'releaseAssets': {
+                'nodes': [{
+                    'id': 'MDEy' + name,
+                    'name': 'tool-linux',
+                    'size': 42,
+                    'contentType': 'application/octet-stream',
+                    'downloadUrl': 'https://github.com/' + name,
+                }]
+            }
+        }
+
+    def test_graphql_resolution(self):
+        def graphql(handler):
+            payload = json.loads(handler.body)
+            variables = payload['variables']
+            self.assertIn('r0: repository(owner: $o0, name: $n0)',
+                          payload['query'])
+            data = {}
+            for key, value in variables.items():
+                if not key.startswith('n'):
+                    continue
+                alias = 'r' + key[1:]
+                if value == 'unknown':
+                    data[alias] = None
+                    continue
+                data[alias] = {
+                    'releases': {
+                        'pageInfo': {'hasNextPage': value == 'partial'},
+                        'nodes': [
+                            self.graphql_node('2.0rc1', '2015-08-01T00:00:00Z',
+                                              prerelease=True),
+                            self.graphql_node('1.1', '2015-07-01T00:00:00Z'),
+                            self.graphql_node('1.0', '2015-06-01T00:00:00Z'),
+                        ],
+                    }
+                }
+            return 200, {'Content-Type': 'application/json'}, json.dumps({
+                'data': data
+            })
+
+        release_config = {
+            'fetch': {'asset': {'file': 'bin/tool'}},
+            'install': {'stow': {'path': '/tmp', 'stow': ['/bin/true']}},
+        }
+        with StandInServer() as server:
+            server.routes['/graphql'] = graphql
+            server.route_json('/repos/org/unknown/releases', [])
+            server.route_json('/repos/org/partial/releases', [])
+            provider = self.create_provider(
+                releases=dict(
+                    ('org/' + name, dict(release_config))
+                    for name in ['foo', 'bar', 'unknown', 'partial']
+                ),
+                resolution='graphql',
+                **{'api-root': server.root, 'graphql-batch-size': 3}
+            )
+            provider.releases['org/partial']['name'] = '0.*'
+            provider.releases['org/partial'].name_filter = '0.*'
+            provider.prefetch(provider.releases.values())
+            self.assertEqual(
+                [method for method, _, _, _ in server.requests],
+                ['POST', 'POST']
+            )
+            candidates = dict(
+                (name, release.fetcher.candidate_version())
+                for name, release in provider.releases.items()
+            )
+            self.assertEqual(candidates, {
+                'org/foo': '1.1',
+                'org/bar': '1.1',
+                'org/unknown': None,
+                'org/partial': None,
+            })
+            self.assertEqual(
+                sorted(path for _, path, _, _ in server.requests[2:]),
+                ['/repos/org/partial/releases', '/repos/org/unknown/releases']
+            )
+            asset = provider.releases['org/foo'].fetcher.grelease['assets'][0]
+            self.assertEqual(asset['browser_download_url'],
+                             'https://github.com/1.1')
+
+    def test_graphql_failure(self):
+        with StandInServer() as server:
+            server.routes['/graphql'] = lambda handler: (
+                401, {'Content-Type': 'application/json'},
+                json.dumps({'message': 'Bad credentials'})
+            )
+            server.route_json('/repos/org/tool/releases', [])
+            provider = self.create_provider(
+                releases=dict(
+                    ('org/' + name, {
+                        'fetch': {'asset': {'file': 'bin/tool'}},
+                        'install': {'stow': {'path': '/tmp',
+                                             'stow': ['/bin/true']}},
+                    })
+                    for name in ['tool', 'other']
+                ),
+                resolution='graphql',
+                **{'api-root': server.root, 'graphql-batch-size': 1}
+            )
+            provider.prefetch(provider.releases.values())
+            # remaining batches are not attempted
+            self.assertEqual(len(server.requests), 1)
+            release = provider.releases['org/tool']
+            self.assertIsNone(release.prefetched)
+            self.assertIsNone(release.fetcher.candidate_version())
+            self.assertEqual(server.requests[-1][1],
+                             '/repos/org/tool/releases')
+
+
+class FakeResponse(object):
+    def __init__(self, status_code=200, text='', **headers):
+        self.status_code = status_code
+        self.text = text
+        self.headers = dict(
+            (key.replace('_', '-'), str(value))
+            for key, value in headers.items()
+        )
+
+
+class FakeSession(object):
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url))
+        return self.responses.pop(0)
+
+
+class RateLimitSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.sleeps = []
+        self.scheduler = RateLimitScheduler(
+            reserve=1,
+            sleep=self.sleep,
+            clock=lambda: self.now,
+        )
+
+    def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+    @classmethod
+    def budget(cls, remaining, reset=1100, status_code=200, **headers):
+        headers.update({
+            'X_RateLimit_Limit': 60,
+            'X_RateLimit_Remaining': remaining,
+            'X_RateLimit_Reset': reset,
+        })
+        return FakeResponse(status_code, **headers)
+
+    def test_pacing(self):
+        session = self.scheduler.session(FakeSession(
+            self.budget(2),
+            self.budget(1),
+            self.budget(0),
+            self.budget(59, reset=4700),
+        ))
+        session.get('https://api.github.com/repos/a/b/releases')
+        session.get('https://api.github.com/repos/a/c/releases')
+        self.assertEqual(self.sleeps, [])
+        # budget is within the reserve, only install requests may proceed
+        with self.scheduler.priority('install'):
+            session.get('https://api.github.com/repos/a/d/releases')
+        self.assertEqual(self.sleeps, [])
+        session.get('https://api.github.com/repos/a/e/releases')
+        self.assertEqual(self.sleeps, [100])
+        self.assertEqual(self.scheduler.requests, 4)
+        self.assertEqual(self.scheduler.consumed, 4)
+        self.assertIn('core 59/60 remaining', self.scheduler.report())
+
+    def test_not_modified_is_free(self):
+        session = self.scheduler.session(FakeSession(
+            self.budget(10),
+            self.budget(10, status_code=304),
+        ))
+        session.get('https://api.github.com/repos/a/b/releases')
+        session.get('https://api.github.com/repos/a/b/releases')
+        self.assertEqual(self.scheduler.consumed, 1)
+
+    def test_secondary_rate_limit(self):
+        fake_session = FakeSession(
+            FakeResponse(403, Retry_After=30),
+            FakeResponse(403, text='You have exceeded a secondary rate limit'),
+            FakeResponse(200),
+        )
+        session = self.scheduler.session(fake_session)
+        response = session.get('https://api.github.com/repos/a/b/releases')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(fake_session.calls), 3)
+        # Retry-After, then exponential backoff
+        self.assertEqual(self.sleeps, [30, 120])
+        # subsequent requests are spaced
+        self.assertEqual(self.scheduler.interval, 1)
+
+    def test_exhausted_budget(self):
+        self.scheduler.max_wait = 60
+        session = self.scheduler.session(FakeSession(
+            self.budget(0, status_code=403, reset=4600),
+        ))
+        with self.assertRaises(RateLimitExceeded):
+            session.get('https://api.github.com/repos/a/b/releases')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+import os.path as osp
+import unittest
+
+from easy_upgrade.manifest import Manifest
+from easy_upgrade.toolbox import temp_dir
+
+
+class ManifestTest(unittest.TestCase):
+    def test_digests(self):
+        with temp_dir() as d, temp_dir() as root:
+            tool, lib = osp.join(root, 'bin', 'tool'), osp.join(root, 'lib')
+            os.mkdir(osp.dirname(tool))
+            for path in [tool, lib]:
+                with open(path, 'w') as ostr:
+                    ostr.write('tool')
+            os.symlink('bin/tool', osp.join(root, 'tool'))
+            path = osp.join(d, 'manifests', 'tool.json')
+            manifest = Manifest(path)
+            manifest.add_version('1.0', root, digests={'lib': 'abc'})
+            self.assertEqual(manifest.files('1.0')['bin/tool']['size'], 4)
+            self.assertNotIn('sha256', manifest.files('1.0')['bin/tool'])
+            digest = hashlib.sha256('tool').hexdigest()
+            expected = {'bin/tool': digest, 'lib': 'abc', 'tool': None}
+            self.assertEqual(manifest.digests('1.0'), expected)
+            # digests computed are saved
+            os.remove(tool)
+            self.assertEqual(Manifest(path).digests('1.0'), expected)
+            os.remove(osp.join(root, 'tool'))
+            manifest.add_version('1.1', root)
+            with open(lib, 'a') as ostr:
+                ostr.write('modified')
+            self.assertEqual(manifest.digests('1.1'), {'lib': None})
+
+    def test_transactions(self):
+        with temp_dir() as d:
+            path = osp.join(d, 'manifests', 'tool.json')
+            manifest = Manifest(path)
+            self.assertFalse(manifest.exists())
+            self.assertIsNone(manifest.active)
+            self.assertEqual(manifest.versions(), [])
+            manifest.add_version('1.0', d)
+            manifest.activate('1.0')
+            with self.assertRaises(Exception):
+                manifest.activate('2.0')
+            with self.assertRaises(ValueError):
+                with manifest.transaction() as data:
+                    data['active'] = None
+                    raise ValueError()
+            self.assertEqual(manifest.active, '1.0')
+
+            manifest = Manifest(path)
+            self.assertEqual(manifest.active, '1.0')
+            self.assertEqual(manifest.versions(), ['1.0'])
+            self.assertEqual(manifest.files('1.0'), {})
+            manifest.remove_version('1.0')
+            with open(path) as istr:
+                self.assertEqual(json.load(istr), {
+                    'active': None,
+                    'previous': None,
+                    'versions': {},
+                })
+
+
+if __name__ == '__main__':
+    unittest.main()
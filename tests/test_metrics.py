@@ -0,0 +1,147 @@
+import os
+import os.path as osp
+import stat
+import unittest
+
+from easy_upgrade.api import (
+    EasyUpgrade,
+    Fetcher,
+    Installer,
+    ReleaseProvider,
+)
+from easy_upgrade.metrics import Metrics
+from easy_upgrade.toolbox import temp_dir
+
+INSTALLED = {}
+
+
+class MetricsFetcher(Fetcher):
+    name = 'metrics-fetch'
+
+    def candidate_version(self):
+        return '1.1'
+
+    def fetch(self, output_directory):
+        if self.release.name == 'org/broken':
+            raise Exception("download failed")
+
+
+class MetricsInstaller(Installer):
+    name = 'metrics-install'
+
+    def installed_version(self):
+        return INSTALLED.get(self.release.name)
+
+    def install(self, fetched_items_path, version):
+        INSTALLED[self.release.name] = version
+
+
+class MetricsProvider(ReleaseProvider):
+    def __init__(self, top_config):
+        super(MetricsProvider, self).__init__('metrics-provider', top_config)
+
+    def collect_metrics(self, metrics):
+        metrics.set('provider_up', 1, provider=self.name)
+
+
+RELEASE = {
+    'fetch': {'metrics-fetch': {}},
+    'install': {'metrics-install': {}},
+}
+
+
+class MetricsTest(unittest.TestCase):
+    def test_render(self):
+        metrics = Metrics()
+        metrics.set('release_outdated', 1, 'Outdated release',
+                    provider='github', release='org/"tool"')
+        metrics.inc('installs_total', provider='github')
+        metrics.inc('installs_total', 2, provider='github')
+        metrics.observe('duration_seconds', 0.3, 'Duration',
+                        buckets=(0.5, 1), stage='fetch')
+        metrics.observe('duration_seconds', 2, 'Duration',
+                        buckets=(0.5, 1), stage='fetch')
+        self.assertEqual(metrics.get('installs_total', provider='github'), 3)
+        self.assertIsNone(metrics.get('installs_total', provider='other'))
+        with self.assertRaises(Exception):
+            metrics.inc('release_outdated')
+        self.assertEqual(metrics.render(), '\n'.join([
+            '# HELP easy_upgrade_release_outdated Outdated release',
+            '# TYPE easy_upgrade_release_outdated gauge',
+            'easy_upgrade_release_outdated'
+            '{provider="github",release="org/\\"tool\\""} 1',
+            '# TYPE easy_upgrade_installs_total counter',
+            'easy_upgrade_installs_total{provider="github"} 3',
+            '# HELP easy_upgrade_duration_seconds Duration',
+            '# TYPE easy_upgrade_duration_seconds histogram',
+            'easy_upgrade_duration_seconds_bucket{stage="fetch",le="0.5"} 1',
+            'easy_upgrade_duration_seconds_bucket{stage="fetch",le="1"} 1',
+            'easy_upgrade_duration_seconds_bucket{stage="fetch",le="+Inf"} 2',
+            'easy_upgrade_duration_seconds_sum{stage="fetch"} 2.3',
+            'easy_upgrade_duration_seconds_count{stage="fetch"} 2',
+        ]) + '\n')
+
+    def test_easy_upgrade(self):
+        INSTALLED.clear()
+        INSTALLED['org/current'] = '1.1'
+        with temp_dir() as d:
+            path = osp.join(d, 'metrics', 'easy_upgrade.prom')
+            config = {
+                'cache-dir': osp.join(d, 'cache'),
+                'metrics-file': path,
+                'metrics-provider': {'releases': {
+                    'org/current': RELEASE,
+                    'org/outdated': RELEASE,
+                    'org/broken': RELEASE,
+                }},
+            }
+            eu = EasyUpgrade(config)
+            eu.providers['metrics-provider'] = MetricsProvider(config)
+            with eu:
+                self.assertEqual(len(list(eu.get_outdated_packages())), 2)
+                metrics = eu.metrics
+
+                def sample(name, release, **labels):
+                    return metrics.get(name, provider='metrics-provider',
+                                       release=release, **labels)
+                self.assertEqual(sample('release_outdated', 'org/current'), 0)
+                self.assertEqual(sample('release_outdated', 'org/broken'), 1)
+                self.assertEqual(
+                    sample('release_resolution_duration_seconds',
+                           'org/current')['count'],
+                    1
+                )
+                eu.install()
+                self.assertEqual(sample('release_outdated', 'org/outdated'),
+                                 0)
+                self.assertEqual(sample('release_outdated', 'org/broken'), 1)
+                self.assertEqual(sample('release_failed', 'org/broken'), 1)
+                self.assertEqual(sample('release_failed', 'org/outdated'), 0)
+                self.assertEqual(
+                    sample('release_installs_total', 'org/current',
+                           status='up-to-date'),
+                    1
+                )
+                self.assertEqual(
+                    sample('release_stage_duration_seconds', 'org/outdated',
+                           stage='install')['count'],
+                    1
+                )
+                self.assertFalse(osp.exists(path))
+            with open(path) as istr:
+                content = istr.read()
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o644)
+        self.assertIn(
+            'easy_upgrade_release_failed'
+            '{provider="metrics-provider",release="org/broken"} 1\n',
+            content
+        )
+        self.assertIn(
+            'easy_upgrade_provider_up{provider="metrics-provider"} 1\n',
+            content
+        )
+        self.assertIn('easy_upgrade_last_update_timestamp_seconds ', content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import logging
+import threading
+import unittest
+
+from easy_upgrade.pipeline import InstallResult, Pipeline
+
+
+class FakeProvider(object):
+    name = 'fake'
+
+
+class FakeRelease(object):
+    def __init__(self, name, version, events, fail=False):
+        self.provider = FakeProvider()
+        self.name = name
+        self.version = version
+        self.events = events
+        self.fail = fail
+        self.logger = logging.getLogger(name)
+
+    def resolve(self):
+        return self.version
+
+    def fetch(self, version):
+        self.events.setdefault(('fetch', self.name), threading.Event()).set()
+        if self.fail:
+            raise Exception("download failed")
+        return '/tmp/' + self.name
+
+    def deploy(self, fetched_items_path, version):
+        if self.name == 'a':
+            # wait for the fetch of the next release to start
+            event = self.events.setdefault(('fetch', 'b'), threading.Event())
+            self.events['overlap'] = event.wait(5)
+
+
+class PipelineTest(unittest.TestCase):
+    def test_from_config(self):
+        def pools(config):
+            pipeline = Pipeline.from_config(config)
+            return (pipeline.resolve_jobs, pipeline.fetch_jobs,
+                    pipeline.install_jobs)
+        self.assertEqual(pools({'jobs': 3}), (3, 3, 1))
+        self.assertEqual(pools({'pipeline': {'fetch-jobs': 8}}), (1, 8, 1))
+
+    def test_run(self):
+        events = {}
+        releases = [
+            FakeRelease('a', '1.0', events),
+            FakeRelease('b', '2.0', events),
+            FakeRelease('c', None, events),
+            FakeRelease('d', '1.1', events, fail=True),
+        ]
+        results = Pipeline(resolve_jobs=2, fetch_jobs=2).run(releases)
+        self.assertTrue(events['overlap'])
+        self.assertEqual(
+            [(r.release.name, r.status, r.version) for r in results],
+            [
+                ('a', InstallResult.INSTALLED, '1.0'),
+                ('b', InstallResult.INSTALLED, '2.0'),
+                ('c', InstallResult.UP_TO_DATE, None),
+                ('d', InstallResult.FAILED, None),
+            ]
+        )
+        self.assertEqual(str(results[3]),
+                         'fake:d: failed (download failed)')
+        self.assertEqual(
+            [sorted(r.durations) for r in results],
+            [
+                ['fetch', 'install', 'resolve'],
+                ['fetch', 'install', 'resolve'],
+                ['resolve'],
+                ['fetch', 'resolve'],
+            ]
+        )
+        self.assertEqual(Pipeline().run([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
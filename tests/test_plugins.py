@@ -0,0 +1,60 @@
+import json
+import os.path as osp
+import unittest
+
+from easy_upgrade.plugins import PluginRegistry
+from easy_upgrade.toolbox import temp_dir
+
+
+class PluginRegistryTest(unittest.TestCase):
+    def test_scan(self):
+        registry = PluginRegistry.scan()
+        self.assertEqual(
+            registry.providers['github'],
+            'easy_upgrade.lib.github:GitHubProvider'
+        )
+        self.assertEqual(
+            registry.actions['Installer']['stow'],
+            'easy_upgrade.lib.stow'
+        )
+        self.assertEqual(
+            registry.actions['Fetcher']['asset'],
+            'easy_upgrade.lib.github'
+        )
+        self.assertEqual(
+            registry.actions['Fetcher']['archive'],
+            'easy_upgrade.lib.archive'
+        )
+        self.assertTrue(registry.load_action('Installer', 'stow'))
+        self.assertFalse(registry.load_action('Installer', 'unknown'))
+        from easy_upgrade.lib.github import GitHubProvider
+        self.assertIs(registry.load_provider('github'), GitHubProvider)
+
+    def test_persistence(self):
+        with temp_dir() as d:
+            registry = PluginRegistry.load(d)
+            path = osp.join(d, 'plugins.json')
+            self.assertTrue(osp.isfile(path))
+            scan = PluginRegistry.scan
+
+            def fail():
+                raise Exception("unexpected scan")
+            PluginRegistry.scan = staticmethod(fail)
+            try:
+                cached = PluginRegistry.load(d)
+            finally:
+                PluginRegistry.scan = scan
+            self.assertEqual(cached.actions, registry.actions)
+            self.assertEqual(cached.providers, registry.providers)
+            # registry is scanned again when distributions change
+            with open(path) as istr:
+                data = json.load(istr)
+            data['fingerprint'] = 'outdated'
+            data['providers'] = {}
+            with open(path, 'w') as ostr:
+                json.dump(data, ostr)
+            self.assertIn('github', PluginRegistry.load(d).providers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from easy_upgrade.lib.github import GitHubProvider, graphql_releases_query
+from easy_upgrade.lib.relay import GitHubRelay, RelayServer, SingleFlight
+
+from httpd import StandInServer
+
+ASSET_PATH = '/org/tool/releases/download/v1.0/tool'
+ASSET = ''.join(chr(i % 256) for i in range(100000))
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_coalescing(self):
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return 42
+
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(flights.do('key', slow))
+            )
+            for _ in range(5)
+        ]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(flights.executions, 1)
+
+        def fail():
+            raise ValueError('boom')
+        with self.assertRaises(ValueError):
+            flights.do('key', fail)
+        self.assertEqual(flights.do('key', lambda: 43), 43)
+
+
+class RelayTest(unittest.TestCase):
+    def setUp(self):
+        self.upstream = StandInServer().__enter__()
+        self.upstream.route_json(
+            '/repos/org/tool/releases',
+            [{'name': '1.0'}],
+            headers={'ETag': '"v1"'}
+        )
+
+        def slow_asset(handler):
+            time.sleep(0.2)
+            return 200, {'Content-Type': 'application/octet-stream'}, ASSET
+        self.upstream.routes[ASSET_PATH] = slow_asset
+        self.cache_dir = tempfile.mkdtemp()
+        self.relay_provider = GitHubProvider('github', {
+            'cache-dir': self.cache_dir,
+            'github': {
+                'releases': {'org/tool': {}},
+                'api-root': self.upstream.root,
+                'download-root': self.upstream.root,
+            },
+        })
+        self.relay = GitHubRelay(self.relay_provider, metadata_ttl=60)
+        self.server = RelayServer(self.relay, ('127.0.0.1', 0))
+        self.thread = threading.Thread(
+            target=self.server.serve_forever,
+            kwargs=dict(poll_interval=0.05)
+        )
+        self.thread.start()
+        root = 'http://{}:{}'.format(*self.server.server_address)
+        self.client = GitHubProvider('github', {
+            'cache-dir': None,
+            'github': {
+                'releases': {},
+                'api-root': root + '/api',
+                'download-root': root + '/download',
+            },
+        })
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.relay_provider.close()
+        self.upstream.__exit__(None, None, None)
+        shutil.rmtree(self.cache_dir)
+
+    def upstream_requests(self, path):
+        return [r for r in self.upstream.requests if r[1].startswith(path)]
+
+    def test_metadata(self):
+        url = self.client.api_root + '/repos/org/tool/releases'
+        for _ in range(3):
+            self.assertEqual(self.client.get_json(url), [{'name': '1.0'}])
+        self.assertEqual(len(self.upstream_requests('/repos/org/tool')), 1)
+        session = self.client.session(url)
+        etag = session.get(url).headers['ETag']
+        response = session.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        # expired metadata is revalidated upstream
+        self.relay.metadata_ttl = 0
+        self.relay.metadata.clear()
+        self.assertEqual(self.client.get_json(url), [{'name': '1.0'}])
+        requests = self.upstream_requests('/repos/org/tool')
+        self.assertEqual(requests[-1][2].get('if-none-match'), '"v1"')
+        response = session.get(self.client.api_root + '/repos/org/unknown')
+        self.assertEqual(response.status_code, 404)
+
+    def test_relayed_resources(self):
+        self.upstream.route_json('/repos/org/other/releases', [])
+        self.upstream.route_json('/graphql', {'data': {}})
+        session = self.client.session(self.client.api_root)
+        for path in ['/api/repos/org/other/releases', '/api/user',
+                     '/api/repos/org/tool/releases/../../other/releases',
+                     '/download/org/other/releases/download/v1.0/tool']:
+            response = session.get(self.client.api_root[:-len('/api')] +
+                                   path)
+            self.assertEqual(response.status_code, 404, path)
+        url = self.client.api_root + '/graphql'
+
+        def post(query, **variables):
+            return session.post(url, data=json.dumps({
+                'query': query,
+                'variables': variables,
+            })).status_code
+        self.assertEqual(
+            post(graphql_releases_query(1), count=20, o0='org', n0='tool'),
+            200
+        )
+        self.assertEqual(
+            post(graphql_releases_query(1), count=20, o0='org', n0='other'),
+            403
+        )
+        self.assertEqual(
+            post('mutation { deleteRepository }', count=20), 403
+        )
+        self.assertEqual(len(self.upstream_requests('/graphql')), 1)
+        self.assertEqual(self.upstream_requests('/repos/org/other'), [])
+
+    def test_assets(self):
+        asset = {
+            'browser_download_url': 'https://github.com' + ASSET_PATH,
+        }
+        url = self.client.asset_url(asset)
+        self.assertEqual(url, self.client.download_root + ASSET_PATH)
+        session = self.client.session(url)
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(session.get(url)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([r.content for r in responses], [ASSET] * 4)
+        self.assertEqual(len(self.upstream_requests(ASSET_PATH)), 1)
+
+        response = session.get(url, headers={'Range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, ASSET[10:20])
+        self.assertEqual(response.headers['Content-Range'],
+                         'bytes 10-19/{}'.format(len(ASSET)))
+        response = session.head(url)
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(int(response.headers['Content-Length']), len(ASSET))
+        self.assertEqual(len(self.upstream_requests(ASSET_PATH)), 1)
+        self.assertEqual(
+            hashlib.sha256(session.get(url).content).hexdigest(),
+            hashlib.sha256(ASSET).hexdigest()
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import os.path as osp
+import unittest
+
+from easy_upgrade.lib.github import parse_date
+from easy_upgrade.lib.release_index import (
+    ReleaseIndex,
+    glob_pattern,
+    poll_interval,
+    release_cadence,
+)
+from easy_upgrade.toolbox import temp_dir
+
+
+def release(id, name, published_at, prerelease=False, draft=False):
+    return {
+        'id': id,
+        'name': name,
+        'prerelease': prerelease,
+        'draft': draft,
+        'published_at': published_at,
+    }
+
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+RELEASES = [
+    release(5, 'v0.4.0-rc1', '2015-08-01T00:00:00Z', prerelease=True),
+    release(4, 'v0.4.0-draft', None, draft=True),
+    release(3, 'v0.3.1', '2015-07-15T00:00:00Z'),
+    release(2, 'v0.3.0', '2015-07-01T00:00:00Z'),
+    release(1, 'v0.2.0', '2015-06-01T00:00:00Z'),
+]
+
+
+class ReleaseIndexTest(unittest.TestCase):
+    def test_latest(self):
+        with temp_dir() as d:
+            index = ReleaseIndex(osp.join(d, 'index.sqlite'), parse_date)
+            self.assertIsNone(index.latest('org/repo'))
+            index.update('org/repo', RELEASES)
+            index.update('org/other', RELEASES[-1:])
+            self.assertEqual(index.known_ids('org/other'), set([1]))
+            self.assertEqual(index.latest('org/repo')['id'], 3)
+            self.assertEqual(
+                index.latest('org/repo', with_prerelease=True)['id'], 5
+            )
+            self.assertEqual(
+                index.latest('org/repo', name_filter='v0.2.*')['id'], 1
+            )
+            self.assertEqual(
+                index.latest('org/repo', name_filter='v0.3.[!1]')['id'], 2
+            )
+            self.assertEqual(
+                index.latest('org/repo', with_draft=True,
+                             name_filter='*draft')['id'],
+                4
+            )
+            index.close()
+
+    def test_remove_missing(self):
+        with temp_dir() as d:
+            index = ReleaseIndex(osp.join(d, 'index.sqlite'), parse_date)
+            index.update('org/repo', RELEASES)
+            index.update('org/other', RELEASES)
+            # v0.3.1 deleted, v0.2.0 beyond the listed page
+            index.remove_missing('org/repo', RELEASES[:2] + RELEASES[3:4])
+            self.assertEqual(index.known_ids('org/repo'), set([1, 2, 4, 5]))
+            self.assertEqual(index.latest('org/repo')['id'], 2)
+            index.remove_missing('org/repo', RELEASES[:1], complete=True)
+            self.assertEqual(index.known_ids('org/repo'), set([5]))
+            self.assertEqual(len(index.known_ids('org/other')), 5)
+            index.close()
+
+    def test_persistence(self):
+        with temp_dir() as d:
+            path = osp.join(d, 'cache', 'index.sqlite')
+            index = ReleaseIndex(path, parse_date)
+            index.update('org/repo', RELEASES[2:])
+            index.close()
+            index = ReleaseIndex(path, parse_date)
+            self.assertEqual(index.known_ids('org/repo'), set([1, 2, 3]))
+            self.assertEqual(index.latest('org/repo'), RELEASES[2])
+            index.close()
+
+    def test_poll(self):
+        with temp_dir() as d:
+            index = ReleaseIndex(osp.join(d, 'index.sqlite'), parse_date)
+            self.assertIsNone(index.poll('org/repo'))
+            self.assertTrue(index.is_due('org/repo', 0))
+            index.update('org/repo', RELEASES)
+            published = index.publications('org/repo')
+            self.assertEqual(len(published), 4)
+            now = max(published) + DAY
+            next_check = index.record_poll('org/repo', published, now,
+                                           min_interval=HOUR)
+            self.assertEqual(next_check, now + HOUR)
+            self.assertFalse(index.is_due('org/repo', now + 1))
+            self.assertTrue(index.is_due('org/repo', now + HOUR))
+            index.record_poll('org/repo', published, now + HOUR,
+                              min_interval=HOUR)
+            self.assertEqual(index.poll('org/repo'), {
+                'checked_at': now + HOUR,
+                'next_check': now + 3 * HOUR,
+                'interval': 2 * HOUR,
+                'latest': max(published),
+            })
+            index.close()
+
+    def test_release_cadence(self):
+        self.assertIsNone(release_cadence([]))
+        self.assertIsNone(release_cadence([10]))
+        self.assertEqual(release_cadence([0, 10, 30, 35]), 10)
+
+    def test_poll_interval(self):
+        def interval(previous_interval, latest, previous_latest=0,
+                     published=None):
+            published = published or [latest]
+            previous = None
+            if previous_interval is not None:
+                previous = dict(interval=previous_interval,
+                                latest=previous_latest)
+            return poll_interval(published, 100 * DAY, previous,
+                                 min_interval=HOUR, max_interval=7 * DAY)
+        # first check
+        self.assertEqual(interval(None, 0), HOUR)
+        # quiet repository: exponential backoff up to maximum staleness
+        self.assertEqual(interval(HOUR, 0), 2 * HOUR)
+        self.assertEqual(interval(4 * DAY, 0), 7 * DAY)
+        # new release
+        self.assertEqual(interval(4 * DAY, 99 * DAY), HOUR)
+        # daily releases: next one is expected soon
+        daily = [DAY * i for i in range(90, 100)]
+        self.assertEqual(interval(4 * DAY, 99 * DAY, 99 * DAY, daily),
+                         DAY / 4)
+        self.assertEqual(interval(HOUR, 99 * DAY, 99 * DAY, daily),
+                         2 * HOUR)
+        # daily releases stopped long ago
+        daily = [DAY * i for i in range(10, 20)]
+        self.assertEqual(interval(4 * DAY, 19 * DAY, 19 * DAY, daily),
+                         7 * DAY)
+
+    def test_glob_pattern(self):
+        self.assertEqual(glob_pattern('v0.[!3].*'), 'v0.[^3].*')
+
+
+if __name__ == '__main__':
+    unittest.main()
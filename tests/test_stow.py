@@ -0,0 +1,196 @@
+import os
+import os.path as osp
+import unittest
+
+from easy_upgrade.lib import stow
+from easy_upgrade.lib.stow import StowInstaller, SymlinkFarm
+from easy_upgrade.toolbox import temp_dir
+from easy_upgrade.version import get_scheme
+
+
+def touch(path):
+    if not osp.isdir(osp.dirname(path)):
+        os.makedirs(osp.dirname(path))
+    with open(path, 'w') as ostr:
+        ostr.write(path)
+
+
+class FakeProvider(object):
+    name = 'github'
+
+
+class FakeRelease(object):
+    name = 'org/tool'
+    pkg_name = 'tool'
+    version_scheme = get_scheme()
+
+
+class SymlinkFarmTest(unittest.TestCase):
+    def create_package(self, root, package, *files):
+        for f in files:
+            touch(osp.join(root, 'stow', package, f))
+
+    def links(self, root):
+        links = {}
+        for parent, dirs, files in os.walk(root):
+            if parent.startswith(osp.join(root, 'stow')):
+                continue
+            for name in dirs + files:
+                path = osp.join(parent, name)
+                if osp.islink(path):
+                    links[osp.relpath(path, root)] = os.readlink(path)
+        return links
+
+    def test_switch(self):
+        with temp_dir() as d:
+            self.create_package(d, 'tool-1', 'bin/tool', 'share/doc/README')
+            self.create_package(d, 'tool-2', 'bin/tool', 'bin/tool2')
+            touch(osp.join(d, 'bin', 'unrelated'))
+            farm = SymlinkFarm(d, osp.join(d, 'stow'))
+            farm.switch('tool-1')
+            self.assertEqual(self.links(d), {
+                'bin/tool': '../stow/tool-1/bin/tool',
+                'share/doc/README': '../../stow/tool-1/share/doc/README',
+            })
+            with open(osp.join(d, 'share', 'doc', 'README')) as istr:
+                self.assertIn('tool-1', istr.read())
+            self.assertEqual(farm.plan('tool-1', ['tool-2']), [])
+
+            operations = farm.plan('tool-2', ['tool-1'])
+            self.assertEqual(operations, [
+                ('unlink', 'bin/tool', None),
+                ('link', 'bin/tool', '../stow/tool-2/bin/tool'),
+                ('link', 'bin/tool2', '../stow/tool-2/bin/tool2'),
+                ('unlink', 'share/doc/README', None),
+                ('prune', 'share/doc', None),
+            ])
+            farm.apply(operations)
+            self.assertEqual(self.links(d), {
+                'bin/tool': '../stow/tool-2/bin/tool',
+                'bin/tool2': '../stow/tool-2/bin/tool2',
+            })
+            self.assertFalse(osp.lexists(osp.join(d, 'share')))
+            self.assertTrue(osp.isfile(osp.join(d, 'bin', 'unrelated')))
+
+            farm.unstow('tool-2')
+            self.assertEqual(self.links(d), {})
+            self.assertTrue(osp.isfile(osp.join(d, 'bin', 'unrelated')))
+
+    def test_conflicts(self):
+        with temp_dir() as d:
+            self.create_package(d, 'tool-1', 'bin/tool', 'lib/libtool.so')
+            self.create_package(d, 'other-1', 'bin/tool')
+            touch(osp.join(d, 'lib'))
+            farm = SymlinkFarm(d, osp.join(d, 'stow'))
+            farm.switch('other-1')
+            with self.assertRaises(Exception) as cm:
+                farm.switch('tool-1')
+            message = str(cm.exception)
+            self.assertIn('bin/tool => other-1/bin/tool', message)
+            self.assertIn('not a directory: lib', message)
+            # nothing has been modified
+            self.assertEqual(self.links(d), {
+                'bin/tool': '../stow/other-1/bin/tool',
+            })
+
+    def test_unfold(self):
+        with temp_dir() as d:
+            self.create_package(d, 'other-1', 'share/other/data')
+            self.create_package(d, 'tool-1', 'share/tool/data')
+            os.symlink('stow/other-1/share', osp.join(d, 'share'))
+            farm = SymlinkFarm(d, osp.join(d, 'stow'))
+            farm.switch('tool-1')
+            self.assertEqual(self.links(d), {
+                'share/other': '../stow/other-1/share/other',
+                'share/tool/data': '../../stow/tool-1/share/tool/data',
+            })
+
+    def test_installer(self):
+        with temp_dir() as d:
+            installer = StowInstaller(FakeProvider(), FakeRelease(), {
+                'path': d,
+                'engine': 'native',
+            })
+            for version in ['1.0', '1.1']:
+                with temp_dir(dir=installer.staging_dir()) as fetched:
+                    touch(osp.join(fetched, 'bin', 'tool-' + version))
+                    inode = os.stat(fetched).st_ino
+                    path = installer.install(fetched, version)
+                self.assertEqual(path, osp.join(d, 'stow', 'tool-' + version))
+                # staged release is moved, not copied
+                self.assertEqual(os.stat(path).st_ino, inode)
+                self.assertEqual(os.listdir(osp.join(d, 'bin')),
+                                 ['tool-' + version])
+            self.assertEqual(installer.installed_version(), '1.1')
+            manifest = installer.manifest
+            self.assertEqual(manifest.active, '1.1')
+            self.assertEqual(sorted(manifest.versions()), ['1.0', '1.1'])
+            self.assertEqual(manifest.files('1.1').keys(), ['bin/tool-1.1'])
+            self.assertEqual(installer.rollback(), '1.0')
+            self.assertEqual(os.listdir(osp.join(d, 'bin')), ['tool-1.0'])
+            self.assertEqual(manifest.active, '1.0')
+            with self.assertRaises(Exception):
+                StowInstaller(FakeProvider(), FakeRelease(), {
+                    'path': d,
+                    'engine': 'unknown',
+                })
+
+    def test_activate_version(self):
+        plans = []
+
+        class RecordingFarm(SymlinkFarm):
+            def plan(self, package, previous=()):
+                plans.append(sorted(previous))
+                return super(RecordingFarm, self).plan(package, previous)
+
+        with temp_dir() as d:
+            stow.SymlinkFarm = RecordingFarm
+            try:
+                installer = StowInstaller(FakeProvider(), FakeRelease(), {
+                    'path': d,
+                    'engine': 'native',
+                })
+                for version in ['1.0', '1.1', '1.2']:
+                    with temp_dir(dir=installer.staging_dir()) as fetched:
+                        touch(osp.join(fetched, 'bin', 'tool-' + version))
+                        installer.install(fetched, version)
+                # only the active version is unstowed
+                self.assertEqual(plans, [[], ['tool-1.0'], ['tool-1.1']])
+                with installer.manifest.transaction() as data:
+                    data['active'] = None
+                del plans[:]
+                installer.activate_version('1.0')
+                self.assertEqual(plans, [['tool-1.1', 'tool-1.2']])
+                self.assertEqual(os.listdir(osp.join(d, 'bin')),
+                                 ['tool-1.0'])
+            finally:
+                stow.SymlinkFarm = SymlinkFarm
+
+    def test_legacy_versions(self):
+        with temp_dir() as d:
+            for name in ['tool-1.0', 'tool-v1.2', 'tool-linux-1.3',
+                         'tool-bar-2.0', 'tool']:
+                touch(osp.join(d, 'stow', name, 'bin', name))
+            # sibling package already migrated
+            touch(osp.join(d, 'stow', '.manifests', 'tool-bar.json'))
+            installer = StowInstaller(FakeProvider(), FakeRelease(), {
+                'path': d,
+            })
+            self.assertEqual(sorted(installer.get_local_versions()),
+                             ['1.0', 'linux-1.3', 'v1.2'])
+            self.assertTrue(installer.manifest.exists())
+            self.assertEqual(installer.manifest.files('1.0').keys(),
+                             ['bin/tool-1.0'])
+            # manifest is used from now on
+            os.rename(osp.join(d, 'stow', 'tool-1.0'),
+                      osp.join(d, 'stow', 'tool-0.9'))
+            self.assertEqual(installer.installed_version(), 'v1.2')
+            installer = StowInstaller(FakeProvider(), FakeRelease(), {
+                'path': osp.join(d, 'missing'),
+            })
+            self.assertEqual(installer.get_local_versions(), [])
+            self.assertFalse(installer.manifest.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,5 @@
+import errno
+import hashlib
 import os
 import os.path as osp
 import tempfile
@@ -6,12 +8,16 @@ import unittest
 import requests
 
 from easy_upgrade.toolbox import (
-    download_http_url,
+    download_file,
+    file_sha256,
     find_executable,
+    move_tree,
     pushd,
     temp_dir,
 )
 
+from httpd import StandInServer
+
 
 class ToolboxTest(unittest.TestCase):
     def test_pushd(self):
@@ -33,28 +39,107 @@ class ToolboxTest(unittest.TestCase):
             raise_if_missing=False
         ))
 
+    def test_find_executable_memoized(self):
+        with temp_dir() as d:
+            path = os.environ['PATH']
+            executable = osp.join(d, 'easy-upgrade-foo')
+            os.environ['PATH'] = d
+            try:
+                self.assertIsNone(find_executable(
+                    'easy-upgrade-foo',
+                    raise_if_missing=False
+                ))
+                # misses are not memoized
+                with open(executable, 'w'):
+                    pass
+                os.chmod(executable, 0755)
+                self.assertEqual(find_executable('easy-upgrade-foo'),
+                                 executable)
+                os.remove(executable)
+                self.assertEqual(find_executable('easy-upgrade-foo'),
+                                 executable)
+                # lookups are performed again when PATH changes
+                os.environ['PATH'] = d + os.pathsep
+                self.assertIsNone(find_executable(
+                    'easy-upgrade-foo',
+                    raise_if_missing=False
+                ))
+            finally:
+                os.environ['PATH'] = path
+
     def test_temp_dir(self):
         with temp_dir() as d:
             self.assertTrue(osp.isdir(d))
         self.assertFalse(osp.isdir(d))
+        with temp_dir() as d:
+            os.rmdir(d)
         with temp_dir(cleanup=False) as d:
             self.assertTrue(osp.isdir(d))
         self.assertTrue(osp.isdir(d))
 
+    def test_move_tree(self):
+        with temp_dir() as d:
+            src = osp.join(d, 'src')
+            os.makedirs(osp.join(src, 'bin'))
+            with open(osp.join(src, 'bin', 'tool'), 'w') as ostr:
+                ostr.write('tool')
+            os.symlink('bin/tool', osp.join(src, 'tool'))
+            inode = os.stat(osp.join(src, 'bin', 'tool')).st_ino
+            self.assertEqual(move_tree(src, osp.join(d, 'dst')), 'rename')
+            self.assertFalse(osp.exists(src))
+
+            def rename(src, dst):
+                raise OSError(errno.EXDEV, 'Invalid cross-device link')
+            os_rename = os.rename
+            os.rename = rename
+            try:
+                self.assertEqual(
+                    move_tree(osp.join(d, 'dst'), osp.join(d, 'dst2')),
+                    'clone'
+                )
+            finally:
+                os.rename = os_rename
+            self.assertFalse(osp.exists(osp.join(d, 'dst')))
+            dst = osp.join(d, 'dst2')
+            self.assertEqual(os.readlink(osp.join(dst, 'tool')), 'bin/tool')
+            self.assertEqual(os.stat(osp.join(dst, 'bin', 'tool')).st_ino,
+                             inode)
+
     def test_file_download(self):
-        url = 'http://ovh.net/files/md5sum.txt'
+        content = 'md5sum.txt content\n' * 10000
+        sha256 = hashlib.sha256(content).hexdigest()
         session = requests.Session()
-        with temp_dir() as d:
-            file_path, content_type = download_http_url(
-                url,
+        with temp_dir() as d, StandInServer() as server:
+            server.route('/md5sum.txt', content,
+                         headers={'Content-Type': 'text/plain'})
+            file_path = osp.join(d, 'foo.txt')
+            content_type, digest = download_file(
                 session,
-                d,
-                filename='foo.txt')
-            self.assertIsNotNone(file_path)
-            self.assertEqual(osp.abspath(file_path), file_path)
-            self.assertIsNotNone(content_type)
+                server.url('/md5sum.txt'),
+                file_path,
+                sha256=sha256.upper(),
+                chunk_size=4096
+            )
             self.assertEquals(content_type, 'text/plain')
-            self.assertTrue(osp.isfile(file_path))
+            self.assertEqual(digest, sha256)
+            self.assertEqual(file_sha256(file_path), sha256)
+            with open(file_path) as istr:
+                self.assertEqual(istr.read(), content)
+            headers = server.requests[0][2]
+            self.assertEqual(headers['accept-encoding'], 'identity')
+
+    def test_file_download_checksum_mismatch(self):
+        session = requests.Session()
+        with temp_dir() as d, StandInServer() as server:
+            server.route('/foo.txt', 'foo')
+            file_path = osp.join(d, 'foo.txt')
+            with self.assertRaises(Exception) as cm:
+                download_file(session, server.url('/foo.txt'), file_path,
+                              sha256='0' * 64)
+            self.assertIn('SHA-256 mismatch', cm.exception.message)
+            self.assertFalse(osp.exists(file_path))
+            with self.assertRaises(requests.HTTPError):
+                download_file(session, server.url('/bar.txt'), file_path)
 
 
 if __name__ == '__main__':
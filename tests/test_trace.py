@@ -0,0 +1,84 @@
+import json
+import os.path as osp
+import threading
+import unittest
+
+from easy_upgrade import trace
+from easy_upgrade.toolbox import temp_dir
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        self.now += 0.5
+        return self.now
+
+
+class FakeResponse(object):
+    def __init__(self, length):
+        self.headers = {'Content-Length': length}
+
+
+class TraceTest(unittest.TestCase):
+    def tearDown(self):
+        trace.disable()
+
+    def test_disabled(self):
+        self.assertIsNone(trace.disable())
+        with trace.span('noop'):
+            trace.annotate(key='value')
+            trace.add('http_requests')
+        trace.count_response(FakeResponse('42'))
+
+    def test_spans(self):
+        tracer = trace.enable(clock=FakeClock())
+        with trace.span('outer', 'release', release='org/tool'):
+            with trace.span('inner', 'http'):
+                trace.count_response(FakeResponse('42'))
+                trace.count_response(FakeResponse(None))
+            trace.annotate(version='1.0')
+        with self.assertRaises(ValueError):
+            with trace.span('failure'):
+                raise ValueError('boom')
+
+        def worker():
+            with trace.span('worker'):
+                trace.add('http_bytes', 8)
+        thread = threading.Thread(target=worker, name='worker-thread')
+        thread.start()
+        thread.join()
+        self.assertIs(trace.disable(), tracer)
+        with temp_dir() as d:
+            path = osp.join(d, 'trace.json')
+            tracer.dump(path)
+            with open(path) as istr:
+                data = json.load(istr)
+        self.assertEqual(data['otherData'], {
+            'http_requests': 2,
+            'http_bytes': 50,
+        })
+        events = data['traceEvents']
+        thread_names = set(e['args']['name'] for e in events
+                           if e['ph'] == 'M')
+        self.assertEqual(thread_names, set(['MainThread', 'worker-thread']))
+        spans = dict((e['name'], e) for e in events if e['ph'] == 'X')
+        self.assertEqual(spans['outer']['ts'], 500000)
+        self.assertEqual(spans['outer']['dur'], 1500000)
+        self.assertEqual(spans['outer']['cat'], 'release')
+        self.assertEqual(spans['outer']['args'], {
+            'release': 'org/tool',
+            'version': '1.0',
+        })
+        self.assertEqual(spans['inner']['args'], {
+            'http_requests': 2,
+            'http_bytes': 42,
+        })
+        self.assertEqual(spans['failure']['args'], {'error': 'boom'})
+        self.assertEqual(spans['worker']['args'], {'http_bytes': 8})
+        self.assertNotEqual(spans['worker']['tid'], spans['outer']['tid'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+from easy_upgrade.api import parse_version
+from easy_upgrade.version import get_scheme, max_version
+
+
+class VersionTest(unittest.TestCase):
+    def assertOrdered(self, scheme, *versions):
+        scheme = get_scheme(scheme)
+        for lower, greater in zip(versions, versions[1:]):
+            self.assertLess(
+                scheme.key(lower), scheme.key(greater),
+                "{} < {}".format(lower, greater)
+            )
+
+    def test_loose(self):
+        self.assertOrdered(
+            'loose',
+            '0.9', '1.0.dev1', '1.0a1', '1.0b2', '1.0rc1', '1.0',
+            '1.0.post1', '1.0.1', 'v1.1', '1.10', '2015.07'
+        )
+        self.assertEqual(parse_version('v1.0'), parse_version('1.0.0'))
+        self.assertEqual(parse_version('1.0-RC1'), parse_version('1.0rc1'))
+        self.assertIsNone(parse_version(None))
+
+    def test_semver(self):
+        self.assertOrdered(
+            'semver',
+            '1.0.0-alpha', '1.0.0-alpha.1', '1.0.0-alpha.beta',
+            '1.0.0-beta', '1.0.0-beta.2', '1.0.0-beta.11',
+            '1.0.0-rc.1', '1.0.0', 'v1.0.1', 'Release 1.10.0',
+        )
+        scheme = get_scheme('semver')
+        self.assertEqual(scheme.key('1.0.0+build.5'), scheme.key('1.0.0'))
+        self.assertIsNone(scheme.key('1.0'))
+
+    def test_calver(self):
+        self.assertOrdered(
+            'calver',
+            '15.07', '2015.07.1-beta', '2015.07.1', '2015.7.2', '2016.01'
+        )
+        self.assertEqual(
+            get_scheme('calver').key('2015.07'),
+            get_scheme('calver').key('2015.7')
+        )
+
+    def test_regex(self):
+        scheme = get_scheme('regex', regex=r'docker-(\d+\.\d+\.\d+)')
+        self.assertLess(
+            scheme.key('docker-1.9.1-linux'),
+            scheme.key('docker-1.10.0-linux')
+        )
+        self.assertEqual(
+            scheme.key('docker-1.10.0-linux'),
+            parse_version('1.10.0')
+        )
+        scheme = get_scheme('regex', regex=r'build (?P<version>\d+)')
+        self.assertEqual(scheme.key('nightly build 42'), parse_version('42'))
+        self.assertIsNone(scheme.key('nightly'))
+        with self.assertRaises(Exception):
+            get_scheme('regex')
+        with self.assertRaises(Exception):
+            get_scheme('unknown')
+
+    def test_memoized(self):
+        scheme = get_scheme('loose')
+        self.assertIs(scheme, get_scheme('loose'))
+        self.assertIs(scheme.key('1.2.3'), scheme.key('1.2.3'))
+
+    def test_max(self):
+        versions = ['1.{}.{}'.format(i, j) for i in range(50)
+                    for j in range(50)]
+        self.assertEqual(max_version(reversed(versions)), '1.49.49')
+        self.assertIsNone(max_version([]))
+        self.assertEqual(
+            get_scheme('semver').sort(['1.0.0', '1.0.0-rc.1', '0.9.0']),
+            ['0.9.0', '1.0.0-rc.1', '1.0.0']
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
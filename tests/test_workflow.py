@@ -1,3 +1,4 @@
+import copy
 import os.path as osp
 import shutil
 import unittest
@@ -98,13 +99,68 @@ class TestSimpleWorflow(unittest.TestCase):
         self.assertEqual(pi3.name, 'post-installer2')
         self.assertEqual(pi3.get('key7'), 'value7')
 
+    def test_lazy_releases(self):
+        global_config = EasyUpgrade.load_yaml(self.YML_CONFIG_PATH)
+        releases = global_config['simple-provider']['releases']
+        releases['cogniteev/broken'] = {
+            'fetch': {'unknown-fetcher': {}},
+            'install': {'install1': {}},
+        }
+        provider = SimpleProvider(global_config)
+        self.assertEqual(provider.releases.releases, {})
+        release = provider.releases['cogniteev/docido']
+        release.post_installers[2].ut = self
+        [result] = provider.install('cogniteev/docido')
+        self.assertTrue(result.installed)
+        self.assertEqual(provider.releases.releases.keys(),
+                         ['cogniteev/docido'])
+        self.assertIs(provider.releases['cogniteev/docido'], release)
+        self.assertFalse(hasattr(release, '__dict__'))
+        broken = provider.releases['cogniteev/broken']
+        with self.assertRaises(Exception):
+            broken.fetcher
+
     def test_installation(self):
         global_config = EasyUpgrade.load_yaml(self.YML_CONFIG_PATH)
         provider = SimpleProvider(global_config)
         release = provider.releases.values()[0]
         release.post_installers[2].ut = self
-        self.assertTrue(provider.install('cogniteev/docido'))
-        self.assertFalse(provider.install('cogniteev/docido'))
+        [result] = provider.install('cogniteev/docido')
+        self.assertEqual(result.status, 'installed')
+        self.assertEqual(result.version, '1.0.3')
+        self.assertEqual(str(result),
+                         'simple-provider:cogniteev/docido: installed 1.0.3')
+        [result] = provider.install('cogniteev/docido')
+        self.assertEqual(result.status, 'up-to-date')
+        self.assertFalse(result.installed)
+        with self.assertRaises(Exception):
+            provider.install('cogniteev/unknown')
+
+    def test_unknown_release(self):
+        eu = EasyUpgrade(EasyUpgrade.load_yaml(self.YML_CONFIG_PATH))
+        eu.providers['simple-provider'] = SimpleProvider(eu.config)
+        for release in [('simple-provider', 'cogniteev/unknown'),
+                        ('unknown-provider', 'cogniteev/docido')]:
+            with self.assertRaises(Exception) as exc:
+                eu.install(('simple-provider', 'cogniteev/docido'), release)
+            self.assertEqual(str(exc.exception),
+                             'Unknown release: {}:{}'.format(*release))
+
+    def test_concurrent_packages_version(self):
+        global_config = EasyUpgrade.load_yaml(self.YML_CONFIG_PATH)
+        releases = global_config['simple-provider']['releases']
+        release_config = releases['cogniteev/docido']
+        for i in range(20):
+            releases['cogniteev/docido{}'.format(i)] = copy.deepcopy(
+                release_config
+            )
+        eu = EasyUpgrade(global_config)
+        eu.providers['simple-provider'] = SimpleProvider(global_config)
+        serial = list(eu.get_packages_version())
+        self.assertEqual(len(serial), 21)
+        eu.config['jobs'] = 4
+        self.assertEqual(eu.jobs, 4)
+        self.assertEqual(list(eu.get_packages_version()), serial)
 
 if __name__ == '__main__':
     unittest.main()